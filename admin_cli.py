@@ -0,0 +1,195 @@
+"""Администрирование пользователей из командной строки, без PySide6 и дисплея.
+
+    python main.py admin block ivanov petrov
+    python main.py admin unblock --file logins.txt
+    cut -d, -f1 staff.csv | python main.py admin reset-password
+    python main.py admin add --file staff.xlsx --position персонал
+    python main.py admin migrate
+
+Логины берутся из аргументов, из --file (по одному в строке, "-" — stdin)
+или из stdin, если он перенаправлен. Все операции идут через одно соединение
+пачками по --batch-size логинов: одна пачка — один запрос и одна транзакция.
+Результат — строки JSON в stdout: по строке на логин (или на отклонённую
+строку файла при add) и итоговая строка с "summary". Миграции схемы
+применяет только migrate (шаг развёртывания, нужны права на DDL).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+import db
+from audit import audit_log
+from schema import ensure_schema
+from user_admin import DEFAULT_PASSWORD, reset_passwords, set_block
+
+ADMIN_BATCH_SIZE = 500
+ADMIN_CONNECT_TIMEOUT = 10
+
+
+def read_targets(logins, path, stdin=None):
+    """Логины без повторов, в порядке появления; пустые строки и комментарии (#) пропускаются."""
+    stdin = stdin or sys.stdin
+    if path == "-":
+        lines = stdin
+    elif path:
+        with open(path, encoding="utf-8-sig") as f:
+            lines = f.readlines()
+    elif not logins and not stdin.isatty():
+        lines = stdin
+    else:
+        lines = []
+    targets = dict.fromkeys(logins)
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            targets[line] = None
+    return list(targets)
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _emit(out, **fields):
+    out.write(json.dumps(fields, ensure_ascii=False, default=str) + "\n")
+
+
+def _apply_batches(connection, targets, batch_size, apply, out):
+    """Применяет apply(connection, пачка) -> (найденные, изменено) к targets пачками.
+
+    Ошибка пачки откатывает только её; остальные пачки выполняются.
+    """
+    counts = {"targets": len(targets), "found": 0, "not_found": 0, "changed": 0, "errors": 0}
+    for batch in _batches(targets, batch_size):
+        try:
+            found, changed = apply(connection, batch)
+        except psycopg2.Error as e:
+            connection.rollback()
+            counts["errors"] += len(batch)
+            for login in batch:
+                _emit(out, login=login, status="error", error=str(e).strip())
+            continue
+        found = set(found)
+        counts["found"] += len(found)
+        counts["not_found"] += len(batch) - len(found)
+        counts["changed"] += changed
+        for login in batch:
+            _emit(out, login=login, status="ok" if login in found else "not_found")
+    return counts
+
+
+def run_set_block(connection, args, out, block):
+    targets = read_targets(args.logins, args.file)
+    event = "bulk_blocked" if block else "bulk_unblocked"
+
+    def apply(connection, batch):
+        found, changed = set_block(connection, block, logins=batch)
+        audit_log.record(event, logins=found, changed=changed, source="cli")
+        return found, changed
+
+    return _apply_batches(connection, targets, args.batch_size, apply, out)
+
+
+def run_reset_password(connection, args, out):
+    from passwords import hash_password
+
+    targets = read_targets(args.logins, args.file)
+    # Пароль один на всех: хэшируется один раз, а не на каждый логин
+    password_hash = hash_password(DEFAULT_PASSWORD) if targets else None
+
+    def apply(connection, batch):
+        found = reset_passwords(connection, batch, password_hash)
+        audit_log.record("passwords_reset", logins=found, source="cli")
+        return found, len(found)
+
+    return _apply_batches(connection, targets, args.batch_size, apply, out)
+
+
+def run_add(connection, args, out):
+    from bulk_import import import_users, read_rows
+    from refcache import reference_cache
+
+    position_id = None
+    if args.position:
+        positions = reference_cache.load("position", connection)
+        if args.position.isdigit() and int(args.position) in positions:
+            position_id = int(args.position)
+        else:
+            position_id = next((key for key, row in positions.items()
+                                if row[1].lower() == args.position.lower()), None)
+        if position_id is None:
+            raise ValueError(f"Неизвестная должность: {args.position}")
+    report = import_users(connection, read_rows(args.file), DEFAULT_PASSWORD, position_id)
+    audit_log.record("users_imported", file="stdin" if args.file == "-" else os.path.basename(args.file),
+                     position_id=position_id, total=report.total, inserted=report.inserted,
+                     rejected=report.rejected, source="cli")
+    for issue in report.issues:
+        _emit(out, row=issue.row_no, status="rejected", field=issue.field, error=issue.message)
+    return {"rows": report.total, "inserted": report.inserted, "rejected": report.rejected,
+            "errors": report.rejected}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py admin", description="Администрирование пользователей")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("block", "заблокировать пользователей"),
+                            ("unblock", "разблокировать и сбросить счётчик ошибок входа"),
+                            ("reset-password", "сбросить пароль на пароль по умолчанию")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("logins", nargs="*", help="логины (иначе --file или stdin)")
+        command.add_argument("--file", help='файл с логинами по одному в строке, "-" — stdin')
+        command.add_argument("--batch-size", type=int, default=ADMIN_BATCH_SIZE)
+    commands.add_parser("migrate", help="применить миграции схемы и построить индексы")
+    command = commands.add_parser("add", help="добавить пользователей из CSV или XLSX")
+    command.add_argument("--file", required=True, help='файл CSV/XLSX, "-" — CSV из stdin')
+    command.add_argument("--position", help="должность по умолчанию: id или название")
+    return parser
+
+
+def main(argv=None, out=None):
+    """Точка входа "python main.py admin ...". Возвращает код завершения процесса.
+
+    0 — все логины найдены и обработаны, 1 — есть ненайденные, отклонённые
+    или ошибочные, 2 — неверные аргументы или нет связи с БД.
+    """
+    out = out or sys.stdout
+    args = build_parser().parse_args(argv)
+    if getattr(args, "batch_size", 1) < 1:
+        print("--batch-size должен быть положительным", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    try:
+        connection = psycopg2.connect(**dict(db.DB_PARAMS, connect_timeout=ADMIN_CONNECT_TIMEOUT))
+    except psycopg2.Error as e:
+        print(f"Ошибка подключения к БД: {e}", file=sys.stderr)
+        return 2
+    try:
+        if args.command == "migrate":
+            ensure_schema(connection)
+            counts = {"errors": 0}
+        elif args.command == "add":
+            counts = run_add(connection, args, out)
+        elif args.command == "reset-password":
+            counts = run_reset_password(connection, args, out)
+        else:
+            counts = run_set_block(connection, args, out, args.command == "block")
+    except (ValueError, OSError, RuntimeError, psycopg2.Error) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    finally:
+        # Журнал пишется через это же соединение (незавершённая транзакция откатывается);
+        # без связи события уходят в файл
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            pass
+        audit_log.close(connection=connection)
+        connection.close()
+        db.close_pool()
+    _emit(out, summary=True, command=args.command, elapsed=round(time.perf_counter() - started, 3), **counts)
+    return 1 if counts["errors"] or counts.get("not_found") else 0
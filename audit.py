@@ -0,0 +1,213 @@
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+from psycopg2.extras import Json, execute_values
+
+from db import db_connection
+from instrumentation import tagged
+
+AUDIT_SPILL_PATH = os.environ.get(
+    "HOTEL_AUDIT_SPILL", os.path.join(os.path.expanduser("~"), ".hotel", "audit_spill.jsonl"))
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL = 2
+AUDIT_CONNECT_TIMEOUT = 5
+# Забранный на отправку файл старше этого брошен упавшим процессом и забирается снова
+AUDIT_STALE_CLAIM = 600
+
+AUDIT_INSERT = """
+    INSERT INTO audit_log (event_uuid, occurred_at, event_type, actor_id, user_login, client_host, details)
+    VALUES %s
+    ON CONFLICT (event_uuid) DO NOTHING
+"""
+
+audit_logger = logging.getLogger("hotel.audit")
+
+
+class AuditLog:
+    """Журнал событий входа и администрирования, не задерживающий интерфейс.
+
+    record() только кладёт событие в буфер; фоновый поток пишет буфер пачками —
+    при накоплении AUDIT_BATCH_SIZE событий или раз в AUDIT_FLUSH_INTERVAL секунд.
+    Без связи с БД события дописываются в файл spill_path и отправляются, когда
+    связь восстановится; повторная отправка не дублирует записи (event_uuid).
+    Файл общий для всех процессов пользователя (приложение и main.py admin):
+    перед отправкой он забирается переименованием, и удаляется только забранное.
+    """
+
+    def __init__(self, spill_path=AUDIT_SPILL_PATH, batch_size=AUDIT_BATCH_SIZE,
+                 interval=AUDIT_FLUSH_INTERVAL):
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.actor_id = None
+        self.host = socket.gethostname()
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def set_actor(self, user_id):
+        """Пользователь, от имени которого записываются следующие события."""
+        self.actor_id = user_id
+
+    def record(self, event_type, user_login=None, **details):
+        """Добавляет событие в буфер; никогда не обращается к БД и не бросает исключений."""
+        event = (uuid.uuid4().hex, datetime.now(timezone.utc).isoformat(), event_type, self.actor_id,
+                 user_login, self.host, details)
+        with self._lock:
+            self._buffer.append(event)
+            pending = len(self._buffer)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="audit-flush", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout=AUDIT_CONNECT_TIMEOUT * 2, connection=None):
+        """Останавливает фоновый поток и записывает оставшиеся события (в БД или в файл)."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush(connection)
+
+    def flush(self, connection=None):
+        """Отправляет буфер и ранее отложенные в файл события. Возвращает число записанных в БД.
+
+        connection — записать через это соединение, а не через соединение пула.
+        """
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._buffer)
+                self._buffer.clear()
+            claimed = self._claim_spill()
+            spilled = [event for path in claimed for event in self._read_spill(path)]
+            if not events and not spilled:
+                self._remove(claimed)
+                return 0
+            try:
+                with tagged("audit_flush"):
+                    if connection is not None:
+                        self._insert(connection, spilled + events)
+                    else:
+                        with db_connection(AUDIT_CONNECT_TIMEOUT) as pooled:
+                            self._insert(pooled, spilled + events)
+            except Exception:
+                # Забранное возвращается в общий файл вместе с новым
+                self._spill(spilled + events)
+                self._remove(claimed)
+                return 0
+            self._remove(claimed)
+            return len(spilled) + len(events)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                # Сбой одной записи не должен останавливать журнал до конца сеанса
+                audit_logger.exception("Ошибка записи журнала аудита")
+
+    def _insert(self, connection, events):
+        with connection.cursor() as cursor:
+            execute_values(cursor, AUDIT_INSERT, [self._row(event) for event in events], page_size=self.batch_size)
+        connection.commit()
+
+    @staticmethod
+    def _row(event):
+        event_uuid, occurred_at, event_type, actor_id, user_login, host, details = event
+        return event_uuid, occurred_at, event_type, actor_id, user_login, host, Json(details)
+
+    def _spill(self, events):
+        if not events:
+            return
+        try:
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as file:
+                for event in events:
+                    file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        except OSError:
+            # Писать некуда: возвращаем события в буфер до следующей попытки
+            with self._lock:
+                self._buffer.extendleft(reversed(events))
+
+    def _claim_spill(self):
+        """Переименовывает файл отложенных событий (и брошенные забранные) в свои; возвращает их пути.
+
+        Другой процесс после этого дописывает уже в новый файл. Файл, который
+        забирает другой процесс, переименовать не удастся — он пропускается.
+        """
+        now = time.time()
+        paths = [self.spill_path]
+        for path in glob.glob(glob.escape(self.spill_path) + ".sending-*"):
+            try:
+                if now - os.path.getmtime(path) >= AUDIT_STALE_CLAIM:
+                    paths.append(path)
+            except OSError:
+                continue
+        claimed = []
+        for path in paths:
+            target = f"{self.spill_path}.sending-{os.getpid()}-{uuid.uuid4().hex}"
+            try:
+                os.replace(path, target)
+            except OSError:
+                continue
+            claimed.append(target)
+            try:
+                # Время изменения отмечает, что файл забран сейчас, а не брошен
+                os.utime(target)
+            except OSError:
+                pass
+        return claimed
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read_spill(path):
+        try:
+            with open(path, encoding="utf-8") as file:
+                lines = file.readlines()
+        except OSError:
+            return []
+        events = []
+        for line in lines:
+            try:
+                events.append(tuple(json.loads(line)))
+            except ValueError:
+                # Строка, оборванная при аварийном завершении
+                continue
+        return events
+
+
+audit_log = AuditLog()
+
+
+def start_audit_log():
+    """Запускает фоновую запись журнала. Возвращает функцию остановки с финальной записью."""
+    audit_log.start()
+    return audit_log.close
@@ -0,0 +1,168 @@
+"""Нагрузочный тест входа: сколько записей в БД дают 10 000 неудачных попыток.
+
+Запуск из корня репозитория:
+
+    python bench/bench_login_throttle.py
+    python bench/bench_login_throttle.py --attempts 10000 --logins 1000 --terminals 4 --rate 50
+
+Попытки с неверным паролем перебирают --logins существующих логинов по кругу
+(подбор по списку учётных записей) с --terminals терминалов с общей частотой
+--rate попыток в секунду. Время модельное: ограничитель получает часы бенчмарка,
+ожидания нет. Сравниваются три режима на одной и той же последовательности:
+
+    every_failure     каждая неудача пишется в БД (pending_failures=None)
+    transitions_only  неудачи копятся в LoginThrottle без ограничения частоты,
+                      в БД пишется только переход к блокировке
+    throttled         LoginThrottle с настройками приложения
+
+Записью считается выполнение login_failed; чтения (login_fetch) считаются отдельно.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import psycopg2
+
+import db
+import repository
+from db import autocommit, db_connection
+from instrumentation import metrics, tagged
+from pg_fixture import LocalPostgres
+from schema import ensure_schema
+from seed import BENCH_PASSWORD, create_database, seed
+from throttle import LoginThrottle
+
+DBNAME = "Hotel"
+MAX_FAILED_ATTEMPTS = 3
+LOGIN_BLOCK_PERIOD_DAYS = 30
+UNLIMITED = 10 ** 9
+
+
+class ModelClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def statement_count(prefix):
+    return sum(q["count"] for q in metrics.snapshot()["queries"] if q["statement"].startswith(prefix))
+
+
+def reset_users(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE Users SET block = 0, failed_attempts = 0 WHERE block = 1 OR failed_attempts <> 0")
+    connection.commit()
+
+
+def blocked_users(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM Users WHERE block = 1")
+        return cursor.fetchone()[0]
+
+
+def run_scenario(connection, mode, args):
+    clock = ModelClock()
+    throttles = []
+    for _ in range(args.terminals):
+        if mode == "throttled":
+            throttles.append(LoginThrottle(clock=clock))
+        elif mode == "transitions_only":
+            throttles.append(LoginThrottle(login_burst=UNLIMITED, terminal_burst=UNLIMITED,
+                                           backoff_base=0, clock=clock))
+    metrics.reset()
+    rejected = 0
+    statuses = {}
+    started = time.perf_counter()
+    with tagged("bench_login_throttle"), autocommit(connection):
+        for attempt in range(args.attempts):
+            clock.now = attempt / args.rate
+            login = f"user{attempt % args.logins + 1}"
+            # Каждый проход по списку — со следующего терминала: счётчики терминалов не суммируются
+            throttle = throttles[attempt // args.logins % args.terminals] if throttles else None
+            pending = None
+            if throttle is not None:
+                if throttle.acquire(login):
+                    rejected += 1
+                    continue
+                pending = throttle.pending(login)
+            result = repository.login(connection, login, "wrong-" + BENCH_PASSWORD, MAX_FAILED_ATTEMPTS,
+                                      LOGIN_BLOCK_PERIOD_DAYS, "1234", pending)
+            if throttle is not None:
+                throttle.record(login, result.status)
+            statuses[result.status] = statuses.get(result.status, 0) + 1
+    elapsed = time.perf_counter() - started
+    writes = statement_count("EXECUTE login_failed")
+    return {
+        "attempts": args.attempts,
+        "rejected_before_db": rejected,
+        "reached_db": statement_count("EXECUTE login_fetch"),
+        "db_writes": writes,
+        "db_writes_per_10k": round(writes * 10000 / args.attempts, 1),
+        "statuses": statuses,
+        "blocked_users": blocked_users(connection),
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def run(args):
+    with LocalPostgres(args.pg_bin, args.locale) as server:
+        create_database(server.params(), DBNAME)
+        params = server.params(DBNAME)
+        connection = psycopg2.connect(**params)
+        try:
+            seed(connection, args.logins, schedule_rows=0)
+        finally:
+            connection.close()
+        db.DB_PARAMS.clear()
+        db.DB_PARAMS.update(params)
+        # Реплики из ~/.hotel/db.ini или HOTEL_DB_REPLICAS — другие базы: чтение тоже идёт во временную
+        db.REPLICA_PARAMS.clear()
+
+        results = {}
+        with db_connection() as connection:
+            ensure_schema(connection)
+            for mode in ("every_failure", "transitions_only", "throttled"):
+                reset_users(connection)
+                results[mode] = run_scenario(connection, mode, args)
+        db.close_pool()
+    return {
+        "meta": {
+            "attempts": args.attempts,
+            "logins": args.logins,
+            "terminals": args.terminals,
+            "rate_per_second": args.rate,
+            "max_failed_attempts": MAX_FAILED_ATTEMPTS,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Записи в БД при неудачных попытках входа")
+    parser.add_argument("--attempts", type=int, default=10000)
+    parser.add_argument("--logins", type=int, default=1000, help="сколько учётных записей перебирается")
+    parser.add_argument("--terminals", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=50, help="попыток в секунду со всех терминалов")
+    parser.add_argument("--output", help="файл результатов JSON")
+    parser.add_argument("--pg-bin", help="каталог с initdb и pg_ctl")
+    parser.add_argument("--locale", default="C.UTF-8", help="локаль временного кластера")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Замеры хэширования паролей: калибровка, задержка и пропускная способность проверки.
+
+Запуск из корня репозитория (база не нужна):
+
+    python bench/bench_passwords.py
+    python bench/bench_passwords.py --target-ms 250 --threads 1 2 4 8 --duration 5
+
+Проверка идёт в потоках так же, как при входе в приложение; одновременных
+вычислений не больше passwords.HASH_CONCURRENCY, поэтому пропускная способность
+перестаёт расти на этом числе потоков.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+
+def summary_ms(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summary_ms(samples)
+
+
+def throughput(stored, threads, duration):
+    """Проверок в секунду при threads потоках, проверяющих без пауз duration секунд."""
+    deadline = time.perf_counter() + duration
+    counts = [0] * threads
+
+    def worker(index):
+        while time.perf_counter() < deadline:
+            passwords.verify_password("bench-password", stored)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return round(sum(counts) / (time.perf_counter() - started), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки хэширования паролей")
+    parser.add_argument("--target-ms", type=float, help="цель калибровки (по умолчанию HOTEL_HASH_TARGET_MS)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--output", help="файл результатов в JSON")
+    args = parser.parse_args()
+    if args.target_ms is not None:
+        os.environ["HOTEL_HASH_TARGET_MS"] = str(args.target_ms)
+    global passwords
+    import passwords
+
+    started = time.perf_counter()
+    n, r, p = passwords.current_params()
+    calibration_s = time.perf_counter() - started
+    stored = passwords.hash_password("bench-password")
+    legacy = "bench-password"
+
+    results = {
+        "params": {"n": n, "r": r, "p": p, "target_ms": passwords.HASH_TARGET_MS,
+                   "memory_mb": round(128 * r * n / 2 ** 20, 1),
+                   "concurrency": passwords.HASH_CONCURRENCY, "cpu_count": os.cpu_count()},
+        "calibration_s": round(calibration_s, 3),
+        "hash": timed(lambda: passwords.hash_password("bench-password"), args.repeat),
+        "verify": timed(lambda: passwords.verify_password("bench-password", stored), args.repeat),
+        "verify_wrong": timed(lambda: passwords.verify_password("wrong-password", stored), args.repeat),
+        "verify_legacy_plaintext": timed(lambda: passwords.verify_password("bench-password", legacy), args.repeat),
+        "verify_per_second": {str(threads): throughput(stored, threads, args.duration) for threads in args.threads},
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+
+def find_pg_bin(pg_bin=None):
+    """Каталог с initdb/pg_ctl: аргумент, PG_BIN, PATH или стандартные пути Debian/Ubuntu."""
+    candidates = [pg_bin, os.environ.get("PG_BIN")]
+    pg_ctl = shutil.which("pg_ctl")
+    if pg_ctl:
+        candidates.append(os.path.dirname(pg_ctl))
+    candidates.extend(sorted(glob.glob("/usr/lib/postgresql/*/bin"), reverse=True))
+    for path in candidates:
+        if path and os.path.exists(os.path.join(path, "pg_ctl")):
+            return path
+    raise RuntimeError("Не найдены initdb/pg_ctl: укажите --pg-bin или переменную PG_BIN")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalPostgres:
+    """Временный кластер PostgreSQL для бенчмарков; удаляется при остановке.
+
+    Доступен только через unix-сокет во временном каталоге, аутентификация trust.
+    """
+
+    def __init__(self, pg_bin=None, locale="C.UTF-8"):
+        self.pg_bin = find_pg_bin(pg_bin)
+        self.locale = locale
+        self.port = _free_port()
+        self.base_dir = None
+
+    @property
+    def data_dir(self):
+        return os.path.join(self.base_dir, "data")
+
+    def _run(self, program, *args):
+        subprocess.run([os.path.join(self.pg_bin, program), *args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def start(self):
+        self.base_dir = tempfile.mkdtemp(prefix="hotel-bench-pg-")
+        try:
+            # Кириллица в LOWER() требует UTF-8 локали, иначе фильтр по должности не сработает
+            self._run("initdb", "-D", self.data_dir, "-U", "postgres", "-A", "trust",
+                      "-E", "UTF8", f"--locale={self.locale}")
+            options = f"-p {self.port} -k {self.base_dir} -c listen_addresses=''"
+            self._run("pg_ctl", "-D", self.data_dir, "-o", options, "-l",
+                      os.path.join(self.base_dir, "postgres.log"), "-w", "start")
+        except Exception:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+            self.base_dir = None
+            raise
+        return self
+
+    def stop(self):
+        if self.base_dir is None:
+            return
+        try:
+            self._run("pg_ctl", "-D", self.data_dir, "-m", "immediate", "-w", "stop")
+        finally:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+            self.base_dir = None
+
+    def params(self, dbname="postgres"):
+        return {
+            "dbname": dbname,
+            "user": "postgres",
+            "host": self.base_dir,
+            "port": str(self.port),
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
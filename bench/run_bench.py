@@ -0,0 +1,373 @@
+"""Сквозные замеры интерфейса на временной базе PostgreSQL.
+
+Запуск из корня репозитория:
+
+    python bench/run_bench.py --scale 100k
+    python bench/run_bench.py --scale 100k --save-baseline
+    python bench/run_bench.py --scale 100k --baseline bench/baseline-100k.json
+
+Qt работает на платформе offscreen, база создаётся initdb во временном каталоге
+и удаляется после прогона. Результаты пишутся в JSON; при --baseline каждая
+метрика сравнивается с эталоном, и при регрессии больше --tolerance код выхода 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+# Локальная копия данных не должна переживать прогон
+os.environ.setdefault("HOTEL_LOCAL_CACHE", os.path.join(tempfile.mkdtemp(prefix="hotel-bench-"), "cache.sqlite3"))
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import psycopg2
+from PySide6 import __version__ as pyside_version
+from PySide6.QtCore import QEventLoop, QObject, QTimer, Signal
+from PySide6.QtWidgets import QApplication, QTableView
+
+import db
+from instrumentation import metrics
+from pg_fixture import LocalPostgres
+from schema import ensure_schema
+from seed import BENCH_PASSWORD, SCALES, create_database, seed
+
+DBNAME = "Hotel"
+WAIT_TIMEOUT = 120
+# Подстрока фамилии, email, телефона и короткий префикс имени
+SEARCH_TERMS = ("фамилия123", "user4567@", "70000012", "им")
+
+
+class _Probe(QObject):
+    fired = Signal()
+
+
+def wait_for(signal, timeout=WAIT_TIMEOUT):
+    """Крутит цикл событий до испускания signal."""
+    loop = QEventLoop()
+    received = []
+
+    def done(*args):
+        received.append(args)
+        loop.quit()
+
+    signal.connect(done)
+    QTimer.singleShot(int(timeout * 1000), loop.quit)
+    loop.exec()
+    signal.disconnect(done)
+    if not received:
+        raise TimeoutError(f"Сигнал не пришёл за {timeout} с")
+    return received[0]
+
+
+def settle(app):
+    """Дорисовывает всё, что накопилось в очереди событий."""
+    app.processEvents()
+    app.sendPostedEvents()
+    app.processEvents()
+
+
+def summary_ms(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def query_count():
+    return sum(q["count"] for q in metrics.snapshot()["queries"])
+
+
+def bench_login(app, main, login, repeat):
+    def attempt():
+        window = main.LoginWindow()
+        probe = _Probe()
+        original = window.on_authenticated
+
+        def on_authenticated(*args):
+            original(*args)
+            probe.fired.emit()
+
+        window.on_authenticated = on_authenticated
+        # Замеряем только вход, без открытия главного окна через секунду
+        window.open_next_window = lambda *args: None
+        window.login_input.setText(login)
+        window.password_input.setText(BENCH_PASSWORD)
+        started = time.perf_counter()
+        window.login_button.click()
+        wait_for(probe.fired)
+        settle(app)
+        elapsed = time.perf_counter() - started
+        if window.error_label.text() != "Авторизация успешна":
+            raise RuntimeError(f"Вход {login} не удался: {window.error_label.text()}")
+        window.close()
+        window.deleteLater()
+        return elapsed
+
+    cold = attempt()
+    warm = [attempt() for _ in range(repeat)]
+    return {"login_cold_ms": round(cold * 1000, 3), "login": summary_ms(warm)}
+
+
+def bench_staff_list(app, main, user_id, position_id, repeat):
+    window = main.MainWindow(user_id, position_id, _profile(main, user_id, position_id))
+    window.show()
+    settle(app)
+
+    started = time.perf_counter()
+    window.show_staff_list()
+    wait_for(window.staff_model.first_page_loaded)
+    settle(app)
+    cold = time.perf_counter() - started
+
+    reloads = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        window.staff_model.reload()
+        wait_for(window.staff_model.first_page_loaded)
+        settle(app)
+        reloads.append(time.perf_counter() - started)
+
+    pages = []
+    for _ in range(repeat):
+        if not window.staff_model.canFetchMore():
+            break
+        started = time.perf_counter()
+        window.staff_model.fetchMore()
+        wait_for(window.staff_model.rowsInserted)
+        settle(app)
+        pages.append(time.perf_counter() - started)
+
+    searches = []
+    for _ in range(max(1, repeat // len(SEARCH_TERMS))):
+        for term in SEARCH_TERMS:
+            started = time.perf_counter()
+            window.staff_model.set_search(term)
+            wait_for(window.staff_model.first_page_loaded)
+            settle(app)
+            searches.append(time.perf_counter() - started)
+    window.staff_model.set_search("")
+    wait_for(window.staff_model.first_page_loaded)
+
+    result = {"staff_list_cold_ms": round(cold * 1000, 3), "staff_list_reload": summary_ms(reloads),
+              "staff_search": summary_ms(searches)}
+    if pages:
+        result["staff_list_next_page"] = summary_ms(pages)
+    return window, result
+
+
+def bench_panel_switch(app, window, repeat):
+    """Переключение между уже построенными панелями: время и число запросов к БД."""
+    window.show_manager_panel()
+    settle(app)
+    queries_before = query_count()
+    samples = []
+    for _ in range(repeat):
+        for show in (window.show_staff_list, window.show_manager_panel):
+            started = time.perf_counter()
+            show()
+            settle(app)
+            samples.append(time.perf_counter() - started)
+    return {"panel_switch": summary_ms(samples), "panel_switch_queries": query_count() - queries_before}
+
+
+def bench_schedule(app, main, user_id, position_id, repeat):
+    window = main.MainWindow(user_id, position_id, _profile(main, user_id, position_id))
+    window.show()
+    settle(app)
+
+    started = time.perf_counter()
+    window.show_schedule()
+    model = window.panels["schedule"].findChild(QTableView).model()
+    wait_for(model.page_changed)
+    settle(app)
+    cold = time.perf_counter() - started
+
+    pages = []
+    for _ in range(repeat):
+        # Ждём фоновой подгрузки, чтобы мерить сам переход, а не запрос
+        if model._prefetch is not None:
+            wait_for(model._prefetch.finished)
+            settle(app)
+        if not model.has_next():
+            break
+        started = time.perf_counter()
+        model.next_page()
+        settle(app)
+        pages.append(time.perf_counter() - started)
+
+    window.close()
+    settle(app)
+
+    # Повторное открытие рисуется из локальной копии, не дожидаясь сервера
+    window = main.MainWindow(user_id, position_id, _profile(main, user_id, position_id))
+    window.show()
+    settle(app)
+    started = time.perf_counter()
+    window.show_schedule()
+    settle(app)
+    warm = time.perf_counter() - started
+    model = window.panels["schedule"].findChild(QTableView).model()
+    if not model.rowCount():
+        raise RuntimeError("Расписание не показано из локальной копии")
+    if model._sync_request is not None:
+        wait_for(model._sync_request.finished)
+    window.close()
+
+    result = {"schedule_cold_ms": round(cold * 1000, 3), "schedule_warm_open_ms": round(warm * 1000, 3)}
+    if pages:
+        result["schedule_next_page"] = summary_ms(pages)
+    return result
+
+
+def _profile(main, user_id, position_id):
+    names = {1: "Администратор", 2: "Менеджер", 3: "Пользователь", 4: "Персонал"}
+    return main.UserProfile(user_id, "Бенч", "Бенч", "bench@example.com", position_id, names[position_id])
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results):
+    """{"login": {"p50_ms": 1}} -> {"login.p50_ms": 1}: плоский вид для сравнения."""
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            for key, inner in value.items():
+                flat[f"{name}.{key}"] = inner
+        else:
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """Печатает сравнение с эталоном; возвращает список метрик с регрессией."""
+    current = flatten(results["metrics"])
+    reference = flatten(baseline["metrics"])
+    regressions = []
+    print(f"{'метрика':<32}{'эталон':>12}{'сейчас':>12}{'изм.':>9}")
+    for name in sorted(reference):
+        if name not in current:
+            continue
+        old, new = reference[name], current[name]
+        change = (new - old) / old if old else 0.0
+        mark = ""
+        # Число запросов при переключении панелей должно оставаться нулевым
+        if (old and change > tolerance) or (not old and new > old):
+            regressions.append(name)
+            mark = "  <-- регрессия"
+        print(f"{name:<32}{old:>12}{new:>12}{change:>+9.0%}{mark}")
+    return regressions
+
+
+def run(args):
+    users = SCALES[args.scale]
+    with LocalPostgres(args.pg_bin, args.locale) as server:
+        create_database(server.params(), DBNAME)
+        params = server.params(DBNAME)
+        started = time.perf_counter()
+        connection = psycopg2.connect(**params)
+        try:
+            accounts = seed(connection, users)
+        finally:
+            connection.close()
+        seed_seconds = time.perf_counter() - started
+
+        db.DB_PARAMS.clear()
+        db.DB_PARAMS.update(params)
+        # Реплики из ~/.hotel/db.ini или HOTEL_DB_REPLICAS — другие базы: чтение тоже идёт во временную
+        db.REPLICA_PARAMS.clear()
+        # Вход миграции не применяет: как при развёртывании, до замеров
+        with db.db_connection() as connection:
+            ensure_schema(connection)
+
+        app = QApplication.instance() or QApplication([])
+        import main
+        from throttle import LoginThrottle
+
+        # Вход замеряется подряд десятки раз: ограничение частоты попыток здесь не проверяется
+        main.login_throttle = LoginThrottle(login_burst=10 ** 9, terminal_burst=10 ** 9)
+
+        results = {}
+        results.update(bench_login(app, main, "bench_manager", args.repeat))
+        manager_id, manager_position = accounts["bench_manager"]
+        window, staff_results = bench_staff_list(app, main, manager_id, manager_position, args.repeat)
+        results.update(staff_results)
+        results.update(bench_panel_switch(app, window, args.repeat))
+        window.close()
+        staff_id, staff_position = accounts["bench_staff"]
+        results.update(bench_schedule(app, main, staff_id, staff_position, args.repeat))
+        settle(app)
+        main.get_executor().wait_for_done(WAIT_TIMEOUT * 1000)
+        db.close_pool()
+
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return {
+        "meta": {
+            "scale": args.scale,
+            "users": users,
+            "repeat": args.repeat,
+            "seed_seconds": round(seed_seconds, 1),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "pyside": pyside_version,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки интерфейса на временной базе PostgreSQL")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="файл результатов (по умолчанию bench/results/<scale>-<время>.json)")
+    parser.add_argument("--baseline", help="эталон для сравнения")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="сохранить результат как bench/baseline-<scale>.json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    parser.add_argument("--pg-bin", help="каталог с initdb и pg_ctl")
+    parser.add_argument("--locale", default="C.UTF-8", help="локаль временного кластера")
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", f"{args.scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"Результаты: {output}")
+    if args.save_baseline:
+        baseline_path = os.path.join(BENCH_DIR, f"baseline-{args.scale}.json")
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Эталон: {baseline_path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Регрессии: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import psycopg2
+from psycopg2 import extensions
+
+# Базовые таблицы приложения; ограничения названы так же, как в рабочей базе
+BASE_SCHEMA = """
+    CREATE TABLE Position (
+        position_id serial PRIMARY KEY,
+        position_name varchar(50) NOT NULL
+    );
+
+    CREATE TABLE Users (
+        user_id serial PRIMARY KEY,
+        first_name varchar(50) NOT NULL,
+        last_name varchar(50) NOT NULL,
+        phone varchar(20) NOT NULL CONSTRAINT users_phone_key UNIQUE,
+        email varchar(100) NOT NULL,
+        user_login varchar(50) NOT NULL CONSTRAINT users_login_key UNIQUE,
+        user_password varchar(255) NOT NULL,
+        position_id integer REFERENCES Position (position_id),
+        created_at timestamp,
+        login_date timestamp,
+        block integer DEFAULT 0,
+        failed_attempts integer DEFAULT 0
+    );
+
+    CREATE TABLE StaffSchedule (
+        schedule_id serial PRIMARY KEY,
+        user_id integer NOT NULL REFERENCES Users (user_id) ON DELETE CASCADE,
+        work_date date NOT NULL,
+        shift_start time NOT NULL,
+        shift_end time NOT NULL
+    );
+"""
+
+POSITIONS = ((1, "Администратор"), (2, "Менеджер"), (3, "Пользователь"), (4, "Персонал"))
+STAFF_POSITION_ID = 4
+
+SCALES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+
+BENCH_PASSWORD = "bench-password"
+# Логин -> должность учётных записей, от имени которых идут замеры
+BENCH_ACCOUNTS = {"bench_admin": 1, "bench_manager": 2, "bench_staff": 4}
+BENCH_SCHEDULE_DAYS = 365
+
+
+def create_database(params, dbname):
+    """Пересоздаёт базу dbname на сервере params."""
+    connection = psycopg2.connect(**params)
+    connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+            cursor.execute(f'CREATE DATABASE "{dbname}"')
+    finally:
+        connection.close()
+
+
+def seed(connection, users, schedule_rows=None):
+    """Заполняет базу синтетическими данными: users пользователей и schedule_rows смен.
+
+    60% пользователей — персонал; смены распределяются между ними по дням подряд.
+    Возвращает {логин: (user_id, position_id)} для BENCH_ACCOUNTS.
+    """
+    schedule_rows = users if schedule_rows is None else schedule_rows
+    with connection.cursor() as cursor:
+        cursor.execute(BASE_SCHEMA)
+        cursor.executemany("INSERT INTO Position (position_id, position_name) VALUES (%s, %s)", POSITIONS)
+        cursor.execute("SELECT setval('position_position_id_seq', %s)", (len(POSITIONS),))
+        cursor.execute("""
+            INSERT INTO Users
+                (first_name, last_name, phone, email, user_login, user_password, position_id,
+                 created_at, login_date, block, failed_attempts)
+            SELECT 'Имя' || g, 'Фамилия' || g, (70000000000 + g)::text, 'user' || g || '@example.com',
+                   'user' || g, %s,
+                   CASE WHEN g %% 10 < 6 THEN 4 WHEN g %% 10 < 8 THEN 3 WHEN g %% 10 = 8 THEN 2 ELSE 1 END,
+                   localtimestamp - interval '1 year',
+                   localtimestamp - (g %% 60) * interval '1 day',
+                   0, 0
+            FROM generate_series(1, %s) g
+        """, (BENCH_PASSWORD, users))
+        cursor.execute("""
+            WITH staff AS (
+                SELECT array_agg(user_id ORDER BY user_id) AS ids FROM Users WHERE position_id = %s
+            )
+            INSERT INTO StaffSchedule (user_id, work_date, shift_start, shift_end)
+            SELECT ids[1 + g %% array_length(ids, 1)],
+                   current_date - 180 + g / array_length(ids, 1),
+                   time '08:00', time '20:00'
+            FROM staff, generate_series(0, %s - 1) g
+        """, (STAFF_POSITION_ID, schedule_rows))
+
+        accounts = {}
+        for number, (login, position_id) in enumerate(BENCH_ACCOUNTS.items(), start=1):
+            cursor.execute("""
+                INSERT INTO Users
+                    (first_name, last_name, phone, email, user_login, user_password, position_id,
+                     created_at, login_date, block, failed_attempts)
+                VALUES ('Бенч', %s, %s, %s, %s, %s, %s, localtimestamp, localtimestamp, 0, 0)
+                RETURNING user_id
+            """, (login, str(number), f"{login}@example.com", login, BENCH_PASSWORD, position_id))
+            accounts[login] = (cursor.fetchone()[0], position_id)
+
+        # Год смен по две за день у сотрудника, чьё расписание листаем
+        cursor.execute("""
+            INSERT INTO StaffSchedule (user_id, work_date, shift_start, shift_end)
+            SELECT %s, current_date - %s / 2 + d, s.shift_start, s.shift_end
+            FROM generate_series(0, %s - 1) d,
+                 (VALUES (time '08:00', time '14:00'), (time '14:00', time '20:00')) AS s (shift_start, shift_end)
+        """, (accounts["bench_staff"][0], BENCH_SCHEDULE_DAYS, BENCH_SCHEDULE_DAYS))
+    connection.commit()
+
+    connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with connection.cursor() as cursor:
+        cursor.execute("VACUUM ANALYZE")
+    connection.set_isolation_level(extensions.ISOLATION_LEVEL_READ_COMMITTED)
+    return accounts
@@ -0,0 +1,252 @@
+import csv
+import itertools
+import os
+import sys
+from collections import namedtuple
+
+from passwords import hash_password
+from refcache import reference_cache
+
+USER_FIELDS = ("first_name", "last_name", "phone", "email", "user_login")
+
+HEADER_ALIASES = {
+    "имя": "first_name",
+    "first_name": "first_name",
+    "фамилия": "last_name",
+    "last_name": "last_name",
+    "телефон": "phone",
+    "phone": "phone",
+    "email": "email",
+    "e-mail": "email",
+    "почта": "email",
+    "логин": "user_login",
+    "login": "user_login",
+    "user_login": "user_login",
+    "должность": "position",
+    "position": "position",
+    "position_id": "position",
+}
+
+ImportIssue = namedtuple("ImportIssue", "row_no field message")
+
+
+class ImportReport:
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.issues = []
+
+    @property
+    def rejected(self):
+        return len({issue.row_no for issue in self.issues})
+
+    def summary(self):
+        return (f"Строк в файле: {self.total}, добавлено: {self.inserted}, "
+                f"отклонено: {self.rejected}")
+
+
+def validate_user(first_name, last_name, phone, email, user_login):
+    """Правила формы добавления пользователя. Возвращает текст ошибки или None."""
+    if not (first_name and last_name and phone and email and user_login):
+        return "Все поля обязательны для заполнения"
+    if not phone.isdigit():
+        return "Телефон должен содержать только цифры"
+    return None
+
+
+def read_rows(path):
+    """Построчно читает CSV или XLSX, не загружая файл целиком; "-" — CSV из stdin."""
+    if path == "-":
+        yield from _read_csv_stream(sys.stdin)
+        return
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".xlsx":
+        yield from _read_xlsx(path)
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from _read_csv_stream(f)
+
+
+def _read_csv_stream(f):
+    # Образец для разделителя читается целыми строками: stdin нельзя перемотать назад
+    head = []
+    size = 0
+    while size < 4096:
+        line = f.readline()
+        if not line:
+            break
+        head.append(line)
+        size += len(line)
+    try:
+        dialect = csv.Sniffer().sniff("".join(head), delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(itertools.chain(head, f), dialect)
+
+
+def _read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Для импорта XLSX установите пакет openpyxl") from None
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def _column_map(header):
+    mapping = {}
+    for index, title in enumerate(header):
+        field = HEADER_ALIASES.get(str(title).strip().lower())
+        if field and field not in mapping:
+            mapping[field] = index
+    if all(field in mapping for field in USER_FIELDS):
+        return mapping, True
+    # Без заголовка: колонки в порядке формы
+    return {field: index for index, field in enumerate(USER_FIELDS + ("position",))}, False
+
+
+def _copy_field(value):
+    if value is None:
+        return r"\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class _CopySource:
+    """Файлоподобный источник для COPY FROM STDIN поверх генератора строк."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def _valid_lines(rows, positions, default_position_id, report):
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    mapping, has_header = _column_map(first)
+    position_ids = set(positions.values())
+    row_no = 1
+    if not has_header:
+        rows = _prepend(first, rows)
+        row_no = 0
+    for row in rows:
+        row_no += 1
+        if not any(str(cell).strip() for cell in row):
+            continue
+        report.total += 1
+        values = {field: (row[index].strip() if index < len(row) else "")
+                  for field, index in mapping.items()}
+        error = validate_user(*(values[field] for field in USER_FIELDS))
+        if error:
+            report.issues.append(ImportIssue(row_no, None, error))
+            continue
+        position_id = default_position_id
+        position = values.get("position")
+        if position:
+            position_id = int(position) if position.isdigit() else positions.get(position.lower())
+            # Неизвестный id нарушил бы внешний ключ и отменил бы весь INSERT, а не одну строку
+            if position_id not in position_ids:
+                report.issues.append(ImportIssue(row_no, "position", f"Неизвестная должность: {position}"))
+                continue
+        elif position_id is None:
+            report.issues.append(ImportIssue(row_no, "position", "Не указана должность"))
+            continue
+        fields = [row_no] + [values[field] for field in USER_FIELDS] + [position_id]
+        yield "\t".join(_copy_field(value) for value in fields) + "\n"
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+def import_users(connection, rows, default_password, default_position_id=None):
+    """Загружает пользователей через COPY во временную таблицу и один INSERT ... SELECT.
+
+    Строки с ошибками и конфликтами телефона/логина (с базой или внутри файла)
+    не вставляются и попадают в отчёт с номером строки. Пароль по умолчанию
+    хэшируется один раз на весь импорт: его всё равно меняют при первом входе.
+    """
+    report = ImportReport()
+    password_hash = hash_password(default_password)
+    positions = {row[1].lower(): row[0] for row in reference_cache.load("position", connection).values()}
+    with connection.cursor() as cursor:
+        # Типы колонок совпадают с Users, поэтому вставка не зависит от схемы телефона
+        cursor.execute("""
+            CREATE TEMP TABLE import_users ON COMMIT DROP AS
+            SELECT first_name, last_name, phone, email, user_login, position_id
+            FROM Users WITH NO DATA
+        """)
+        cursor.execute("ALTER TABLE import_users ADD COLUMN row_no integer")
+        source = _CopySource(_valid_lines(rows, positions, default_position_id, report))
+        cursor.copy_expert(
+            "COPY import_users (row_no, first_name, last_name, phone, email, user_login, position_id) "
+            "FROM STDIN", source)
+
+        cursor.execute("""
+            CREATE TEMP TABLE import_conflicts ON COMMIT DROP AS
+            SELECT s.row_no, 'phone' AS field, 'Телефон уже используется' AS message
+            FROM import_users s JOIN Users u ON u.phone = s.phone
+            UNION ALL
+            SELECT s.row_no, 'user_login', 'Логин уже существует'
+            FROM import_users s JOIN Users u ON u.user_login = s.user_login
+            UNION ALL
+            SELECT row_no, 'phone', 'Телефон повторяется в файле (строка ' || first_row || ')'
+            FROM (SELECT row_no, min(row_no) OVER (PARTITION BY phone) AS first_row
+                  FROM import_users) d
+            WHERE row_no <> first_row
+            UNION ALL
+            SELECT row_no, 'user_login', 'Логин повторяется в файле (строка ' || first_row || ')'
+            FROM (SELECT row_no, min(row_no) OVER (PARTITION BY user_login) AS first_row
+                  FROM import_users) d
+            WHERE row_no <> first_row
+        """)
+        cursor.execute("SELECT row_no, field, message FROM import_conflicts ORDER BY row_no")
+        report.issues.extend(ImportIssue(*row) for row in cursor.fetchall())
+
+        # Строки, вставленные параллельно после проверки конфликтов, ON CONFLICT пропускает:
+        # по RETURNING они находятся и попадают в отчёт
+        cursor.execute("""
+            WITH inserted AS (
+                INSERT INTO Users
+                    (first_name, last_name, phone, email, user_login, user_password, position_id,
+                     created_at, block, failed_attempts)
+                SELECT s.first_name, s.last_name, s.phone, s.email, s.user_login, %s, s.position_id,
+                       localtimestamp, 0, 0
+                FROM import_users s
+                WHERE NOT EXISTS (SELECT 1 FROM import_conflicts c WHERE c.row_no = s.row_no)
+                ORDER BY s.row_no
+                ON CONFLICT DO NOTHING
+                RETURNING user_login
+            )
+            SELECT s.row_no, EXISTS (SELECT 1 FROM inserted i WHERE i.user_login = s.user_login)
+            FROM import_users s
+            WHERE NOT EXISTS (SELECT 1 FROM import_conflicts c WHERE c.row_no = s.row_no)
+        """, (password_hash,))
+        for row_no, inserted in cursor.fetchall():
+            if inserted:
+                report.inserted += 1
+            else:
+                report.issues.append(ImportIssue(row_no, None, "Телефон или логин уже существует"))
+    connection.commit()
+    report.issues.sort(key=lambda issue: issue.row_no)
+    return report
@@ -0,0 +1,477 @@
+import configparser
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from instrumentation import InstrumentedCursor, current_tag, metrics, tagged
+
+DB_CONFIG_PATH = os.environ.get("HOTEL_DB_CONFIG", os.path.join(os.path.expanduser("~"), ".hotel", "db.ini"))
+# Значения по умолчанию; файл DB_CONFIG_PATH и переменные HOTEL_DB_* их переопределяют
+DB_DEFAULTS = {
+    "dbname": "Hotel",
+    "user": "postgres",
+    "password": "1",
+    "host": "localhost",
+    "port": "5432"
+}
+SESSION_DEFAULTS = {
+    "application_name": "hotel-desktop",
+    "connect_timeout": "5",
+    # 0 — без ограничения: выгрузки и импорт идут дольше любого разумного общего лимита
+    "statement_timeout": "0",
+    "keepalives_idle": "60",
+    "keepalives_interval": "10",
+    "keepalives_count": "5",
+}
+ENV_PARAMS = {
+    "HOTEL_DB_NAME": "dbname",
+    "HOTEL_DB_USER": "user",
+    "HOTEL_DB_PASSWORD": "password",
+    "HOTEL_DB_HOST": "host",
+    "HOTEL_DB_PORT": "port",
+}
+ENV_SESSION = {
+    "HOTEL_DB_APPLICATION_NAME": "application_name",
+    "HOTEL_DB_STATEMENT_TIMEOUT": "statement_timeout",
+}
+
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 5
+POOL_IDLE_TIMEOUT = 300
+POOL_CHECKOUT_TIMEOUT = 10
+POOL_PING_AFTER = 30
+REPLICA_CHECK_INTERVAL = 10
+# Реплика, отставшая сильнее, не получает запросов, пока не догонит
+REPLICA_MAX_LAG = 30
+REPLICA_CHECKOUT_TIMEOUT = 2
+
+
+def _connect_params(server, session):
+    """Аргументы psycopg2.connect: сервер и настройки сеанса, передаваемые при подключении."""
+    params = dict(server)
+    params["application_name"] = session["application_name"]
+    params["connect_timeout"] = session["connect_timeout"]
+    params["keepalives"] = 1
+    for name in ("keepalives_idle", "keepalives_interval", "keepalives_count"):
+        params[name] = session[name]
+    # Параметры сервера в стартовом пакете: отдельный SET после подключения не нужен
+    params["options"] = f"-c statement_timeout={session['statement_timeout']}"
+    return params
+
+
+def load_db_config(path=DB_CONFIG_PATH, environ=None):
+    """Настройки подключения: значения по умолчанию, затем файл path, затем переменные окружения.
+
+    Файл в формате INI: секция [primary] с параметрами основного сервера,
+    секции [replica <имя>] — реплики (недостающие параметры берутся из
+    [primary]), [session] — настройки сеанса (SESSION_DEFAULTS). HOTEL_DB_REPLICAS
+    задаёт реплики списком "host[:port],...". Возвращает (параметры основного
+    сервера, список параметров реплик) для psycopg2.connect.
+    """
+    environ = os.environ if environ is None else environ
+    server = dict(DB_DEFAULTS)
+    session = dict(SESSION_DEFAULTS)
+    replicas = []
+    config = configparser.ConfigParser(interpolation=None)
+    if path:
+        config.read(path, encoding="utf-8")
+    if config.has_section("primary"):
+        server.update(config["primary"])
+    if config.has_section("session"):
+        unknown = set(config["session"]) - set(SESSION_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Неизвестные настройки сеанса в {path}: {', '.join(sorted(unknown))}")
+        session.update(config["session"])
+    for variable, name in ENV_PARAMS.items():
+        if environ.get(variable):
+            server[name] = environ[variable]
+    for variable, name in ENV_SESSION.items():
+        if environ.get(variable):
+            session[name] = environ[variable]
+    for section in config.sections():
+        if section.startswith("replica"):
+            replicas.append(dict(server, **config[section]))
+    for address in filter(None, (item.strip() for item in environ.get("HOTEL_DB_REPLICAS", "").split(","))):
+        host, _, port = address.partition(":")
+        replicas.append(dict(server, host=host, port=port or server["port"]))
+    return _connect_params(server, session), [_connect_params(replica, session) for replica in replicas]
+
+
+DB_PARAMS, REPLICA_PARAMS = load_db_config()
+
+
+class PoolTimeoutError(PoolError):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений psycopg2 с проверкой живости и удалением простаивающих."""
+
+    def __init__(self, params, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                 ping_after=POOL_PING_AFTER):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Некорректные размеры пула")
+        self.params = dict(params)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "exhausted": 0,
+            "timeouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "reaped": 0,
+        }
+
+        self._stop_reaper = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_loop, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _connect(self):
+        conn = psycopg2.connect(cursor_factory=InstrumentedCursor, **self.params)
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _is_alive(self, conn, released_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout=None):
+        """Выдаёт соединение из пула, при необходимости ожидая освобождения."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, released_at = None, None
+                    break
+                if not waited:
+                    self._stats["exhausted"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(f"Нет свободных соединений в течение {timeout} с")
+                self._cond.wait(remaining)
+
+        if conn is not None and not self._is_alive(conn, released_at):
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats["discarded"] += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_total"] += elapsed
+            self._stats["wait_max"] = max(self._stats["wait_max"], elapsed)
+        metrics.record_acquire(current_tag(), elapsed)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Возвращает соединение в пул, откатывая незавершённую транзакцию."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+            with self._cond:
+                self._size -= 1
+                self._stats["discarded"] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Контекстный менеджер: соединение всегда возвращается в пул."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def warm(self):
+        """Открывает соединения до минимального размера пула."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self.putconn(conn)
+
+    def reap(self):
+        """Закрывает соединения, простаивающие дольше idle_timeout, сверх минимального размера."""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            keep = []
+            # _idle упорядочен по времени возврата: самые старые в начале
+            for conn, released_at in self._idle:
+                if (now - released_at > self.idle_timeout
+                        and self._size - len(expired) > self.min_size):
+                    expired.append(conn)
+                else:
+                    keep.append((conn, released_at))
+            self._idle = keep
+            self._size -= len(expired)
+            self._stats["reaped"] += len(expired)
+        for conn in expired:
+            self._close_quietly(conn)
+        return len(expired)
+
+    def _reap_loop(self):
+        interval = max(1.0, self.idle_timeout / 2)
+        while not self._stop_reaper.wait(interval):
+            self.reap()
+
+    def stats(self):
+        """Снимок счётчиков пула: ожидание выдачи, исчерпание, размер."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["size"] = self._size
+            snapshot["idle"] = len(self._idle)
+            snapshot["in_use"] = self._size - len(self._idle)
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_avg"] = snapshot["wait_total"] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def close(self):
+        self._stop_reaper.set()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+@contextmanager
+def autocommit(connection):
+    """Запросы без явной транзакции: BEGIN/COMMIT не требуют отдельных обменов с сервером."""
+    previous = connection.autocommit
+    connection.autocommit = True
+    try:
+        yield connection
+    finally:
+        connection.autocommit = previous
+
+
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+class ReplicaSet:
+    """Реплики для запросов только на чтение: выдаются по кругу из исправных.
+
+    Фоновый поток раз в check_interval секунд проверяет связь с каждой репликой
+    и отставание воспроизведения WAL (не больше max_lag секунд). До первой
+    успешной проверки реплика запросов не получает; реплика, с которой не удалось
+    соединиться или соединение с которой оборвалось, исключается до следующей.
+    """
+
+    def __init__(self, params_list, check_interval=REPLICA_CHECK_INTERVAL, max_lag=REPLICA_MAX_LAG):
+        self.pools = [ConnectionPool(params, min_size=0) for params in params_list]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._healthy = set()
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stop_checks = threading.Event()
+        self._checker = threading.Thread(target=self._check_loop, name="db-replica-check", daemon=True)
+        self._checker.start()
+
+    def pick(self):
+        """Следующая исправная реплика или None."""
+        with self._lock:
+            healthy = [pool for pool in self.pools if pool in self._healthy]
+            if not healthy:
+                return None
+            self._next += 1
+            return healthy[self._next % len(healthy)]
+
+    def mark_down(self, pool):
+        """Исключает реплику до следующей проверки. Возвращает False, если pool не из этого набора."""
+        if pool not in self.pools:
+            return False
+        with self._lock:
+            self._healthy.discard(pool)
+        return True
+
+    def check(self):
+        for pool in self.pools:
+            healthy = self._is_healthy(pool)
+            with self._lock:
+                if healthy:
+                    self._healthy.add(pool)
+                else:
+                    self._healthy.discard(pool)
+
+    def _is_healthy(self, pool):
+        try:
+            conn = pool.getconn(REPLICA_CHECKOUT_TIMEOUT)
+        except Exception:
+            # В том числе таймаут: все соединения заняты, возможно, зависли на обрыве сети.
+            # Чтение уходит на основной сервер до следующей проверки
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_QUERY)
+                lag = cursor.fetchone()[0]
+            conn.rollback()
+        except psycopg2.Error:
+            pool.putconn(conn, discard=True)
+            return False
+        pool.putconn(conn)
+        return lag is None or lag <= self.max_lag
+
+    def _check_loop(self):
+        while True:
+            with tagged("replica_check"):
+                self.check()
+            if self._stop_checks.wait(self.check_interval):
+                return
+
+    def close(self):
+        self._stop_checks.set()
+        for pool in self.pools:
+            pool.close()
+
+
+_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Общий для процесса пул соединений, создаётся при первом обращении."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DB_PARAMS)
+        return _pool
+
+
+def get_replicas():
+    """Реплики из REPLICA_PARAMS (None, если не настроены), создаются при первом обращении."""
+    global _replicas
+    with _pool_lock:
+        if _replicas is None and REPLICA_PARAMS:
+            _replicas = ReplicaSet(REPLICA_PARAMS)
+        return _replicas
+
+
+def acquire(read_only=False, timeout=None):
+    """(пул, соединение) для запроса: только чтение идёт на исправную реплику, иначе на основной сервер.
+
+    Если реплика не дала соединения, она исключается и запрос уходит на основной
+    сервер. Соединение возвращается через pool.putconn().
+    """
+    replicas = get_replicas() if read_only else None
+    pool = replicas.pick() if replicas is not None else None
+    if pool is not None:
+        try:
+            return pool, pool.getconn(REPLICA_CHECKOUT_TIMEOUT)
+        except PoolTimeoutError:
+            # Реплика занята, но исправна: этот запрос обслужит основной сервер
+            pass
+        except Exception:
+            replicas.mark_down(pool)
+    pool = get_pool()
+    return pool, pool.getconn(timeout)
+
+
+def replica_failed(pool):
+    """Исключает реплику pool после обрыва соединения. Возвращает False, если pool не реплика."""
+    replicas = _replicas
+    return replicas is not None and replicas.mark_down(pool)
+
+
+@contextmanager
+def db_connection(timeout=None, read_only=False):
+    """Соединение из пула (read_only — с реплики, если есть); всегда возвращается в свой пул."""
+    pool, conn = acquire(read_only, timeout)
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def close_pool():
+    global _pool, _replicas
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        if _replicas is not None:
+            _replicas.close()
+            _replicas = None
@@ -0,0 +1,145 @@
+import csv
+import io
+import os
+from collections import namedtuple
+
+from psycopg2.extensions import encodings
+
+import repository
+from refcache import role_position_ids
+
+EXPORT_CHUNK_ROWS = 5000
+# Лимит строк листа Excel; дальше выгрузка продолжается на следующем листе
+XLSX_MAX_ROWS = 1048576
+
+ExportReport = namedtuple("ExportReport", "title headers query params count_query count_params")
+
+SCHEDULE_EXPORT_QUERY = """
+    SELECT s.work_date, s.shift_start, s.shift_end, u.last_name, u.first_name, u.user_login
+    FROM StaffSchedule s
+    JOIN Users u ON u.user_id = s.user_id
+    WHERE s.work_date BETWEEN %s AND %s
+    ORDER BY s.work_date, s.shift_start, s.user_id
+"""
+SCHEDULE_EXPORT_COUNT = "SELECT count(*) FROM StaffSchedule WHERE work_date BETWEEN %s AND %s"
+
+
+def staff_report(connection, search="", sort_column=-1, descending=False):
+    """Список персонала в том виде, в каком он показан на экране."""
+    position_ids = role_position_ids("staff", connection)
+    query, params = repository.staff_query(position_ids, sort_column, descending, search)
+    conditions, count_params = repository.staff_search_conditions(search)
+    conditions.insert(0, "u.position_id = ANY(%s)")
+    count_params.insert(0, list(position_ids))
+    return ExportReport("Персонал", ("Имя", "Фамилия", "Email", "Должность", "ID"), query, params,
+                        f"SELECT count(*) FROM Users u WHERE {' AND '.join(conditions)}", count_params)
+
+
+def schedule_report(start, end):
+    """Смены всех сотрудников с start по end включительно."""
+    return ExportReport("Расписание", ("Дата", "Начало смены", "Конец смены", "Фамилия", "Имя", "Логин"),
+                        SCHEDULE_EXPORT_QUERY, (start, end), SCHEDULE_EXPORT_COUNT, (start, end))
+
+
+class _CopyTarget(io.RawIOBase):
+    """Файл для COPY TO: пишет на диск и сообщает число выгруженных строк."""
+
+    def __init__(self, file, total, progress):
+        super().__init__()
+        self.file = file
+        self.total = total
+        self.progress = progress
+        self.rows = 0
+        self._reported = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.file.write(data)
+        # Поля с переводом строки внутри кавычек немного завышают счёт
+        self.rows += data.count(b"\n")
+        if self.progress is not None and self.rows - self._reported >= EXPORT_CHUNK_ROWS:
+            self._reported = self.rows
+            self.progress(self.rows, self.total)
+        return len(data)
+
+
+def export_report(connection, report, path, progress=None):
+    """Выгружает report в CSV или XLSX (по расширению path), не держа результат в памяти.
+
+    CSV пишется сервером через COPY TO STDOUT, XLSX — порциями из именованного
+    курсора. Файл появляется под именем path только после успешной выгрузки.
+    progress(выгружено, всего) вызывается после каждой порции. Возвращает число строк.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(report.count_query, report.count_params)
+        total = cursor.fetchone()[0]
+    partial = path + ".part"
+    try:
+        if path.lower().endswith(".xlsx"):
+            rows = _export_xlsx(connection, report, partial, total, progress)
+        else:
+            rows = _export_csv(connection, report, partial, total, progress)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    if progress is not None:
+        progress(rows, total)
+    return rows
+
+
+def _export_csv(connection, report, path, total, progress):
+    with open(path, "wb") as file:
+        # BOM и заголовок на русском: Excel открывает такой файл без мастера импорта
+        header = io.StringIO()
+        csv.writer(header, lineterminator="\n").writerow(report.headers)
+        file.write(header.getvalue().encode("utf-8-sig"))
+        target = _CopyTarget(file, total, progress)
+        with connection.cursor() as cursor:
+            # connection.encoding — имя кодировки PostgreSQL (WIN1251 и т. п.), не кодек Python
+            query = cursor.mogrify(report.query, report.params).decode(encodings[connection.encoding])
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, ENCODING 'UTF8')", target)
+    return target.rows
+
+
+def _export_xlsx(connection, report, path, total, progress):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("Для выгрузки в XLSX установите пакет openpyxl") from None
+    # write_only сбрасывает строки во временный файл, а не держит лист в памяти
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    rows = 0
+    try:
+        with connection.cursor(name="export_report") as cursor:
+            cursor.itersize = EXPORT_CHUNK_ROWS
+            cursor.execute(report.query, report.params)
+            while True:
+                chunk = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                if not chunk:
+                    break
+                for row in chunk:
+                    if sheet_rows >= XLSX_MAX_ROWS:
+                        number = len(workbook.worksheets) + 1
+                        sheet = workbook.create_sheet(report.title if number == 1 else f"{report.title} {number}")
+                        sheet.append(report.headers)
+                        sheet_rows = 1
+                    sheet.append(row)
+                    sheet_rows += 1
+                rows += len(chunk)
+                if progress is not None:
+                    progress(rows, total)
+    except BaseException:
+        # Закрываем временные файлы листов, иначе они дописываются при сборке мусора
+        for worksheet in workbook.worksheets:
+            worksheet.close()
+        raise
+    if sheet is None:
+        workbook.create_sheet(report.title).append(report.headers)
+    workbook.save(path)
+    return rows
@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2 import extensions
+
+SLOW_QUERY_THRESHOLD = float(os.environ.get("HOTEL_SLOW_QUERY_MS", "500")) / 1000
+SLOW_QUERY_LOG = os.environ.get(
+    "HOTEL_SLOW_QUERY_LOG", os.path.join(os.path.expanduser("~"), ".hotel", "slow_queries.log"))
+METRICS_FILE = os.environ.get("HOTEL_METRICS_FILE")
+METRICS_DUMP_INTERVAL = 15
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_LABEL_LENGTH = 80
+
+slow_query_logger = logging.getLogger("hotel.slow_query")
+
+_context = threading.local()
+
+
+def current_tag():
+    return getattr(_context, "tag", None) or "untagged"
+
+
+@contextmanager
+def tagged(tag):
+    """Помечает запросы текущего потока именем обработчика (show_staff_list, ...)."""
+    previous = getattr(_context, "tag", None)
+    _context.tag = tag
+    try:
+        yield
+    finally:
+        _context.tag = previous
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.errors = 0
+
+    def observe(self, seconds, rows=0, error=False):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.rows += max(rows, 0)
+        if error:
+            self.errors += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            total += count
+            yield bound, total
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "rows": self.rows,
+            "errors": self.errors,
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class QueryMetrics:
+    """Гистограммы задержек SQL по (обработчик, запрос) и ожидания соединения по обработчику."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._acquire = {}
+
+    def record_query(self, tag, statement, seconds, rows=0, error=False):
+        with self._lock:
+            histogram = self._queries.get((tag, statement))
+            if histogram is None:
+                histogram = self._queries[(tag, statement)] = _Histogram()
+            histogram.observe(seconds, rows, error)
+
+    def record_acquire(self, tag, seconds):
+        with self._lock:
+            histogram = self._acquire.get(tag)
+            if histogram is None:
+                histogram = self._acquire[tag] = _Histogram()
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._acquire.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "queries": [dict(tag=tag, statement=statement, **histogram.as_dict())
+                            for (tag, statement), histogram in sorted(self._queries.items())],
+                "acquire": [dict(tag=tag, **histogram.as_dict())
+                            for tag, histogram in sorted(self._acquire.items())],
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            queries = sorted(self._queries.items())
+            acquire = sorted(self._acquire.items())
+            _prometheus_histogram(lines, "hotel_db_query_seconds", "Время выполнения SQL",
+                                  [({"tag": tag, "statement": statement}, h) for (tag, statement), h in queries])
+            lines.append("# HELP hotel_db_query_rows_total Строк возвращено или изменено")
+            lines.append("# TYPE hotel_db_query_rows_total counter")
+            for (tag, statement), h in queries:
+                lines.append(f"hotel_db_query_rows_total{_labels(tag=tag, statement=statement)} {h.rows}")
+            lines.append("# HELP hotel_db_query_errors_total Запросы, завершившиеся ошибкой")
+            lines.append("# TYPE hotel_db_query_errors_total counter")
+            for (tag, statement), h in queries:
+                lines.append(f"hotel_db_query_errors_total{_labels(tag=tag, statement=statement)} {h.errors}")
+            _prometheus_histogram(lines, "hotel_db_acquire_seconds", "Ожидание соединения из пула",
+                                  [({"tag": tag}, h) for tag, h in acquire])
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Атомарно пишет метрики в файл: .json — JSON, иначе текстовый формат Prometheus."""
+        text = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+
+def _labels(**labels):
+    escaped = (f'{name}="{_escape_label(value)}"' for name, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _prometheus_histogram(lines, name, help_text, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, h in series:
+        for bound, count in h.cumulative():
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {h.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {h.sum:.6f}")
+        lines.append(f"{name}_count{_labels(**labels)} {h.count}")
+
+
+metrics = QueryMetrics()
+
+
+def _statement_text(cursor, query):
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    if hasattr(query, "as_string"):
+        return query.as_string(cursor)
+    return str(query)
+
+
+_STRING_LITERAL = re.compile(r"(?:\b[EeBbXx]|\b[Uu]&)?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])\d+(?:\.\d+)?")
+_ROW = r"\((?:[^()]|\([^()]*\))*\)"
+_ROW_LIST = re.compile(rf"({_ROW})(?:\s*,\s*{_ROW})+")
+
+
+def _normalize(text):
+    """Текст запроса без литералов: данные, подставленные на клиенте (execute_values,
+    mogrify), не попадают ни в журнал, ни в метки метрик. Списки строк VALUES сворачиваются.
+    """
+    text = _NUMBER_LITERAL.sub("?", _STRING_LITERAL.sub("?", text))
+    return _ROW_LIST.sub(r"\1, ...", text)
+
+
+def _statement_label(text):
+    label = " ".join(text.split())
+    if len(label) > STATEMENT_LABEL_LENGTH:
+        label = label[:STATEMENT_LABEL_LENGTH - 3] + "..."
+    return label
+
+
+class InstrumentedCursor(extensions.cursor):
+    """Курсор, замеряющий каждый запрос; подключается через cursor_factory.
+
+    Параметры запросов не записываются ни в метрики, ни в журнал медленных
+    запросов: среди них бывают пароли. Литералы в тексте (запросы, собранные
+    на клиенте) заменяются на "?".
+    """
+
+    def execute(self, query, vars=None):
+        with self._measure(query):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with self._measure(query):
+            return super().executemany(query, vars_list)
+
+    def callproc(self, procname, parameters=None):
+        with self._measure(f"CALL {procname}"):
+            return super().callproc(procname, parameters)
+
+    def copy_expert(self, sql, file, size=8192):
+        with self._measure(sql):
+            return super().copy_expert(sql, file, size)
+
+    # У именованного курсора строки передаются при FETCH, его тоже замеряем
+    def fetchone(self):
+        if self.name is None:
+            return super().fetchone()
+        with self._measure(f"FETCH {self.name}", fetch=True) as result:
+            result.append(super().fetchone())
+        return result[0]
+
+    def fetchmany(self, size=None):
+        if self.name is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        with self._measure(f"FETCH {self.name}", fetch=True) as result:
+            result.append(super().fetchmany(size) if size is not None else super().fetchmany())
+        return result[0]
+
+    def fetchall(self):
+        if self.name is None:
+            return super().fetchall()
+        with self._measure(f"FETCH {self.name}", fetch=True) as result:
+            result.append(super().fetchall())
+        return result[0]
+
+    @contextmanager
+    def _measure(self, query, fetch=False):
+        result = []
+        started = time.perf_counter()
+        error = False
+        try:
+            yield result
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if fetch:
+                fetched = result[0] if result else None
+                rows = len(fetched) if isinstance(fetched, list) else int(fetched is not None)
+            else:
+                rows = self.rowcount
+            text = _normalize(_statement_text(self, query))
+            tag = current_tag()
+            metrics.record_query(tag, _statement_label(text), elapsed, rows, error)
+            if elapsed >= SLOW_QUERY_THRESHOLD:
+                slow_query_logger.warning("%.1f ms tag=%s rows=%s%s\n%s", elapsed * 1000, tag, rows,
+                                          " error" if error else "", text.strip())
+
+
+def configure_slow_query_log(path=SLOW_QUERY_LOG):
+    """Направляет журнал медленных запросов в файл (один раз за процесс)."""
+    if slow_query_logger.handlers or not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
+
+
+def start_metrics_dump(path=METRICS_FILE, interval=METRICS_DUMP_INTERVAL):
+    """Периодически сбрасывает метрики в path для агента мониторинга. Возвращает функцию остановки."""
+    if not path:
+        return lambda: None
+    stopped = threading.Event()
+
+    def loop():
+        while not stopped.wait(interval):
+            try:
+                metrics.dump(path)
+            except OSError:
+                pass
+
+    threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+    def stop():
+        stopped.set()
+        try:
+            metrics.dump(path)
+        except OSError:
+            pass
+
+    return stop
@@ -0,0 +1,132 @@
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+from PySide6.QtCore import QObject, QSocketNotifier, QTimer, Qt, Signal
+
+import db
+
+RECONNECT_INTERVAL = 5
+USERS_CHANNEL = "users_changed"
+SCHEDULE_CHANNEL = "schedule_changed"
+
+
+class PgListener(QObject):
+    """LISTEN на отдельном соединении, встроенный в цикл событий Qt.
+
+    Сокет соединения отслеживается QSocketNotifier, поэтому уведомления
+    приходят без опроса. После потери связи соединение восстанавливается,
+    и испускается reconnected: пропущенные за это время уведомления
+    не доставляются, подписчики должны перечитать данные.
+    """
+
+    notified = Signal(str, str)
+    reconnected = Signal()
+    _connected = Signal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._channels = []
+        self._connection = None
+        self._notifier = None
+        self._connecting = False
+        self._stopped = False
+        self._ever_connected = False
+        self._connected.connect(self._on_connected, Qt.QueuedConnection)
+
+    def listen(self, channel):
+        if channel in self._channels:
+            return
+        self._channels.append(channel)
+        if self._connection is not None:
+            self._execute_listen(self._connection, [channel])
+        else:
+            self.start()
+
+    def start(self):
+        """Открывает соединение в фоновом потоке, не блокируя интерфейс."""
+        if self._connecting or self._connection is not None or self._stopped:
+            return
+        self._connecting = True
+        threading.Thread(target=self._connect, name="pg-listener-connect", daemon=True).start()
+
+    def stop(self):
+        self._stopped = True
+        self._drop_connection()
+
+    def _connect(self):
+        try:
+            connection = psycopg2.connect(**db.DB_PARAMS)
+            connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            channels = list(self._channels)
+            self._execute_listen(connection, channels)
+        except Exception as e:
+            self._connected.emit(None, e)
+        else:
+            self._connected.emit(connection, channels)
+
+    def _execute_listen(self, connection, channels):
+        with connection.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f'LISTEN "{channel}"')
+
+    def _on_connected(self, connection, channels):
+        self._connecting = False
+        if self._stopped:
+            if connection is not None:
+                connection.close()
+            return
+        if connection is None:
+            # Данные могли измениться, пока связи не было
+            self._ever_connected = True
+            QTimer.singleShot(RECONNECT_INTERVAL * 1000, self.start)
+            return
+        self._connection = connection
+        # Каналы, добавленные, пока соединение открывалось
+        missing = [channel for channel in self._channels if channel not in channels]
+        if missing:
+            self._execute_listen(connection, missing)
+        self._notifier = QSocketNotifier(connection.fileno(), QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._on_readable)
+        if self._ever_connected:
+            self.reconnected.emit()
+        self._ever_connected = True
+        # Уведомления могли прийти вместе с ответом на LISTEN
+        self._dispatch()
+
+    def _on_readable(self):
+        try:
+            self._connection.poll()
+        except psycopg2.Error:
+            self._drop_connection()
+            QTimer.singleShot(RECONNECT_INTERVAL * 1000, self.start)
+            return
+        self._dispatch()
+
+    def _dispatch(self):
+        connection = self._connection
+        while connection is not None and connection.notifies:
+            notify = connection.notifies.pop(0)
+            self.notified.emit(notify.channel, notify.payload)
+
+    def _drop_connection(self):
+        if self._notifier is not None:
+            self._notifier.setEnabled(False)
+            self._notifier.deleteLater()
+            self._notifier = None
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except psycopg2.Error:
+                pass
+            self._connection = None
+
+
+_listener = None
+
+
+def get_listener():
+    global _listener
+    if _listener is None:
+        _listener = PgListener()
+    return _listener
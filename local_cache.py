@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import time as _time
+from contextlib import closing
+from datetime import date, datetime, time
+
+from refcache import role_position_ids
+
+LOCAL_CACHE_PATH = os.environ.get(
+    "HOTEL_LOCAL_CACHE", os.path.join(os.path.expanduser("~"), ".hotel", "cache.sqlite3"))
+SYNC_BATCH_SIZE = 5000
+
+LOCAL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS schedule (
+        user_id INTEGER NOT NULL,
+        work_date TEXT NOT NULL,
+        shift_start TEXT NOT NULL,
+        shift_end TEXT NOT NULL,
+        PRIMARY KEY (user_id, work_date, shift_start)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS staff (
+        user_id INTEGER PRIMARY KEY,
+        first_name TEXT,
+        last_name TEXT,
+        email TEXT,
+        position_name TEXT
+    );
+    CREATE INDEX IF NOT EXISTS staff_name_idx ON staff (last_name, first_name);
+
+    CREATE TABLE IF NOT EXISTS sync_state (
+        name TEXT PRIMARY KEY,
+        synced_at REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS sync_cursor (
+        name TEXT NOT NULL,
+        server TEXT NOT NULL,
+        change_cursor INTEGER NOT NULL,
+        PRIMARY KEY (name, server)
+    ) WITHOUT ROWID;
+"""
+
+# Снимок сервера: всё, что закоммичено транзакциями младше этого xid, уже видно.
+# Строки с xmin не меньше курсора считаются изменёнными с прошлой синхронизации.
+SNAPSHOT_QUERY = "SELECT mod(txid_snapshot_xmin(txid_current_snapshot()), 4294967296)"
+
+SCHEDULE_CHANGES = """
+    SELECT work_date, shift_start, shift_end
+    FROM StaffSchedule
+    WHERE user_id = %s AND (%s IS NULL OR xmin::text::bigint >= %s)
+"""
+# Сверка набора ключей: число строк и две суммы от ключа, одинаково считаемые
+# PostgreSQL и SQLite. Удаление с одновременной вставкой меняет суммы, хотя
+# число строк то же. Ключ расписания — секунды от эпохи для (work_date, shift_start).
+# Остаток от деления: в запросах psycopg2 с параметрами знак % удваивается.
+KEY_CHECKSUM = "count(*), coalesce(sum(k), 0), coalesce(sum(k * 2654435761 {mod} 4294967291), 0)"
+SERVER_KEY_CHECKSUM = KEY_CHECKSUM.format(mod="%%")
+LOCAL_KEY_CHECKSUM = KEY_CHECKSUM.format(mod="%")
+SCHEDULE_CHECKSUM = f"""
+    SELECT {SERVER_KEY_CHECKSUM} FROM (
+        SELECT extract(epoch FROM work_date + shift_start)::bigint AS k
+        FROM StaffSchedule WHERE user_id = %s
+    ) keys
+"""
+LOCAL_SCHEDULE_CHECKSUM = f"""
+    SELECT {LOCAL_KEY_CHECKSUM} FROM (
+        SELECT CAST(strftime('%s', work_date || ' ' || shift_start) AS INTEGER) AS k
+        FROM schedule WHERE user_id = ?
+    )
+"""
+
+STAFF_CHANGES = """
+    SELECT u.user_id, u.first_name, u.last_name, u.email, p.position_name
+    FROM Users u
+    JOIN Position p ON u.position_id = p.position_id
+    WHERE u.position_id = ANY(%s)
+      AND (%s IS NULL OR u.xmin::text::bigint >= %s OR p.xmin::text::bigint >= %s)
+"""
+STAFF_CHECKSUM = (f"SELECT {SERVER_KEY_CHECKSUM} FROM "
+                  "(SELECT user_id::bigint AS k FROM Users WHERE position_id = ANY(%s)) keys")
+LOCAL_STAFF_CHECKSUM = f"SELECT {LOCAL_KEY_CHECKSUM} FROM (SELECT user_id AS k FROM staff)"
+
+# Как repository.STAFF_SORT_COLUMNS
+STAFF_SORT_COLUMNS = (("first_name",), ("last_name", "first_name"), ("email",), ("position_name",))
+STAFF_DEFAULT_SORT = 1
+
+
+def _time_text(value):
+    return value.strftime("%H:%M:%S")
+
+
+class LocalMirror:
+    """Локальная копия расписания пользователя и справочника персонала в SQLite.
+
+    Экраны читают из неё сразу и без сети; синхронизация с сервером идёт в фоне
+    и передаёт только строки, изменённые после прошлой синхронизации (по xmin).
+    Курсор изменений хранится отдельно для каждого сервера (основного и реплик).
+    Удаления обнаруживаются сверкой контрольной суммы ключей и ведут к полной
+    перезагрузке.
+    Чтение — из GUI-потока, запись — из фоновых задач через отдельные соединения.
+    """
+
+    def __init__(self, path=LOCAL_CACHE_PATH):
+        self.path = path
+        self._reader = None
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(LOCAL_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+
+    def _read(self, query, params=()):
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader.execute(query, params).fetchall()
+
+    def synced_at(self, name):
+        """Время последней успешной синхронизации name или None."""
+        rows = self._read("SELECT synced_at FROM sync_state WHERE name = ?", (name,))
+        return datetime.fromtimestamp(rows[0][0]) if rows and rows[0][0] else None
+
+    def has_schedule(self, user_id):
+        return self.synced_at(self.schedule_state(user_id)) is not None
+
+    @staticmethod
+    def schedule_state(user_id):
+        return f"schedule:{user_id}"
+
+    def schedule_page(self, user_id, limit, start=None, after=None, before=None):
+        """Страница расписания из копии; параметры — как у repository.get_schedule."""
+        if before is not None:
+            rows = self._read("""
+                SELECT work_date, shift_start, shift_end FROM schedule
+                WHERE user_id = ? AND (work_date, shift_start) < (?, ?)
+                ORDER BY work_date DESC, shift_start DESC LIMIT ?
+            """, (user_id, before[0].isoformat(), _time_text(before[1]), limit))[::-1]
+        elif after is not None:
+            rows = self._read("""
+                SELECT work_date, shift_start, shift_end FROM schedule
+                WHERE user_id = ? AND (work_date, shift_start) > (?, ?)
+                ORDER BY work_date, shift_start LIMIT ?
+            """, (user_id, after[0].isoformat(), _time_text(after[1]), limit))
+        else:
+            rows = self._read("""
+                SELECT work_date, shift_start, shift_end FROM schedule
+                WHERE user_id = ? AND work_date >= ?
+                ORDER BY work_date, shift_start LIMIT ?
+            """, (user_id, start.isoformat(), limit))
+        return [(date.fromisoformat(d), time.fromisoformat(s), time.fromisoformat(e)) for d, s, e in rows]
+
+    def staff_page(self, limit, sort_column=-1, descending=False):
+        """Первая страница справочника персонала из копии, в порядке, близком к серверному."""
+        if not 0 <= sort_column < len(STAFF_SORT_COLUMNS):
+            sort_column, descending = STAFF_DEFAULT_SORT, False
+        direction = "DESC" if descending else "ASC"
+        order = ", ".join(f"{column} {direction}" for column in (*STAFF_SORT_COLUMNS[sort_column], "user_id"))
+        return self._read(f"""
+            SELECT first_name, last_name, email, position_name, user_id FROM staff
+            ORDER BY {order} LIMIT ?
+        """, (limit,))
+
+    def sync_schedule(self, connection, user_id):
+        """Догружает изменения расписания user_id с сервера. Возвращает число полученных строк."""
+        name = self.schedule_state(user_id)
+
+        def upsert(local, rows):
+            local.executemany("INSERT OR REPLACE INTO schedule VALUES (?, ?, ?, ?)",
+                              [(user_id, d.isoformat(), _time_text(s), _time_text(e)) for d, s, e in rows])
+
+        return self._sync(connection, name, SCHEDULE_CHANGES, lambda c: (user_id, c, c),
+                          SCHEDULE_CHECKSUM, (user_id,),
+                          "DELETE FROM schedule WHERE user_id = ?", (user_id,),
+                          LOCAL_SCHEDULE_CHECKSUM, upsert)
+
+    def sync_staff(self, connection):
+        """Догружает изменения справочника персонала. Возвращает число полученных строк."""
+        def upsert(local, rows):
+            local.executemany("INSERT OR REPLACE INTO staff VALUES (?, ?, ?, ?, ?)", rows)
+
+        position_ids = role_position_ids("staff", connection)
+        return self._sync(connection, "staff", STAFF_CHANGES, lambda c: (position_ids, c, c, c),
+                          STAFF_CHECKSUM, (position_ids,),
+                          "DELETE FROM staff", (),
+                          LOCAL_STAFF_CHECKSUM, upsert)
+
+    def _sync(self, connection, name, changes_query, changes_params, checksum_query, checksum_params,
+              clear_query, clear_params, local_checksum_query, upsert):
+        # Реплика отстаёт от основного сервера: курсор одного сервера для другого не годится
+        server = f"{connection.info.host}:{connection.info.port}"
+        with self._write_lock, closing(self._connect()) as local, local:
+            row = local.execute("SELECT change_cursor FROM sync_cursor WHERE name = ? AND server = ?",
+                                (name, server)).fetchone()
+            change_cursor = row[0] if row else None
+            with connection.cursor() as cursor:
+                cursor.execute(SNAPSHOT_QUERY)
+                next_cursor = cursor.fetchone()[0]
+                # На одном сервере курсор только растёт; меньше — счётчик xid переполнился
+                if change_cursor is not None and next_cursor < change_cursor:
+                    change_cursor = None
+                received = self._pull(connection, local, changes_query, changes_params(change_cursor),
+                                      clear_query if change_cursor is None else None, clear_params, upsert)
+                cursor.execute(checksum_query, checksum_params)
+                server_checksum = tuple(int(value) for value in cursor.fetchone())
+            if tuple(local.execute(local_checksum_query, clear_params).fetchone()) != server_checksum:
+                # Часть строк удалена на сервере: перезагружаем целиком
+                received = self._pull(connection, local, changes_query, changes_params(None),
+                                      clear_query, clear_params, upsert)
+            local.execute("INSERT OR REPLACE INTO sync_cursor VALUES (?, ?, ?)", (name, server, next_cursor))
+            local.execute("INSERT OR REPLACE INTO sync_state (name, synced_at) VALUES (?, ?)",
+                          (name, _time.time()))
+        connection.rollback()
+        return received
+
+    def _pull(self, connection, local, query, params, clear_query, clear_params, upsert):
+        if clear_query is not None:
+            local.execute(clear_query, clear_params)
+        received = 0
+        with connection.cursor(name="local_mirror_sync") as cursor:
+            cursor.itersize = SYNC_BATCH_SIZE
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(SYNC_BATCH_SIZE)
+                if not rows:
+                    break
+                upsert(local, rows)
+                received += len(rows)
+        return received
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """Общая для процесса локальная копия; None, если файл копии недоступен."""
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            try:
+                _mirror = LocalMirror()
+            except (OSError, sqlite3.Error):
+                return None
+        return _mirror
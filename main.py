@@ -1,39 +1,52 @@
+import math
+import os
 import sys
-import psycopg2
-from datetime import datetime, timedelta
+import time
+
+if __name__ == "__main__" and sys.argv[1:2] == ["admin"]:
+    # Администрирование из командной строки: без PySide6 и дисплея
+    from admin_cli import main as admin_main
+    sys.exit(admin_main(sys.argv[2:]))
+
+# Первым: с --profile-startup замеряются все последующие импорты
+from startup import start_prewarm, startup_profile
+
+from collections import namedtuple
 
 from PySide6.QtWidgets import (
-    QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout,
-    QLineEdit, QLabel, QMessageBox, QInputDialog, QComboBox, QFormLayout, QScrollArea
+    QWidget, QPushButton, QVBoxLayout, QHBoxLayout,
+    QLineEdit, QLabel, QMessageBox, QInputDialog, QComboBox, QFormLayout,
+    QTableView, QAbstractItemView, QHeaderView, QStackedWidget, QFileDialog,
+    QPlainTextEdit, QSpinBox, QDateEdit, QCheckBox, QProgressDialog, QListWidget, QListWidgetItem
 )
-from PySide6.QtCore import Qt, QTimer
+from PySide6.QtCore import Qt, QTimer, QDate
 from PySide6.QtGui import QGuiApplication
 
-DB_PARAMS = {
-    "dbname": "Hotel",
-    "user": "postgres",
-    "password": "1",
-    "host": "localhost",
-    "port": "5432"
-}
+from audit import audit_log, start_audit_log
+from db import autocommit, close_pool
+from instrumentation import configure_slow_query_log, start_metrics_dump
+from listener import SCHEDULE_CHANNEL, USERS_CHANNEL, get_listener
+from refcache import REFERENCE_CHANNEL, position_role, reference_cache
+import repository
+from throttle import login_throttle
+from ui_watchdog import WatchedApplication, start_ui_watchdog
+from user_admin import DEFAULT_PASSWORD, set_block, sweep_inactive
+from workers import BusyIndicator, get_executor, report_progress, run_db
+
+# Время перед отметкой, не вошедшее в строки import, уходит на разрешение имён PySide6
+startup_profile.mark("импорт модулей завершён")
 
-DEFAULT_PASSWORD = "1234"
 MAX_FAILED_ATTEMPTS = 3
 LOGIN_BLOCK_PERIOD_DAYS = 30
+IMPORT_TIMEOUT = 300
+INACTIVITY_SWEEP_INTERVAL_MS = 60 * 60 * 1000
+INACTIVITY_SWEEP_DELAY_MS = 30 * 1000
+INACTIVITY_SWEEP_TIMEOUT = 120
+SEARCH_DEBOUNCE_MS = 250
+ROSTER_TIMEOUT = 120
+EXPORT_TIMEOUT = 3600
 
-def db_connect():
-    return psycopg2.connect(**DB_PARAMS)
-
-def clear_layout(layout):
-    """Рекурсивная очистка компоновки и удаление всех виджетов."""
-    if layout is not None:
-        while layout.count():
-            item = layout.takeAt(0)
-            widget = item.widget()
-            if widget is not None:
-                widget.deleteLater()
-            else:
-                clear_layout(item.layout())
+UserProfile = namedtuple("UserProfile", "user_id first_name last_name email position_id position_name")
 
 class LoginWindow(QWidget):
     def __init__(self):
@@ -80,6 +93,9 @@ class LoginWindow(QWidget):
         button_layout.addWidget(self.change_pass_btn)
         layout.addLayout(button_layout)
 
+        self.busy_indicator = BusyIndicator()
+        layout.addWidget(self.busy_indicator)
+
         self.error_label = QLabel("")
         self.error_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.error_label)
@@ -92,105 +108,75 @@ class LoginWindow(QWidget):
         if not user_login or not user_password:
             self.error_label.setText("Все поля обязательны для заполнения")
             return
-
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            query = """
-                SELECT user_id, first_name, last_name, user_password, block, login_date, failed_attempts, position_id 
-                FROM Users 
-                WHERE user_login = %s
-            """
-            cursor.execute(query, (user_login,))
-            user = cursor.fetchone()
-            if not user:
-                self.error_label.setText("Неверный логин или пароль. Проверьте данные.")
-                cursor.close()
-                connection.close()
-                return
-
-            (user_id, first_name, last_name, db_password,
-             block, login_date, failed_attempts, position_id) = user
-
-            if block == 1:
-                self.error_label.setText("Вы заблокированы. Обратитесь к администратору")
-                cursor.close()
-                connection.close()
-                return
-
-            if login_date and (datetime.now() - login_date) > timedelta(days=LOGIN_BLOCK_PERIOD_DAYS):
-                cursor.execute("UPDATE Users SET block = 1 WHERE user_id = %s", (user_id,))
-                connection.commit()
-                self.error_label.setText("Вы заблокированы. Обратитесь к администратору")
-                cursor.close()
-                connection.close()
-                return
-
-            if user_password != db_password:
-                failed_attempts = (failed_attempts or 0) + 1
-                if failed_attempts >= MAX_FAILED_ATTEMPTS:
-                    cursor.execute("UPDATE Users SET block = 1, failed_attempts = 0 WHERE user_id = %s", (user_id,))
-                    connection.commit()
-                    self.error_label.setText("Вы заблокированы. Обратитесь к администратору")
-                else:
-                    cursor.execute("UPDATE Users SET failed_attempts = %s WHERE user_id = %s", (failed_attempts, user_id))
-                    connection.commit()
-                    self.error_label.setText("Неверный логин или пароль. Проверьте данные.")
-                cursor.close()
-                connection.close()
-                return
-
-            cursor.execute("UPDATE Users SET failed_attempts = 0, login_date = %s WHERE user_id = %s",
-                           (datetime.now(), user_id))
-            connection.commit()
-            cursor.close()
-            connection.close()
-
+        # Лишние попытки отсекаются до БД; неудачи копятся в login_throttle до блокировки
+        wait = login_throttle.acquire(user_login)
+        if wait:
+            self.error_label.setText(f"Слишком много попыток входа. Повторите через {math.ceil(wait)} с")
+            return
+        pending_failures = login_throttle.pending(user_login)
+
+        # Миграции применяет "main.py admin migrate"; прогрев (startup.prewarm) их не запускает
+        def check_credentials(connection):
+            with autocommit(connection):
+                return repository.login(connection, user_login, user_password, MAX_FAILED_ATTEMPTS,
+                                        LOGIN_BLOCK_PERIOD_DAYS, DEFAULT_PASSWORD, pending_failures)
+
+        self.login_button.setEnabled(False)
+        run_db(self, check_credentials, lambda result: self.on_authenticated(user_login, result),
+               self.on_authentication_error, busy=self.busy_indicator, tag="authenticate_user")
+
+    def on_authenticated(self, user_login, result):
+        status, *profile, must_change_password = result
+        login_throttle.record(user_login, status)
+        self.login_button.setEnabled(True)
+        if status == "ok":
+            audit_log.set_actor(profile[0])
+        audit_log.record(f"login_{status}", user_login)
+        if status == "blocked":
+            self.error_label.setText("Вы заблокированы. Обратитесь к администратору")
+        elif status == "invalid":
+            self.error_label.setText("Неверный логин или пароль. Проверьте данные.")
+        else:
+            profile = UserProfile(*profile)
+            self.login_button.setEnabled(False)
             self.error_label.setStyleSheet("color: green;")
             self.error_label.setText("Авторизация успешна")
-            QTimer.singleShot(1000, lambda: self.open_next_window(user_id, position_id))
-        except Exception as e:
-            self.error_label.setText(f"Ошибка подключения к БД: {e}")
-
-    def open_next_window(self, user_id, position_id):
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("SELECT user_password FROM Users WHERE user_id = %s", (user_id,))
-            pwd = cursor.fetchone()[0]
-            cursor.close()
-            connection.close()
-            if pwd == DEFAULT_PASSWORD:
-                QMessageBox.information(self, "Смена пароля", "При первом входе требуется сменить пароль")
-                self.change_password_window = ChangePasswordWindow(user_id)
-                self.change_password_window.show()
-            else:
-                self.main_window = MainWindow(user_id, position_id)
-                self.main_window.show()
-            self.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка открытия окна: {e}")
+            QTimer.singleShot(1000, lambda: self.open_next_window(user_login, profile, must_change_password))
+
+    def on_authentication_error(self, error):
+        self.login_button.setEnabled(True)
+        self.error_label.setText(f"Ошибка подключения к БД: {error}")
+
+    def open_next_window(self, user_login, profile, must_change_password):
+        if must_change_password:
+            QMessageBox.information(self, "Смена пароля", "При первом входе требуется сменить пароль")
+            self.change_password_window = ChangePasswordWindow(profile.user_id, user_login, profile)
+            self.change_password_window.show()
+        else:
+            self.main_window = MainWindow(profile.user_id, profile.position_id, profile)
+            self.main_window.show()
+        self.close()
 
     def open_change_password(self):
         user_login = self.login_input.text().strip()
         if not user_login:
             QMessageBox.warning(self, "Внимание", "Введите логин для смены пароля")
             return
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("SELECT user_id FROM Users WHERE user_login = %s", (user_login,))
-            result = cursor.fetchone()
-            cursor.close()
-            connection.close()
-            if result:
-                user_id = result[0]
-                self.change_password_window = ChangePasswordWindow(user_id)
+
+        def show_window(user):
+            if user:
+                self.change_password_window = ChangePasswordWindow(user.user_id, user_login)
                 self.change_password_window.show()
             else:
                 QMessageBox.warning(self, "Ошибка", "Пользователь не найден")
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка: {e}")
+
+        run_db(self, lambda connection: repository.get_user_by_login(connection, user_login), show_window,
+               lambda e: QMessageBox.critical(self, "Ошибка", f"Ошибка: {e}"),
+               busy=self.busy_indicator, tag="open_change_password", read_only=True)
+
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        super().closeEvent(event)
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -203,10 +189,19 @@ class LoginWindow(QWidget):
             self.oldPos = event.globalPosition().toPoint()
 
 
+def offline_text(synced_at):
+    """Пометка для данных, показанных из локальной копии без связи с БД."""
+    if synced_at is None:
+        return "Нет связи с БД."
+    return f"Нет связи с БД. Показаны данные на {synced_at:%d.%m.%Y %H:%M}"
+
+
 class ChangePasswordWindow(QWidget):
-    def __init__(self, user_id):
+    def __init__(self, user_id, user_login, profile=None):
         super().__init__()
         self.user_id = user_id
+        self.user_login = user_login
+        self.profile = profile
         self.setWindowTitle("Смена пароля")
         self.resize(400, 300)
         self.center()
@@ -248,6 +243,9 @@ class ChangePasswordWindow(QWidget):
         self.change_button.clicked.connect(self.change_password)
         layout.addWidget(self.change_button)
 
+        self.busy_indicator = BusyIndicator()
+        layout.addWidget(self.busy_indicator)
+
         self.message_label = QLabel("")
         self.message_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.message_label)
@@ -265,37 +263,48 @@ class ChangePasswordWindow(QWidget):
             self.message_label.setText("Новые пароли не совпадают")
             return
 
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("SELECT user_password FROM Users WHERE user_id = %s", (self.user_id,))
-            db_current = cursor.fetchone()[0]
-            if current != db_current:
-                self.message_label.setText("Неверный текущий пароль")
-                cursor.close()
-                connection.close()
+        def show_result(status):
+            self.change_button.setEnabled(True)
+            if status != "ok":
+                self.message_label.setText(PASSWORD_CHANGE_ERRORS[status])
                 return
-            cursor.execute("UPDATE Users SET user_password = %s WHERE user_id = %s", (new, self.user_id))
-            connection.commit()
             self.message_label.setStyleSheet("color: green;")
             self.message_label.setText("Пароль успешно изменён")
-            cursor.close()
-            connection.close()
             QTimer.singleShot(1500, self.open_main_window)
-        except Exception as e:
-            self.message_label.setText(f"Ошибка: {e}")
+
+        def show_error(error):
+            self.change_button.setEnabled(True)
+            self.message_label.setText(f"Ошибка: {error}")
+
+        # Форма доступна с экрана входа: попытки ограничиваются и учитываются как попытки входа
+        refused = submit_password_change(self, self.user_login, self.user_id, current, new, show_result, show_error,
+                                         busy=self.busy_indicator)
+        if refused:
+            self.message_label.setText(refused)
+            return
+        self.change_button.setEnabled(False)
 
     def open_main_window(self):
-        self.main_window = MainWindow(self.user_id, None)
+        position_id = self.profile.position_id if self.profile else None
+        self.main_window = MainWindow(self.user_id, position_id, self.profile)
         self.main_window.show()
         self.close()
 
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        super().closeEvent(event)
+
 
 class MainWindow(QWidget):
-    def __init__(self, user_id, position_id):
+    def __init__(self, user_id, position_id, profile=None):
         super().__init__()
         self.user_id = user_id
         self.position_id = position_id
+        self.profile = profile
+        self.home_panel = None
+        self.panels = {}
+        self.staff_model = None
+        self.listener_slots = []
         self.setWindowTitle("Рабочий стол HOTEL CompanyName")
         self.resize(1000, 700)
         self.setMinimumSize(600, 500)
@@ -329,53 +338,114 @@ class MainWindow(QWidget):
         top_bar.addWidget(self.close_button)
         main_layout.addLayout(top_bar)
 
-        self.content_layout = QVBoxLayout()
-        main_layout.addLayout(self.content_layout)
+        self.busy_indicator = BusyIndicator()
+        main_layout.addWidget(self.busy_indicator)
+
+        self.stack = QStackedWidget()
+        self.stack.currentChanged.connect(self.on_panel_changed)
+        main_layout.addWidget(self.stack)
         self.setLayout(main_layout)
 
-        self.display_user_info()
+        if self.profile:
+            self.apply_user_info(self.profile)
+        else:
+            self.display_user_info()
+
+    def run_db(self, fn, on_result=None, on_error=None, tag=None, read_only=False):
+        return run_db(self, fn, on_result, on_error, busy=self.busy_indicator, tag=tag, read_only=read_only)
 
     def display_user_info(self):
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT first_name, last_name, email, position_id 
-                FROM Users WHERE user_id = %s
-            """, (self.user_id,))
-            user = cursor.fetchone()
-            if user:
-                first_name, last_name, email, pos_id = user
-                if not self.position_id:
-                    self.position_id = pos_id
-                cursor.execute("SELECT position_name FROM Position WHERE position_id = %s", (self.position_id,))
-                pos = cursor.fetchone()
-                pos_name = pos[0] if pos else ""
-                self.user_info_label.setText(f"{pos_name}: {first_name} {last_name} ({email})")
-
-                role_lower = pos_name.lower()
-                if role_lower == "администратор":
-                    self.show_admin_panel()
-                elif role_lower == "менеджер":
-                    self.show_manager_panel()
-                elif role_lower == "пользователь":
-                    self.show_user_panel()
-                elif role_lower == "персонал":
-                    self.show_staff_panel()
-                else:
-                    self.show_change_password_form()
-
-            cursor.close()
-            connection.close()
-        except Exception as e:
-            self.user_info_label.setText(f"Ошибка загрузки данных: {e}")
-
-    def clear_content_layout(self):
-        clear_layout(self.content_layout)
+        def load_user(connection):
+            user = repository.get_user(connection, self.user_id)
+            if not user:
+                return None
+            position_id = self.position_id or user.position_id
+            pos = reference_cache.load("position", connection).get(position_id)
+            return UserProfile(self.user_id, user.first_name, user.last_name, user.email, position_id,
+                               pos[1] if pos else "")
+
+        self.run_db(load_user, self.apply_user_info,
+                    lambda e: self.user_info_label.setText(f"Ошибка загрузки данных: {e}"),
+                    tag="display_user_info", read_only=True)
+
+    def apply_user_info(self, profile):
+        if not profile:
+            return
+        self.profile = profile
+        self.position_id = profile.position_id
+        pos_name = profile.position_name or ""
+        self.user_info_label.setText(f"{pos_name}: {profile.first_name} {profile.last_name} ({profile.email})")
+
+        self.home_panel = position_role(profile.position_id, pos_name) or "change_password"
+        self.show_home_panel()
+
+    def show_panel(self, name):
+        """Переключает на панель name, создавая её при первом обращении."""
+        panel = self.panels.get(name)
+        if panel is None:
+            panel = getattr(self, f"build_{name}_panel")()
+            self.panels[name] = panel
+            self.stack.addWidget(panel)
+        self.stack.setCurrentWidget(panel)
+        return panel
+
+    def on_panel_changed(self, index):
+        # Скрытый список персонала не держит соединение и транзакцию курсора
+        if self.staff_model is None:
+            return
+        if self.stack.widget(index) is self.panels.get("staff_list"):
+            self.staff_model.resume()
+        else:
+            self.staff_model.release()
+
+    def show_home_panel(self):
+        if self.home_panel:
+            self.show_panel(self.home_panel)
 
     def show_admin_panel(self):
-        self.clear_content_layout()
-        admin_layout = QVBoxLayout()
+        self.show_panel("admin")
+
+    def show_manager_panel(self):
+        self.show_panel("manager")
+
+    def show_staff_list(self):
+        self.show_panel("staff_list")
+
+    def show_user_panel(self):
+        self.show_panel("user")
+
+    def order_service(self):
+        self.show_panel("order_service")
+
+    def show_staff_panel(self):
+        self.show_panel("staff")
+
+    def show_schedule(self):
+        self.show_panel("schedule")
+
+    def show_change_password_form(self):
+        self.show_panel("change_password")
+
+    def listen(self, on_notification, on_reconnected):
+        """Подписывает панель на уведомления БД; подписка снимается при закрытии окна."""
+        listener = get_listener()
+        for signal, slot in ((listener.notified, on_notification), (listener.reconnected, on_reconnected)):
+            signal.connect(slot)
+            self.listener_slots.append((signal, slot))
+
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        for signal, slot in self.listener_slots:
+            signal.disconnect(slot)
+        self.listener_slots = []
+        if self.staff_model is not None:
+            self.staff_model.close()
+            self.staff_model = None
+        super().closeEvent(event)
+
+    def build_admin_panel(self):
+        panel = QWidget()
+        admin_layout = QVBoxLayout(panel)
 
         button_layout = QHBoxLayout()
         add_user_btn = QPushButton("Добавить пользователя")
@@ -389,55 +459,54 @@ class MainWindow(QWidget):
         block_btn = QPushButton("Заблокировать")
         block_btn.clicked.connect(self.block_user)
         button_layout.addWidget(block_btn)
+
+        bulk_block_btn = QPushButton("Массовая блокировка")
+        bulk_block_btn.clicked.connect(self.open_bulk_block_window)
+        button_layout.addWidget(bulk_block_btn)
         admin_layout.addLayout(button_layout)
 
         info_label = QLabel("Админ: здесь можно редактировать пользователей")
         info_label.setAlignment(Qt.AlignCenter)
         admin_layout.addWidget(info_label)
 
-        self.content_layout.addLayout(admin_layout)
+        return panel
 
     def open_add_user_window(self):
         self.add_user_window = AdminAddUserWindow()
         self.add_user_window.show()
 
+    def open_bulk_block_window(self):
+        self.bulk_block_window = AdminBulkBlockWindow()
+        self.bulk_block_window.show()
+
+    def set_user_block(self, login, block, success_text, error_prefix, tag):
+        def show_result(result):
+            found, changed = result
+            if found:
+                audit_log.record("user_blocked" if block else "user_unblocked", login, changed=changed)
+            if not found:
+                QMessageBox.warning(self, "Ошибка", "Пользователь не найден")
+            else:
+                QMessageBox.information(self, "Успех", success_text)
+
+        self.run_db(lambda connection: set_block(connection, block, logins=[login]), show_result,
+                    lambda e: QMessageBox.critical(self, "Ошибка", f"{error_prefix}: {e}"), tag=tag)
+
     def unblock_user(self):
         login, ok = QInputDialog.getText(self, "Разблокировка", "Введите логин пользователя:")
         if ok and login:
-            try:
-                connection = db_connect()
-                cursor = connection.cursor()
-                cursor.execute("UPDATE Users SET block = 0, failed_attempts = 0 WHERE user_login = %s", (login,))
-                if cursor.rowcount == 0:
-                    QMessageBox.warning(self, "Ошибка", "Пользователь не найден")
-                else:
-                    connection.commit()
-                    QMessageBox.information(self, "Успех", "Пользователь разблокирован")
-                cursor.close()
-                connection.close()
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Ошибка разблокировки: {e}")
+            self.set_user_block(login, False, "Пользователь разблокирован", "Ошибка разблокировки",
+                                "unblock_user")
 
     def block_user(self):
         login, ok = QInputDialog.getText(self, "Блокировка", "Введите логин пользователя для блокировки:")
         if ok and login:
-            try:
-                connection = db_connect()
-                cursor = connection.cursor()
-                cursor.execute("UPDATE Users SET block = 1 WHERE user_login = %s", (login,))
-                if cursor.rowcount == 0:
-                    QMessageBox.warning(self, "Ошибка", "Пользователь не найден")
-                else:
-                    connection.commit()
-                    QMessageBox.information(self, "Успех", "Пользователь заблокирован")
-                cursor.close()
-                connection.close()
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Ошибка блокировки: {e}")
+            self.set_user_block(login, True, "Пользователь заблокирован", "Ошибка блокировки",
+                                "block_user")
 
-    def show_manager_panel(self):
-        self.clear_content_layout()
-        layout = QVBoxLayout()
+    def build_manager_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
         title = QLabel("Управление персоналом (Менеджер)")
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
@@ -446,47 +515,101 @@ class MainWindow(QWidget):
         staff_button.clicked.connect(self.show_staff_list)
         layout.addWidget(staff_button)
 
+        roster_button = QPushButton("Составить график")
+        roster_button.clicked.connect(self.open_roster_window)
+        layout.addWidget(roster_button)
+
+        schedule_export_button = QPushButton("Выгрузить расписание")
+        schedule_export_button.clicked.connect(self.open_schedule_export_window)
+        layout.addWidget(schedule_export_button)
+
         back_button = QPushButton("Назад")
-        back_button.clicked.connect(self.display_user_info)
+        back_button.clicked.connect(self.show_home_panel)
         layout.addWidget(back_button)
 
-        self.content_layout.addLayout(layout)
+        return panel
 
-    def show_staff_list(self):
-        self.clear_content_layout()
-        layout = QVBoxLayout()
+    def open_roster_window(self):
+        self.roster_window = RosterWindow()
+        self.roster_window.show()
+
+    def open_schedule_export_window(self):
+        self.schedule_export_window = ScheduleExportWindow()
+        self.schedule_export_window.show()
+
+    def export_staff_list(self):
+        from export import staff_report
+
+        search = self.staff_model.search
+        sort_column, descending = self.staff_model.sort_state()
+        start_export(self, lambda connection: staff_report(connection, search, sort_column, descending), "staff")
+
+    def build_staff_list_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
         title = QLabel("Список персонала")
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT u.first_name, u.last_name, u.email, p.position_name
-                FROM Users u
-                JOIN Position p ON u.position_id = p.position_id
-                WHERE LOWER(p.position_name) = 'персонал'
-            """)
-            staff = cursor.fetchall()
-            cursor.close()
-            connection.close()
-            if staff:
-                for person in staff:
-                    f_name, l_name, mail, pos_name = person
-                    lbl = QLabel(f"{f_name} {l_name} ({mail}) - {pos_name}")
-                    layout.addWidget(lbl)
-            else:
-                layout.addWidget(QLabel("Персонал не найден."))
-        except Exception as e:
-            layout.addWidget(QLabel(f"Ошибка: {e}"))
+
+        search_input = QLineEdit()
+        search_input.setPlaceholderText("Поиск: имя, фамилия, email или телефон")
+        search_input.setClearButtonEnabled(True)
+        layout.addWidget(search_input)
+
+        status_label = QLabel("")
+        status_label.hide()
+        layout.addWidget(status_label)
+
+        from local_cache import get_mirror
+        from models import StaffTableModel
+
+        self.staff_model = StaffTableModel(owner=self, busy=self.busy_indicator, mirror=get_mirror())
+        # Пока связи не было, уведомления терялись: после переподключения список перечитывается
+        self.listen(self.staff_model.handle_notification, self.staff_model.reload)
+        # Запрос уходит после паузы в наборе; новый запрос отменяет предыдущий
+        search_timer = QTimer(panel)
+        search_timer.setSingleShot(True)
+        search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        search_timer.timeout.connect(lambda: self.staff_model.set_search(search_input.text()))
+        search_input.textChanged.connect(search_timer.start)
+        table = QTableView()
+        table.setModel(self.staff_model)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.verticalHeader().hide()
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.horizontalHeader().setSortIndicator(1, Qt.AscendingOrder)
+        layout.addWidget(table)
+
+        def show_status(text):
+            status_label.setText(text)
+            status_label.show()
+
+        self.staff_model.first_page_loaded.connect(
+            lambda count: show_status("Ничего не найдено." if self.staff_model.search else "Персонал не найден.")
+            if not count else status_label.hide())
+        self.staff_model.load_failed.connect(
+            lambda e: show_status(offline_text(self.staff_model.synced_at()) if self.staff_model.stale
+                                  else f"Ошибка: {e}"))
+        # Включение сортировки сразу запрашивает первую страницу по текущему индикатору
+        table.setSortingEnabled(True)
+
+        refresh_button = QPushButton("Обновить")
+        refresh_button.clicked.connect(self.staff_model.reload)
+        layout.addWidget(refresh_button)
+
+        export_button = QPushButton("Экспорт...")
+        export_button.clicked.connect(self.export_staff_list)
+        layout.addWidget(export_button)
+
         back_button = QPushButton("Назад")
         back_button.clicked.connect(self.show_manager_panel)
         layout.addWidget(back_button)
-        self.content_layout.addLayout(layout)
+        return panel
 
-    def show_user_panel(self):
-        self.clear_content_layout()
-        layout = QVBoxLayout()
+    def build_user_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
         title = QLabel("Заказ услуг (Пользователь)")
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
@@ -496,13 +619,13 @@ class MainWindow(QWidget):
         layout.addWidget(order_button)
 
         back_button = QPushButton("Назад")
-        back_button.clicked.connect(self.display_user_info)
+        back_button.clicked.connect(self.show_home_panel)
         layout.addWidget(back_button)
-        self.content_layout.addLayout(layout)
+        return panel
 
-    def order_service(self):
-        self.clear_content_layout()
-        layout = QVBoxLayout()
+    def build_order_service_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
         title = QLabel("Оформление заказа")
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
@@ -510,11 +633,11 @@ class MainWindow(QWidget):
         back_button = QPushButton("Назад")
         back_button.clicked.connect(self.show_user_panel)
         layout.addWidget(back_button)
-        self.content_layout.addLayout(layout)
+        return panel
 
-    def show_staff_panel(self):
-        self.clear_content_layout()
-        layout = QVBoxLayout()
+    def build_staff_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
         title = QLabel("Расписание (Персонал)")
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
@@ -524,45 +647,72 @@ class MainWindow(QWidget):
         layout.addWidget(schedule_button)
 
         back_button = QPushButton("Назад")
-        back_button.clicked.connect(self.display_user_info)
+        back_button.clicked.connect(self.show_home_panel)
         layout.addWidget(back_button)
-        self.content_layout.addLayout(layout)
+        return panel
 
-    def show_schedule(self):
-        self.clear_content_layout()
-        layout = QVBoxLayout()
+    def build_schedule_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
         title = QLabel("Ваше расписание")
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT work_date, shift_start, shift_end
-                FROM StaffSchedule
-                WHERE user_id = %s
-                ORDER BY work_date
-            """, (self.user_id,))
-            schedule_rows = cursor.fetchall()
-            cursor.close()
-            connection.close()
-            if schedule_rows:
-                for row in schedule_rows:
-                    work_date, shift_start, shift_end = row
-                    lbl = QLabel(f"Дата: {work_date}, смена: {shift_start} - {shift_end}")
-                    layout.addWidget(lbl)
+
+        from local_cache import get_mirror
+        from models import ScheduleTableModel
+
+        model = ScheduleTableModel(self.user_id, owner=self, busy=self.busy_indicator, mirror=get_mirror())
+        self.listen(model.handle_notification, model.refresh)
+        table = QTableView()
+        table.setModel(model)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().hide()
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(table)
+
+        status_label = QLabel("Загрузка...")
+        status_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(status_label)
+
+        pager_layout = QHBoxLayout()
+        previous_button = QPushButton("← Раньше")
+        previous_button.clicked.connect(model.previous_page)
+        pager_layout.addWidget(previous_button)
+        next_button = QPushButton("Позже →")
+        next_button.clicked.connect(model.next_page)
+        pager_layout.addWidget(next_button)
+        layout.addLayout(pager_layout)
+
+        def update_pager():
+            previous_button.setEnabled(model.has_previous())
+            next_button.setEnabled(model.has_next())
+            date_range = model.date_range()
+            if date_range:
+                text = f"С {date_range[0]} по {date_range[1]}"
             else:
-                layout.addWidget(QLabel("Расписание не найдено."))
-        except Exception as e:
-            layout.addWidget(QLabel(f"Ошибка: {e}"))
+                text = "Расписание не найдено."
+            if model.stale:
+                text += "\n" + offline_text(model.synced_at())
+            status_label.setText(text)
+
+        model.page_changed.connect(update_pager)
+        model.load_failed.connect(lambda e: status_label.setText(f"Ошибка: {e}"))
+        previous_button.setEnabled(False)
+        next_button.setEnabled(False)
+        model.load_around()
+
+        refresh_button = QPushButton("Обновить")
+        refresh_button.clicked.connect(lambda: model.load_around())
+        layout.addWidget(refresh_button)
+
         back_button = QPushButton("Назад")
         back_button.clicked.connect(self.show_staff_panel)
         layout.addWidget(back_button)
-        self.content_layout.addLayout(layout)
+        return panel
 
-    def show_change_password_form(self):
-        self.clear_content_layout()
-        form_layout = QVBoxLayout()
+    def build_change_password_panel(self):
+        panel = QWidget()
+        form_layout = QVBoxLayout(panel)
         title = QLabel("Изменить пароль")
         title.setAlignment(Qt.AlignCenter)
         form_layout.addWidget(title)
@@ -590,7 +740,7 @@ class MainWindow(QWidget):
         self.pass_message.setAlignment(Qt.AlignCenter)
         form_layout.addWidget(self.pass_message)
 
-        self.content_layout.addLayout(form_layout)
+        return panel
 
     def change_password(self):
         current = self.current_password.text().strip()
@@ -602,32 +752,34 @@ class MainWindow(QWidget):
         if new != repeat:
             self.pass_message.setText("Новые пароли не совпадают")
             return
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("SELECT user_password FROM Users WHERE user_id = %s", (self.user_id,))
-            db_current = cursor.fetchone()[0]
-            if current != db_current:
-                self.pass_message.setText("Неверный текущий пароль")
-                cursor.close()
-                connection.close()
+
+        def show_result(status):
+            if status != "ok":
+                self.pass_message.setText(PASSWORD_CHANGE_ERRORS[status])
                 return
-            cursor.execute("UPDATE Users SET user_password = %s WHERE user_id = %s", (new, self.user_id))
-            connection.commit()
             self.pass_message.setStyleSheet("color: green;")
             self.pass_message.setText("Пароль успешно изменён")
-            cursor.close()
-            connection.close()
-        except Exception as e:
-            self.pass_message.setText(f"Ошибка: {e}")
+
+        # Логин здесь неизвестен: попытки считаются по user_id
+        refused = submit_password_change(self, f"#{self.user_id}", self.user_id, current, new, show_result,
+                                         lambda e: self.pass_message.setText(f"Ошибка: {e}"),
+                                         busy=self.busy_indicator)
+        if refused:
+            self.pass_message.setText(refused)
 
 
 class AdminAddUserWindow(QWidget):
-    """Окно добавления пользователя (только для администратора)."""
+    """Окно добавления пользователей (только для администратора).
+
+    Пользователи копятся в очереди и добавляются одной транзакцией; строки
+    с ошибками остаются в очереди с текстом ошибки.
+    """
     def __init__(self):
         super().__init__()
-        self.setWindowTitle("Добавить пользователя")
-        self.resize(400, 400)
+        self.setWindowTitle("Добавить пользователей")
+        self.resize(400, 560)
+        self.pending = []
+        self.pending_errors = []
         self.center()
         self.init_ui()
 
@@ -657,79 +809,573 @@ class AdminAddUserWindow(QWidget):
         layout.addRow("Логин:", self.login_input)
 
         self.position_combo = QComboBox()
-        try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            cursor.execute("SELECT position_id, position_name FROM Position")
-            positions = cursor.fetchall()
-            for pos in positions:
-                self.position_combo.addItem(pos[1], pos[0])
-            cursor.close()
-            connection.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки должностей: {e}")
         layout.addRow("Должность:", self.position_combo)
 
-        self.add_btn = QPushButton("Добавить пользователя")
-        self.add_btn.clicked.connect(self.add_user)
+        self.queue_btn = QPushButton("В очередь")
+        self.queue_btn.clicked.connect(self.queue_user)
+        layout.addWidget(self.queue_btn)
+
+        self.queue_list = QListWidget()
+        self.queue_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        layout.addRow("Очередь:", self.queue_list)
+
+        self.remove_btn = QPushButton("Убрать из очереди")
+        self.remove_btn.clicked.connect(self.remove_queued)
+        layout.addWidget(self.remove_btn)
+
+        self.add_btn = QPushButton("Добавить пользователей")
+        self.add_btn.clicked.connect(self.add_users)
         layout.addWidget(self.add_btn)
 
+        self.import_btn = QPushButton("Импорт из файла...")
+        self.import_btn.clicked.connect(self.import_users)
+        layout.addWidget(self.import_btn)
+
+        self.busy_indicator = BusyIndicator()
+        layout.addRow(self.busy_indicator)
+
         self.message_label = QLabel("")
         self.message_label.setAlignment(Qt.AlignCenter)
         layout.addRow(self.message_label)
 
         self.setLayout(layout)
-
-    def add_user(self):
-        first_name = self.first_name_input.text().strip()
-        last_name = self.last_name_input.text().strip()
-        phone = self.phone_input.text().strip()
-        email = self.email_input.text().strip()
-        user_login = self.login_input.text().strip()
+        fill_positions(self, self.position_combo, self.busy_indicator)
+
+    def form_fields(self):
+        return (self.first_name_input, self.last_name_input, self.phone_input, self.email_input,
+                self.login_input)
+
+    def read_form(self):
+        """Пользователь из формы для очереди; при ошибке проверки показывает её и возвращает None."""
+        from bulk_import import validate_user
+
+        first_name, last_name, phone, email, user_login = (field.text().strip() for field in self.form_fields())
+        error = validate_user(first_name, last_name, phone, email, user_login)
+        if error:
+            self.message_label.setStyleSheet("color: red;")
+            self.message_label.setText(error)
+            return None
+        return first_name, last_name, phone, email, user_login, self.position_combo.currentData()
+
+    def queue_form(self):
+        user = self.read_form()
+        if user is None:
+            return False
+        self.pending.append(user)
+        self.pending_errors.append(None)
+        for field in self.form_fields():
+            field.clear()
+        self.first_name_input.setFocus()
+        self.show_queue()
+        return True
+
+    def queue_user(self):
+        if self.queue_form():
+            self.message_label.setText("")
+
+    def remove_queued(self):
+        for row in sorted({index.row() for index in self.queue_list.selectedIndexes()}, reverse=True):
+            del self.pending[row]
+            del self.pending_errors[row]
+        self.show_queue()
+
+    def show_queue(self):
+        self.queue_list.clear()
+        for (first_name, last_name, _, _, user_login, position_id), error in zip(self.pending, self.pending_errors):
+            position = reference_cache.get("position", position_id)
+            text = f"{last_name} {first_name} ({user_login}, {position[1] if position else position_id})"
+            item = QListWidgetItem(f"{text}: {error}" if error else text)
+            if error:
+                item.setForeground(Qt.red)
+            self.queue_list.addItem(item)
+        self.add_btn.setText(f"Добавить пользователей ({len(self.pending)})" if self.pending
+                             else "Добавить пользователей")
+
+    def set_queue_enabled(self, enabled):
+        for button in (self.queue_btn, self.remove_btn, self.add_btn):
+            button.setEnabled(enabled)
+
+    def add_users(self):
+        # Заполненная форма попадает в очередь: одного пользователя можно добавить одним нажатием
+        if any(field.text().strip() for field in self.form_fields()) and not self.queue_form():
+            return
+        if not self.pending:
+            self.message_label.setStyleSheet("color: red;")
+            self.message_label.setText("Очередь пуста")
+            return
+        users = list(self.pending)
+
+        def insert_users(connection):
+            started = time.perf_counter()
+            results = repository.insert_users(connection, users, DEFAULT_PASSWORD)
+            return results, time.perf_counter() - started
+
+        self.set_queue_enabled(False)
+        run_db(self, insert_users, lambda result: self.on_users_added(users, *result), self.on_add_user_error,
+               busy=self.busy_indicator, tag="add_users")
+
+    def on_users_added(self, users, results, elapsed):
+        self.set_queue_enabled(True)
+        self.pending = []
+        self.pending_errors = []
+        inserted = 0
+        for user, error in zip(users, results):
+            if error is None:
+                inserted += 1
+                audit_log.record("user_added", user[4], position_id=user[5])
+            else:
+                self.pending.append(user)
+                self.pending_errors.append(error[1])
+        self.show_queue()
+        text = f"Добавлено: {inserted} из {len(users)} за {elapsed:.2f} с"
+        if self.pending:
+            self.message_label.setStyleSheet("color: red;")
+            self.message_label.setText(f"{text}. Строки с ошибками остались в очереди")
+        else:
+            self.message_label.setStyleSheet("color: green;")
+            self.message_label.setText(text)
+
+    def on_add_user_error(self, e):
+        # Транзакция откатилась целиком: очередь не изменилась
+        self.set_queue_enabled(True)
+        self.message_label.setStyleSheet("color: red;")
+        self.message_label.setText(f"Ошибка: {e}")
+
+    def import_users(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Импорт пользователей", "", "Таблицы (*.csv *.xlsx);;CSV (*.csv);;Excel (*.xlsx)")
+        if not path:
+            return
         position_id = self.position_combo.currentData()
+        from bulk_import import import_users, read_rows
+
+        def run_import(connection):
+            return import_users(connection, read_rows(path), DEFAULT_PASSWORD, position_id)
+
+        self.set_queue_enabled(False)
+        self.import_btn.setEnabled(False)
+        run_db(self, run_import, lambda report: self.on_users_imported(path, report), self.on_import_error,
+               busy=self.busy_indicator, timeout=IMPORT_TIMEOUT, tag="import_users")
+
+    def on_users_imported(self, path, report):
+        audit_log.record("users_imported", file=os.path.basename(path),
+                         position_id=self.position_combo.currentData(),
+                         total=report.total, inserted=report.inserted, rejected=report.rejected)
+        self.set_queue_enabled(True)
+        self.import_btn.setEnabled(True)
+        self.message_label.setStyleSheet("color: green;" if not report.issues else "color: red;")
+        self.message_label.setText(report.summary())
+        if report.issues:
+            box = QMessageBox(QMessageBox.Warning, "Импорт пользователей", report.summary(), parent=self)
+            box.setInformativeText("Строки с ошибками не добавлены.")
+            box.setDetailedText("\n".join(
+                f"Строка {issue.row_no}: {issue.message}" for issue in report.issues))
+            box.exec()
+
+    def on_import_error(self, e):
+        self.set_queue_enabled(True)
+        self.import_btn.setEnabled(True)
+        self.message_label.setStyleSheet("color: red;")
+        self.message_label.setText(f"Ошибка импорта: {e}")
+
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        super().closeEvent(event)
+
+
+class AdminBulkBlockWindow(QWidget):
+    """Блокировка и разблокировка группы пользователей по списку логинов или критериям."""
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Массовая блокировка")
+        self.resize(400, 450)
+        self.center()
+        self.init_ui()
 
-        user_password = DEFAULT_PASSWORD
+    def center(self):
+        screen = QGuiApplication.primaryScreen().availableGeometry()
+        size = self.frameGeometry()
+        self.move(
+            screen.center().x() - size.width() // 2,
+            screen.center().y() - size.height() // 2
+        )
 
-        if not (first_name and last_name and phone and email and user_login):
-            self.message_label.setText("Все поля обязательны для заполнения")
-            return
+    def init_ui(self):
+        layout = QFormLayout()
+        self.logins_input = QPlainTextEdit()
+        self.logins_input.setPlaceholderText("По одному логину в строке (можно оставить пустым)")
+        layout.addRow("Логины:", self.logins_input)
+
+        self.position_combo = QComboBox()
+        self.position_combo.addItem("Любая", None)
+        layout.addRow("Должность:", self.position_combo)
+
+        self.inactive_days_input = QSpinBox()
+        self.inactive_days_input.setRange(0, 3650)
+        self.inactive_days_input.setSpecialValueText("не учитывать")
+        layout.addRow("Не входил дней:", self.inactive_days_input)
+
+        button_layout = QHBoxLayout()
+        self.block_btn = QPushButton("Заблокировать")
+        self.block_btn.clicked.connect(lambda: self.apply(True))
+        button_layout.addWidget(self.block_btn)
 
-        if not phone.isdigit():
-            self.message_label.setText("Телефон должен содержать только цифры")
+        self.unblock_btn = QPushButton("Снять блокировку")
+        self.unblock_btn.clicked.connect(lambda: self.apply(False))
+        button_layout.addWidget(self.unblock_btn)
+        layout.addRow(button_layout)
+
+        self.busy_indicator = BusyIndicator()
+        layout.addRow(self.busy_indicator)
+
+        self.message_label = QLabel("")
+        self.message_label.setAlignment(Qt.AlignCenter)
+        self.message_label.setWordWrap(True)
+        layout.addRow(self.message_label)
+
+        self.setLayout(layout)
+        fill_positions(self, self.position_combo, self.busy_indicator)
+
+    def apply(self, block):
+        logins = [line.strip() for line in self.logins_input.toPlainText().splitlines() if line.strip()]
+        position_id = self.position_combo.currentData()
+        inactive_days = self.inactive_days_input.value() or None
+        if not logins and position_id is None and inactive_days is None:
+            self.message_label.setStyleSheet("color: red;")
+            self.message_label.setText("Укажите логины или хотя бы один критерий")
             return
 
+        def update(connection):
+            return set_block(connection, block, logins=logins or None,
+                             position_id=position_id, inactive_days=inactive_days)
+
+        def show_result(result):
+            found, changed = result
+            self.set_buttons_enabled(True)
+            audit_log.record("bulk_blocked" if block else "bulk_unblocked", logins=found,
+                             position_id=position_id, inactive_days=inactive_days, changed=changed)
+            text = f"Найдено: {len(found)}, изменено: {changed}"
+            missing = sorted(set(logins) - set(found))
+            if missing:
+                text += "\nНе найдены: " + ", ".join(missing)
+            self.message_label.setStyleSheet("color: red;" if missing else "color: green;")
+            self.message_label.setText(text)
+
+        def show_error(e):
+            self.set_buttons_enabled(True)
+            self.message_label.setStyleSheet("color: red;")
+            self.message_label.setText(f"Ошибка: {e}")
+
+        self.set_buttons_enabled(False)
+        run_db(self, update, show_result, show_error, busy=self.busy_indicator,
+               tag="bulk_block_user" if block else "bulk_unblock_user")
+
+    def set_buttons_enabled(self, enabled):
+        self.block_btn.setEnabled(enabled)
+        self.unblock_btn.setEnabled(enabled)
+
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        super().closeEvent(event)
+
+
+class RosterWindow(QWidget):
+    """Составление графика смен персонала на период по шаблонам."""
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Составление графика")
+        self.resize(450, 500)
+        self.center()
+        self.init_ui()
+
+    def center(self):
+        screen = QGuiApplication.primaryScreen().availableGeometry()
+        size = self.frameGeometry()
+        self.move(
+            screen.center().x() - size.width() // 2,
+            screen.center().y() - size.height() // 2
+        )
+
+    def init_ui(self):
+        layout = QFormLayout()
+        today = QDate.currentDate()
+        self.start_input = QDateEdit(today.addDays(1))
+        self.start_input.setCalendarPopup(True)
+        layout.addRow("С:", self.start_input)
+
+        self.end_input = QDateEdit(today.addMonths(1))
+        self.end_input.setCalendarPopup(True)
+        layout.addRow("По:", self.end_input)
+
+        self.templates_input = QPlainTextEdit()
+        self.templates_input.setPlaceholderText("По шаблону в строке, например:\n08:00-20:00 пн-пт\n20:00-08:00 сб,вс")
+        layout.addRow("Смены:", self.templates_input)
+
+        self.rotate_input = QCheckBox("Распределять сотрудников по сменам с недельной ротацией")
+        layout.addRow(self.rotate_input)
+
+        self.logins_input = QPlainTextEdit()
+        self.logins_input.setPlaceholderText("По одному логину в строке (пусто — весь персонал)")
+        layout.addRow("Сотрудники:", self.logins_input)
+
+        button_layout = QHBoxLayout()
+        self.check_btn = QPushButton("Проверить")
+        self.check_btn.clicked.connect(lambda: self.generate(dry_run=True))
+        button_layout.addWidget(self.check_btn)
+
+        self.save_btn = QPushButton("Сохранить график")
+        self.save_btn.clicked.connect(lambda: self.generate(dry_run=False))
+        button_layout.addWidget(self.save_btn)
+        layout.addRow(button_layout)
+
+        self.busy_indicator = BusyIndicator()
+        layout.addRow(self.busy_indicator)
+
+        self.message_label = QLabel("")
+        self.message_label.setAlignment(Qt.AlignCenter)
+        self.message_label.setWordWrap(True)
+        layout.addRow(self.message_label)
+
+        self.setLayout(layout)
+
+    def generate(self, dry_run):
+        from roster import format_conflict, generate_roster, parse_template
+
         try:
-            connection = db_connect()
-            cursor = connection.cursor()
-            query = """
-                INSERT INTO Users 
-                    (first_name, last_name, phone, email, user_login, user_password, position_id, created_at, block, failed_attempts)
-                VALUES 
-                    (%s, %s, %s, %s, %s, %s, %s, %s, 0, 0)
-            """
-            now = datetime.now()
-            cursor.execute(query, (first_name, last_name, phone, email, user_login, user_password, position_id, now))
-            connection.commit()
-            cursor.close()
-            connection.close()
-            self.message_label.setStyleSheet("color: green;")
-            self.message_label.setText("Пользователь успешно добавлен")
-        except psycopg2.Error as e:
-            error_message = str(e)
-            if "users_phone_key" in error_message:
-                self.message_label.setStyleSheet("color: red;")
-                self.message_label.setText("Ошибка: телефон уже используется")
-            elif "users_login_key" in error_message:
-                self.message_label.setStyleSheet("color: red;")
-                self.message_label.setText("Ошибка: логин уже существует")
+            templates = [parse_template(line) for line in self.templates_input.toPlainText().splitlines()
+                         if line.strip()]
+            if not templates:
+                raise ValueError("Укажите хотя бы один шаблон смены")
+        except ValueError as e:
+            self.show_message(str(e), error=True)
+            return
+        start = self.start_input.date().toPython()
+        end = self.end_input.date().toPython()
+        if end < start:
+            self.show_message("Дата окончания раньше даты начала", error=True)
+            return
+        logins = [line.strip() for line in self.logins_input.toPlainText().splitlines() if line.strip()]
+        rotate = self.rotate_input.isChecked()
+
+        def show_result(result):
+            self.set_buttons_enabled(True)
+            if dry_run:
+                text = f"Сотрудников: {len(result.employees)}, смен будет добавлено: " \
+                       f"{result.generated - len(result.conflicts)}"
             else:
-                self.message_label.setStyleSheet("color: red;")
-                self.message_label.setText(f"Ошибка: {error_message}")
+                text = f"Сотрудников: {len(result.employees)}, добавлено смен: {result.inserted}"
+            if result.conflicts:
+                text += f"\nПересечений пропущено: {len(result.conflicts)}"
+            if result.missing:
+                text += "\nНе найдены среди персонала: " + ", ".join(result.missing)
+            self.show_message(text, error=bool(result.conflicts or result.missing))
+            if result.conflicts:
+                box = QMessageBox(QMessageBox.Warning, "Составление графика", text, parent=self)
+                box.setInformativeText("Пересекающиеся смены не добавлены.")
+                box.setDetailedText("\n".join(format_conflict(conflict, result.employees)
+                                               for conflict in result.conflicts))
+                box.exec()
+
+        def show_error(e):
+            self.set_buttons_enabled(True)
+            self.show_message(f"Ошибка: {e}", error=True)
+
+        self.set_buttons_enabled(False)
+        run_db(self, lambda connection: generate_roster(connection, templates, start, end, logins=logins or None,
+                                                        rotate=rotate, dry_run=dry_run),
+               show_result, show_error, busy=self.busy_indicator, timeout=ROSTER_TIMEOUT,
+               tag="check_roster" if dry_run else "generate_roster")
+
+    def show_message(self, text, error=False):
+        self.message_label.setStyleSheet("color: red;" if error else "color: green;")
+        self.message_label.setText(text)
+
+    def set_buttons_enabled(self, enabled):
+        self.check_btn.setEnabled(enabled)
+        self.save_btn.setEnabled(enabled)
+
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        super().closeEvent(event)
+
+
+class ScheduleExportWindow(QWidget):
+    """Выгрузка расписания всего персонала за период в CSV или XLSX."""
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Выгрузка расписания")
+        self.resize(300, 150)
+        self.center()
+        self.init_ui()
+
+    def center(self):
+        screen = QGuiApplication.primaryScreen().availableGeometry()
+        size = self.frameGeometry()
+        self.move(
+            screen.center().x() - size.width() // 2,
+            screen.center().y() - size.height() // 2
+        )
+
+    def init_ui(self):
+        layout = QFormLayout()
+        today = QDate.currentDate()
+        self.start_input = QDateEdit(QDate(today.year(), today.month(), 1))
+        self.start_input.setCalendarPopup(True)
+        layout.addRow("С:", self.start_input)
+
+        self.end_input = QDateEdit(QDate(today.year(), today.month(), today.daysInMonth()))
+        self.end_input.setCalendarPopup(True)
+        layout.addRow("По:", self.end_input)
+
+        self.export_btn = QPushButton("Выгрузить...")
+        self.export_btn.clicked.connect(self.export)
+        layout.addRow(self.export_btn)
+        self.setLayout(layout)
+
+    def export(self):
+        start = self.start_input.date().toPython()
+        end = self.end_input.date().toPython()
+        if end < start:
+            QMessageBox.warning(self, "Ошибка", "Дата окончания раньше даты начала")
+            return
+        from export import schedule_report
+
+        start_export(self, lambda connection: schedule_report(start, end), f"schedule_{start}_{end}")
+
+    def closeEvent(self, event):
+        get_executor().cancel_owner(self)
+        super().closeEvent(event)
+
+
+PASSWORD_CHANGE_ERRORS = {
+    "invalid": "Неверный текущий пароль",
+    "blocked": "Вы заблокированы. Обратитесь к администратору",
+}
+
+
+def submit_password_change(owner, throttle_key, user_id, current, new, on_status, on_error, busy=None):
+    """Меняет пароль в фоне с тем же ограничением попыток и учётом неудач, что у входа.
+
+    Возвращает текст отказа, если попытку отсёк login_throttle; иначе on_status
+    получит итог repository.update_password ("ok", "invalid" или "blocked").
+    """
+    wait = login_throttle.acquire(throttle_key)
+    if wait:
+        return f"Слишком много попыток. Повторите через {math.ceil(wait)} с"
+    pending_failures = login_throttle.pending(throttle_key)
+
+    def done(status):
+        login_throttle.record(throttle_key, status)
+        audit_log.record("password_changed" if status == "ok" else f"password_change_{status}", user_id=user_id)
+        on_status(status)
+
+    run_db(owner, lambda connection: repository.update_password(connection, user_id, current, new,
+                                                                MAX_FAILED_ATTEMPTS, pending_failures),
+           done, on_error, busy=busy, tag="change_password")
+    return None
+
+
+def fill_positions(owner, combo, busy):
+    """Заполняет combo должностями из справочника; если он ещё не загружен — в фоне."""
+    def fill_combo(positions):
+        for pos in positions:
+            combo.addItem(pos[1], pos[0])
+
+    if reference_cache.is_loaded("position"):
+        fill_combo(reference_cache.rows("position"))
+        return
+    run_db(owner, lambda connection: list(reference_cache.load("position", connection).values()),
+           fill_combo,
+           lambda e: QMessageBox.critical(owner, "Ошибка", f"Ошибка загрузки должностей: {e}"),
+           busy=busy, tag="load_positions", read_only=True)
+
+
+def start_export(owner, build_report, default_name):
+    """Спрашивает файл и выгружает отчёт build_report(connection) в фоне с прогрессом и отменой."""
+    path, selected = QFileDialog.getSaveFileName(owner, "Экспорт", f"{default_name}.csv",
+                                                 "CSV (*.csv);;Excel (*.xlsx)")
+    if not path:
+        return None
+    if selected.startswith("Excel") and not path.lower().endswith(".xlsx"):
+        path += ".xlsx"
+    dialog = QProgressDialog("Выгрузка...", "Отмена", 0, 0, owner)
+    dialog.setWindowTitle("Экспорт")
+    dialog.setWindowModality(Qt.WindowModal)
+    dialog.setMinimumDuration(0)
+    dialog.setAutoClose(False)
+    dialog.setAutoReset(False)
+    from export import export_report
+
+    def show_progress(done, total):
+        if total:
+            dialog.setMaximum(total)
+            dialog.setValue(min(done, total))
+        dialog.setLabelText(f"Выгружено строк: {done} из {total}")
+
+    def show_result(rows):
+        dialog.close()
+        QMessageBox.information(owner, "Экспорт", f"Выгружено строк: {rows}\n{path}")
+
+    def show_error(e):
+        dialog.close()
+        QMessageBox.critical(owner, "Ошибка", f"Ошибка выгрузки: {e}")
+
+    request = get_executor().submit(
+        lambda connection: export_report(connection, build_report(connection), path, report_progress),
+        show_result, show_error, owner=owner, timeout=EXPORT_TIMEOUT, tag="export_report",
+        on_progress=show_progress)
+    dialog.canceled.connect(request.cancel)
+    request.finished.connect(dialog.close)
+    dialog.show()
+    return request
+
+
+def start_inactivity_sweep(parent):
+    """Периодически блокирует неактивных пользователей в фоне, вместо записи при входе."""
+    def sweep():
+        # Ошибки не показываем: следующий проход повторит работу
+        def record(blocked):
+            if blocked:
+                audit_log.record("inactivity_sweep", blocked=blocked)
+
+        get_executor().submit(lambda connection: sweep_inactive(connection, LOGIN_BLOCK_PERIOD_DAYS), record,
+                              timeout=INACTIVITY_SWEEP_TIMEOUT, tag="inactivity_sweep")
+
+    timer = QTimer(parent)
+    timer.setInterval(INACTIVITY_SWEEP_INTERVAL_MS)
+    timer.timeout.connect(sweep)
+    timer.start()
+    QTimer.singleShot(INACTIVITY_SWEEP_DELAY_MS, sweep)
+    return timer
+
+
+def start_background_services(app):
+    """Подписка на уведомления и периодические задачи; запускается после отрисовки экрана входа."""
+    listener = get_listener()
+    listener.notified.connect(reference_cache.handle_notification)
+    listener.reconnected.connect(reference_cache.invalidate)
+    listener.listen(REFERENCE_CHANNEL)
+    listener.listen(USERS_CHANNEL)
+    listener.listen(SCHEDULE_CHANNEL)
+    app.aboutToQuit.connect(listener.stop)
+    start_inactivity_sweep(app)
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    login_window = LoginWindow()
-    login_window.show()
+    with startup_profile.stage("QApplication"):
+        app = WatchedApplication(sys.argv)
+    # Журнал дописывается до закрытия пула соединений
+    app.aboutToQuit.connect(start_audit_log())
+    app.aboutToQuit.connect(close_pool)
+    configure_slow_query_log()
+    app.aboutToQuit.connect(start_metrics_dump())
+    app.aboutToQuit.connect(start_ui_watchdog())
+    # Соединение, миграции, справочники и подбор стоимости хэша готовятся, пока вводится пароль
+    start_prewarm()
+    with startup_profile.stage("экран входа"):
+        login_window = LoginWindow()
+        login_window.show()
+    startup_profile.watch_first_paint(login_window)
+    QTimer.singleShot(0, lambda: start_background_services(app))
     sys.exit(app.exec())
 #stable
\ No newline at end of file
@@ -0,0 +1,593 @@
+import json
+from datetime import date, time, timedelta
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, Signal
+
+import repository
+from listener import SCHEDULE_CHANNEL, USERS_CHANNEL
+from refcache import role_position_ids
+from workers import get_executor
+
+MIRROR_SYNC_TIMEOUT = 300
+
+
+class StaffTableModel(QAbstractTableModel):
+    """Список персонала, подгружаемый страницами из именованного (серверного) курсора.
+
+    В памяти держатся только строки, до которых пользователь долистал; сортировка
+    выполняется сервером заново открытым курсором. С локальной копией (mirror)
+    первая страница показывается из неё сразу, а без связи с БД остаётся на экране
+    с пометкой stale. Уведомления об изменении Users правят только затронутые строки.
+    Курсор и его транзакция (снимок данных) живут, только пока список догружается:
+    после последней страницы и при release() соединение возвращается в пул.
+    """
+
+    HEADERS = ("Имя", "Фамилия", "Email", "Должность")
+    PAGE_SIZE = 200
+    USER_ID_COLUMN = 4
+    # Столбцы ключа сортировки, как repository.STAFF_SORT_COLUMNS
+    SORT_KEYS = ((0,), (1, 0), (2,), (3,))
+
+    first_page_loaded = Signal(int)
+    load_failed = Signal(object)
+
+    def __init__(self, owner=None, busy=None, parent=None, mirror=None):
+        super().__init__(parent)
+        self.owner = owner
+        self.busy = busy
+        self.mirror = mirror
+        self.stale = False
+        self.search = ""
+        self._placeholder = False
+        self._sync_request = None
+        # Страницы списка читаются с реплики; строки из уведомлений (patch_staff_list) — с основного сервера
+        self._session = None
+        self._cursor = None
+        self._opened = False
+        self._reload_on_resume = False
+        self._rows = []
+        self._exhausted = True
+        self._request = None
+        self._sort_column = -1
+        self._sort_order = Qt.AscendingOrder
+        # user_id -> свежая строка (None — строка ушла из списка) с момента открытия курсора
+        self._patched = {}
+        self._generation = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self._rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and self._request is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        if self._cursor is None:
+            # Курсор закрыт release(): новый открывается за уже загруженными строками
+            loaded = len(self._rows)
+            self._submit(lambda connection: self._open_cursor(connection, loaded), first_page=False)
+        else:
+            self._submit(self._fetch_page, first_page=False)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if (column, order) == (self._sort_column, self._sort_order) and self._opened:
+            return
+        self._sort_column = column
+        self._sort_order = order
+        self.reload()
+
+    def reload(self):
+        """Открывает курсор заново и загружает первую страницу."""
+        if self._request is not None:
+            self._request.cancel()
+            self._request = None
+        self._generation += 1
+        self._opened = True
+        self._reload_on_resume = False
+        self._patched = {}
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = True
+        self._placeholder = False
+        if self.mirror is not None and not self.search:
+            self._rows = self.mirror.staff_page(self.PAGE_SIZE, self._sort_column,
+                                                self._sort_order == Qt.DescendingOrder)
+            self._placeholder = bool(self._rows)
+        self.endResetModel()
+        self._submit(self._open_cursor, first_page=True)
+
+    def set_search(self, text):
+        """Фильтрует список по имени, фамилии, email и телефону; незавершённый поиск отменяется."""
+        text = " ".join(text.split())
+        if text == self.search:
+            return
+        self.search = text
+        self.reload()
+
+    def synced_at(self):
+        return self.mirror.synced_at("staff") if self.mirror is not None else None
+
+    def sort_state(self):
+        """(столбец сортировки, по убыванию) — чтобы повторить текущий порядок, например в экспорте."""
+        return self._sort_column, self._sort_order == Qt.DescendingOrder
+
+    def handle_notification(self, channel, payload):
+        """Обновляет строки, перечисленные в уведомлении канала USERS_CHANNEL."""
+        if channel != USERS_CHANNEL or not self._opened:
+            return
+        change = json.loads(payload)
+        if change.get("all"):
+            self.reload()
+            return
+        user_ids = change["ids"]
+        if change["op"] == "delete":
+            self._apply_changes(user_ids, [])
+            return
+        generation = self._generation
+        search = self.search
+
+        def fetch(connection):
+            return repository.get_staff_rows(connection, user_ids, role_position_ids("staff", connection), search)
+
+        def apply(rows):
+            # Курсор открыт заново — его снимок уже содержит изменение
+            if generation == self._generation:
+                self._apply_changes(user_ids, rows)
+
+        # Уведомление пришло с основного сервера: реплика могла ещё не получить изменение
+        get_executor().submit(fetch, apply, owner=self.owner, tag="patch_staff_list")
+
+    def release(self):
+        """Закрывает курсор и возвращает соединение в пул; загруженные строки остаются.
+
+        Следующая страница читается новым курсором. Если не успела прийти первая
+        страница, список загружается заново при resume().
+        """
+        if self._request is not None:
+            self._request.cancel()
+            self._request = None
+            if self._placeholder or not self._rows:
+                self._exhausted = True
+                self._reload_on_resume = True
+        self._close_session()
+
+    def resume(self):
+        """Продолжает работу после release(): список без первой страницы загружается заново."""
+        if self._reload_on_resume:
+            self.reload()
+
+    def close(self):
+        """Отменяет подгрузку и возвращает соединение в пул."""
+        for request in (self._request, self._sync_request):
+            if request is not None:
+                request.cancel()
+        self._request = self._sync_request = None
+        self._exhausted = True
+        self._reload_on_resume = False
+        self._close_session()
+
+    def _close_session(self):
+        self._cursor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _open_cursor(self, connection, skip=0):
+        position_ids = role_position_ids("staff", connection)
+        cursor = repository.open_staff_cursor(connection, "staff_list", position_ids, self._sort_column,
+                                              self._sort_order == Qt.DescendingOrder, self.search)
+        self._cursor = cursor
+        if skip:
+            # Уведомления держат загруженную часть в актуальном виде: её длина — позиция в новом снимке
+            cursor.scroll(skip)
+        return self._read_page(cursor, connection)
+
+    def _fetch_page(self, connection):
+        return self._read_page(self._cursor, connection)
+
+    def _read_page(self, cursor, connection):
+        rows = cursor.fetchmany(self.PAGE_SIZE)
+        if len(rows) < self.PAGE_SIZE:
+            # Последняя страница: транзакция не держит снимок (и не мешает VACUUM), пока список открыт
+            cursor.close()
+            connection.rollback()
+        return rows
+
+    def _submit(self, fn, first_page):
+        if self._session is None:
+            self._session = get_executor().session(read_only=True)
+        request = self._session.submit(
+            fn, lambda rows: self._append_page(rows, first_page), self._on_error,
+            owner=self.owner, busy=self.busy, tag="show_staff_list")
+        request.finished.connect(lambda: self._forget(request))
+        self._request = request
+
+    def _forget(self, request):
+        if self._request is request:
+            self._request = None
+
+    def _append_page(self, rows, first_page):
+        self._request = None
+        self._exhausted = len(rows) < self.PAGE_SIZE
+        if self._exhausted:
+            self._close_session()
+        if first_page:
+            self.stale = False
+        if not first_page and self._rows:
+            # Курсор, открытый заново после release(), может повторить строки на границе
+            loaded = {row[self.USER_ID_COLUMN] for row in self._rows}
+            rows = [row for row in rows if row[self.USER_ID_COLUMN] not in loaded]
+        if self._patched:
+            # Снимок курсора старше уведомлений: такие строки берутся из _patched
+            rows = [row for row in rows if row[self.USER_ID_COLUMN] not in self._patched]
+        if self._placeholder:
+            # Данные сервера заменяют показанные из локальной копии
+            self._placeholder = False
+            self.beginResetModel()
+            self._rows = list(rows)
+            self.endResetModel()
+        elif rows:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        for user_id, row in self._patched.items():
+            if row is not None and self._row_index(user_id) is None:
+                self._place_row(user_id, row)
+        if first_page:
+            self.first_page_loaded.emit(len(rows))
+            if not self.search:
+                self._sync_mirror()
+
+    def _apply_changes(self, user_ids, rows):
+        fresh = {row[self.USER_ID_COLUMN]: row for row in rows}
+        for user_id in user_ids:
+            row = fresh.get(user_id)
+            self._patched[user_id] = row
+            if not self._placeholder:
+                self._place_row(user_id, row)
+
+    def _place_row(self, user_id, row):
+        """Ставит row на место по текущей сортировке; None убирает строку user_id."""
+        index = self._row_index(user_id)
+        position = self._insert_position(row) if row is not None else None
+        if index is not None and position in (index, index + 1):
+            self._rows[index] = row
+            self.dataChanged.emit(self.index(index, 0), self.index(index, len(self.HEADERS) - 1))
+            return
+        if index is not None:
+            self.beginRemoveRows(QModelIndex(), index, index)
+            del self._rows[index]
+            self.endRemoveRows()
+            if position is not None and position > index:
+                position -= 1
+        # За пределами загруженной части строка придёт со следующей страницей
+        if position is not None:
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._rows.insert(position, row)
+            self.endInsertRows()
+
+    def _row_index(self, user_id):
+        for index, row in enumerate(self._rows):
+            if row[self.USER_ID_COLUMN] == user_id:
+                return index
+        return None
+
+    def _sort_key(self, row):
+        columns = self.SORT_KEYS[self._sort_column] if 0 <= self._sort_column < len(self.HEADERS) else (1, 0)
+        return tuple((row[column] or "").lower() for column in columns) + (row[self.USER_ID_COLUMN],)
+
+    def _insert_position(self, row):
+        key = self._sort_key(row)
+        descending = self._sort_order == Qt.DescendingOrder
+        for index, existing in enumerate(self._rows):
+            other = self._sort_key(existing)
+            # Как в ORDER BY сервера: user_id в том же направлении, что и столбец
+            if (key > other) if descending else (key < other):
+                return index
+        return len(self._rows) if self._exhausted else None
+
+    def _on_error(self, error):
+        self._request = None
+        self._exhausted = True
+        self._close_session()
+        self.stale = self._placeholder
+        self.load_failed.emit(error)
+
+    def _sync_mirror(self):
+        if self.mirror is None or self._sync_request is not None:
+            return
+
+        def forget(_):
+            self._sync_request = None
+
+        self._sync_request = get_executor().submit(
+            self.mirror.sync_staff, forget, forget, owner=self.owner,
+            timeout=MIRROR_SYNC_TIMEOUT, tag="sync_staff_mirror", read_only=True)
+
+
+class ScheduleTableModel(QAbstractTableModel):
+    """Расписание сотрудника постранично: keyset-пагинация по (work_date, shift_start).
+
+    Открывается на окне вокруг текущей даты; следующая страница заранее
+    подгружается в фоне, предыдущая держится в памяти для мгновенного возврата.
+    С локальной копией (mirror) страницы читаются из неё без обращения к серверу,
+    а сервер только присылает изменения; без связи модель помечается stale.
+    Уведомление об изменении расписания перечитывает только текущую страницу.
+    """
+
+    HEADERS = ("Дата", "Начало смены", "Конец смены")
+    PAGE_SIZE = 30
+    WINDOW_BEFORE_DAYS = 7
+
+    page_changed = Signal()
+    load_failed = Signal(object)
+
+    def __init__(self, user_id, owner=None, busy=None, parent=None, mirror=None):
+        super().__init__(parent)
+        self.user_id = user_id
+        self.owner = owner
+        self.busy = busy
+        self.mirror = mirror
+        self.stale = False
+        self._local = mirror is not None and mirror.has_schedule(user_id)
+        self._rows = []
+        self._previous = None
+        self._previous_has_previous = False
+        self._next = None
+        self._has_previous = False
+        self._request = None
+        self._prefetch = None
+        self._sync_request = None
+        self._advance_when_ready = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return str(self._rows[index.row()][index.column()])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._advance_when_ready is False and (self._prefetch is not None or bool(self._next))
+
+    def date_range(self):
+        if not self._rows:
+            return None
+        return self._rows[0][0], self._rows[-1][0]
+
+    def synced_at(self):
+        if self.mirror is None:
+            return None
+        return self.mirror.synced_at(self.mirror.schedule_state(self.user_id))
+
+    def load_around(self, day=None):
+        """Загружает страницу, начинающуюся за WINDOW_BEFORE_DAYS дней до day (по умолчанию — сегодня)."""
+        start = (day or date.today()) - timedelta(days=self.WINDOW_BEFORE_DAYS)
+        if self.mirror is not None:
+            if self._local:
+                self._show_local(start)
+            self._sync(lambda: self._show_local(start))
+            return
+
+        def fetch(connection):
+            rows = repository.get_schedule(connection, self.user_id, self.PAGE_SIZE, start=start)
+            if not rows:
+                # Впереди смен нет — показываем последнюю страницу истории
+                rows = repository.get_schedule(connection, self.user_id, self.PAGE_SIZE,
+                                               before=(start, time.min))
+            return rows, repository.has_schedule_before(connection, self.user_id, rows)
+
+        def show(result):
+            rows, has_previous = result
+            self._show(rows, previous=None, has_previous=has_previous)
+
+        self._run(fetch, show)
+
+    def handle_notification(self, channel, payload):
+        """Обновляет страницу, если уведомление канала SCHEDULE_CHANNEL касается user_id."""
+        if channel != SCHEDULE_CHANNEL:
+            return
+        change = json.loads(payload)
+        if change.get("all") or self.user_id in change["user_ids"]:
+            self.refresh()
+
+    def refresh(self):
+        """Перечитывает текущую страницу; с локальной копией — после догрузки изменений."""
+        if not self._rows:
+            self.load_around()
+            return
+        first_date = self._rows[0][0]
+        if self.mirror is not None:
+            def show_local():
+                rows = self.mirror.schedule_page(self.user_id, self.PAGE_SIZE, start=first_date)
+                if rows:
+                    self._show(rows, previous=None)
+                else:
+                    self.load_around()
+
+            self._sync(show_local, read_only=False)
+            return
+
+        def fetch(connection):
+            rows = repository.get_schedule(connection, self.user_id, self.PAGE_SIZE, start=first_date)
+            return rows, repository.has_schedule_before(connection, self.user_id, rows)
+
+        def show(result):
+            rows, has_previous = result
+            if rows:
+                self._show(rows, previous=None, has_previous=has_previous)
+            else:
+                self.load_around()
+
+        # Обновление по уведомлению читает основной сервер: реплика могла ещё не получить изменение
+        self._run(fetch, show, read_only=False)
+
+    def next_page(self):
+        if self._prefetch is not None:
+            self._advance_when_ready = True
+            self.page_changed.emit()
+        elif self._next:
+            self._show(self._next, previous=self._rows, has_previous=True)
+
+    def previous_page(self):
+        if self._previous:
+            self._show(self._previous, previous=None, next_rows=self._rows,
+                       has_previous=self._previous_has_previous)
+            return
+        if not self._rows:
+            return
+        first_date, first_start = self._rows[0][0], self._rows[0][1]
+        if self._local:
+            rows = self.mirror.schedule_page(self.user_id, self.PAGE_SIZE, before=(first_date, first_start))
+            if rows:
+                self._show(rows, previous=None, next_rows=self._rows)
+            return
+
+        def fetch(connection):
+            rows = repository.get_schedule(connection, self.user_id, self.PAGE_SIZE,
+                                           before=(first_date, first_start))
+            return rows, repository.has_schedule_before(connection, self.user_id, rows)
+
+        def show(result):
+            rows, has_previous = result
+            if rows:
+                self._show(rows, previous=None, next_rows=self._rows, has_previous=has_previous)
+            else:
+                self._has_previous = False
+                self.page_changed.emit()
+
+        self._run(fetch, show)
+
+    def cancel(self):
+        for request in (self._request, self._prefetch, self._sync_request):
+            if request is not None:
+                request.cancel()
+        self._request = self._prefetch = self._sync_request = None
+
+    def _show(self, rows, previous, next_rows=None, has_previous=None):
+        """Показывает rows. has_previous — есть ли смены раньше (без локальной копии его сообщает запрос)."""
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+            self._prefetch = None
+        self._advance_when_ready = False
+        self.beginResetModel()
+        self._rows = list(rows)
+        self.endResetModel()
+        if previous is not None:
+            # Уходящая страница становится предыдущей вместе со своим признаком
+            self._previous_has_previous = self._has_previous
+        self._previous = previous
+        self._next = next_rows
+        if self._local:
+            first = (self._rows[0][0], self._rows[0][1]) if self._rows else None
+            self._has_previous = first is not None and bool(self.mirror.schedule_page(self.user_id, 1, before=first))
+        elif has_previous is not None:
+            self._has_previous = has_previous
+        if next_rows is None:
+            self._prefetch_next()
+        self.page_changed.emit()
+
+    def _show_local(self, start):
+        rows = self.mirror.schedule_page(self.user_id, self.PAGE_SIZE, start=start)
+        if not rows:
+            rows = self.mirror.schedule_page(self.user_id, self.PAGE_SIZE, before=(start, time.min))
+        self._show(rows, previous=None)
+
+    def _sync(self, on_synced, read_only=True):
+        """Догружает изменения в локальную копию; on_synced перерисовывает экран из неё."""
+        if self._sync_request is not None:
+            self._sync_request.cancel()
+
+        def synced(received):
+            self._sync_request = None
+            self.stale = False
+            if received or not self._local:
+                self._local = True
+                on_synced()
+            else:
+                self.page_changed.emit()
+
+        def failed(error):
+            self._sync_request = None
+            self.stale = True
+            if self._local:
+                self.page_changed.emit()
+            else:
+                self.load_failed.emit(error)
+
+        self._sync_request = get_executor().submit(
+            lambda connection: self.mirror.sync_schedule(connection, self.user_id), synced, failed,
+            owner=self.owner, busy=self.busy, timeout=MIRROR_SYNC_TIMEOUT, tag="sync_schedule",
+            read_only=read_only)
+
+    def _prefetch_next(self):
+        if not self._rows:
+            return
+        last_date, last_start = self._rows[-1][0], self._rows[-1][1]
+        if self._local:
+            self._next = self.mirror.schedule_page(self.user_id, self.PAGE_SIZE, after=(last_date, last_start))
+            return
+
+        def fetch(connection):
+            return repository.get_schedule(connection, self.user_id, self.PAGE_SIZE,
+                                           after=(last_date, last_start))
+
+        def store(rows):
+            self._prefetch = None
+            self._next = rows
+            if self._advance_when_ready:
+                self._advance_when_ready = False
+                if rows:
+                    self._show(rows, previous=self._rows, has_previous=True)
+                    return
+            self.page_changed.emit()
+
+        def forget(_):
+            self._prefetch = None
+            self._advance_when_ready = False
+            self.page_changed.emit()
+
+        self._prefetch = get_executor().submit(fetch, store, forget, owner=self.owner,
+                                               tag="show_schedule_prefetch", read_only=True)
+
+    def _run(self, fn, on_result, read_only=True):
+        if self._request is not None:
+            self._request.cancel()
+
+        def done(result):
+            self._request = None
+            on_result(result)
+
+        def failed(error):
+            self._request = None
+            self.load_failed.emit(error)
+
+        self._request = get_executor().submit(fn, done, failed, owner=self.owner, busy=self.busy,
+                                              tag="show_schedule", read_only=read_only)
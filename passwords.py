@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+HASH_PREFIX = "scrypt"
+# Время проверки пароля, к которому подбирается стоимость на этой машине
+HASH_TARGET_MS = float(os.environ.get("HOTEL_HASH_TARGET_MS", "150"))
+HASH_MIN_N = 2 ** 14
+HASH_MAX_MEMORY = 256 * 1024 * 1024
+HASH_R = 8
+HASH_P = 1
+HASH_SALT_BYTES = 16
+HASH_KEY_BYTES = 32
+# scrypt занимает 128 * r * n байт: ограничиваем число одновременных вычислений
+HASH_CONCURRENCY = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+_params = None
+_params_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_CONCURRENCY)
+
+
+def _scrypt(password, salt, n, r, p):
+    with _slots:
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=_memory(n, r) + 1024 * 1024, dklen=HASH_KEY_BYTES)
+
+
+def _memory(n, r):
+    return 128 * r * n
+
+
+def calibrate(target_ms=HASH_TARGET_MS, max_memory=HASH_MAX_MEMORY):
+    """Подбирает наибольшее n для scrypt, при котором проверка укладывается в target_ms.
+
+    n удваивается от HASH_MIN_N (ниже не опускается), пока следующее удвоение
+    не превысит цель по времени или max_memory по памяти. Возвращает (n, r, p).
+    """
+    n = HASH_MIN_N
+    salt = os.urandom(HASH_SALT_BYTES)
+    while True:
+        started = time.perf_counter()
+        _scrypt("calibration", salt, n, HASH_R, HASH_P)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Время растёт линейно по n
+        if elapsed_ms * 2 > target_ms or _memory(n * 2, HASH_R) > max_memory:
+            return n, HASH_R, HASH_P
+        n *= 2
+
+
+def current_params():
+    """Параметры для новых хэшей; калибруются при первом обращении."""
+    global _params
+    with _params_lock:
+        if _params is None:
+            _params = calibrate()
+        return _params
+
+
+def hash_password(password):
+    """Хэш для хранения в Users.user_password: scrypt$n$r$p$соль$ключ."""
+    n, r, p = current_params()
+    salt = os.urandom(HASH_SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return "$".join((HASH_PREFIX, str(n), str(r), str(p),
+                     base64.b64encode(salt).decode(), base64.b64encode(key).decode()))
+
+
+def is_hashed(stored):
+    return stored is not None and stored.startswith(HASH_PREFIX + "$")
+
+
+def verify_password(password, stored):
+    """Сверяет пароль с хранимым значением; старые строки с открытым паролем тоже принимаются.
+
+    Возвращает (совпал, нужен_перехэш): перехэш нужен для открытого пароля и для
+    хэша, посчитанного с меньшей стоимостью, чем текущая.
+    """
+    if stored is None:
+        return False, False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+    try:
+        _, n, r, p, salt, key = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        salt, key = base64.b64decode(salt), base64.b64decode(key)
+    except ValueError:
+        return False, False
+    if not hmac.compare_digest(_scrypt(password, salt, n, r, p), key):
+        return False, False
+    return True, n < current_params()[0]
@@ -0,0 +1,89 @@
+import threading
+
+REFERENCE_CHANNEL = "reference_changed"
+
+POSITION_ROLES = {
+    "администратор": "admin",
+    "менеджер": "manager",
+    "пользователь": "user",
+    "персонал": "staff",
+}
+
+
+class ReferenceCache:
+    """Кэш справочных таблиц процесса.
+
+    Таблица загружается целиком при первом обращении и сбрасывается по
+    уведомлению NOTIFY (канал REFERENCE_CHANNEL, в payload — имя таблицы).
+    Первая колонка запроса считается ключом.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._data = {}
+        self._generations = {}
+
+    def register(self, name, query):
+        with self._lock:
+            self._queries[name] = query
+            self._generations.setdefault(name, 0)
+
+    def is_loaded(self, name):
+        return name in self._data
+
+    def load(self, name, connection):
+        """Возвращает {ключ: строка}, при необходимости загружая таблицу через connection."""
+        data = self._data.get(name)
+        if data is not None:
+            return data
+        with self._lock:
+            query = self._queries[name]
+            generation = self._generations[name]
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            data = {row[0]: row for row in cursor.fetchall()}
+        with self._lock:
+            # Если таблицу успели сбросить во время чтения, результат не кэшируем
+            if self._generations[name] == generation:
+                self._data[name] = data
+        return data
+
+    def get(self, name, key, default=None):
+        data = self._data.get(name)
+        if data is None:
+            return default
+        return data.get(key, default)
+
+    def rows(self, name):
+        data = self._data.get(name)
+        return list(data.values()) if data is not None else None
+
+    def invalidate(self, name=None):
+        with self._lock:
+            names = list(self._queries) if name is None else [name]
+            for table in names:
+                if table in self._queries:
+                    self._generations[table] += 1
+                    self._data.pop(table, None)
+
+    def handle_notification(self, channel, payload):
+        if channel == REFERENCE_CHANNEL:
+            self.invalidate(payload.lower() or None)
+
+
+reference_cache = ReferenceCache()
+reference_cache.register("position", "SELECT position_id, position_name FROM Position ORDER BY position_id")
+
+
+def role_position_ids(role, connection):
+    """id должностей с ролью role; справочник при необходимости загружается через connection."""
+    return [row[0] for row in reference_cache.load("position", connection).values()
+            if POSITION_ROLES.get(row[1].lower()) == role]
+
+
+def position_role(position_id, position_name=None):
+    """Роль должности по id; пока справочник не загружен, роль определяется по переданному имени."""
+    row = reference_cache.get("position", position_id)
+    name = row[1] if row else position_name
+    return POSITION_ROLES.get((name or "").lower())
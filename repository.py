@@ -0,0 +1,341 @@
+import hmac
+import threading
+import weakref
+from collections import namedtuple
+
+import psycopg2
+
+from passwords import hash_password, verify_password
+
+UserRecord = namedtuple("UserRecord", "user_id first_name last_name email position_id")
+LoginResult = namedtuple("LoginResult", "status user_id first_name last_name email position_id "
+                                        "position_name must_change_password")
+
+# Частые запросы: имя -> (типы параметров, текст). Готовятся на сервере при
+# первом использовании на каждом соединении и дальше выполняются через EXECUTE.
+STATEMENTS = {
+    "login_fetch": ("text, integer", """
+        SELECT user_id, user_password, coalesce(failed_attempts, 0), block = 1,
+               login_date IS NOT NULL AND localtimestamp - login_date > make_interval(days => $2)
+        FROM Users WHERE user_login = $1
+    """),
+    # Счётчик ($3 неудач сразу) и блокировка меняются одним оператором: параллельные попытки не теряются
+    "login_failed": ("integer, integer, integer", """
+        UPDATE Users SET
+            block = CASE WHEN coalesce(failed_attempts, 0) + $3 >= $2 THEN 1 ELSE block END,
+            failed_attempts = CASE WHEN coalesce(failed_attempts, 0) + $3 >= $2 THEN 0
+                                   ELSE coalesce(failed_attempts, 0) + $3 END
+        WHERE user_id = $1
+        RETURNING block = 1
+    """),
+    # Новый хэш ($2) записывается, только если пароль не сменили после чтения ($3)
+    "login_succeeded": ("integer, text, text", """
+        UPDATE Users u SET
+            failed_attempts = 0,
+            login_date = localtimestamp,
+            user_password = CASE WHEN $2 IS NOT NULL AND u.user_password = $3 THEN $2 ELSE u.user_password END
+        WHERE u.user_id = $1 AND u.block IS DISTINCT FROM 1
+        RETURNING u.user_id, u.first_name, u.last_name, u.email, u.position_id,
+                  (SELECT p.position_name FROM Position p WHERE p.position_id = u.position_id)
+    """),
+    "get_user_by_login": ("text", """
+        SELECT user_id, first_name, last_name, email, position_id
+        FROM Users WHERE user_login = $1
+    """),
+    "get_user": ("integer", """
+        SELECT user_id, first_name, last_name, email, position_id
+        FROM Users WHERE user_id = $1
+    """),
+    "get_password": ("integer", """
+        SELECT user_password, coalesce(failed_attempts, 0), block = 1 FROM Users WHERE user_id = $1
+    """),
+    # Верный текущий пароль сбрасывает счётчик неудач, как успешный вход
+    "set_password": ("integer, text", """
+        UPDATE Users SET user_password = $2, failed_attempts = 0
+        WHERE user_id = $1 AND block IS DISTINCT FROM 1
+        RETURNING user_id
+    """),
+    # Тип телефона ($3) выводится из колонки: в некоторых базах Users.phone числовой
+    "insert_user": ("text, text, unknown, text, text, text, integer", """
+        INSERT INTO Users
+            (first_name, last_name, phone, email, user_login, user_password, position_id,
+             created_at, block, failed_attempts)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, localtimestamp, 0, 0)
+    """),
+    # Дублирующее условие по work_date даёт планировщику границу диапазона
+    # в индексе (user_id, work_date); сравнение строк уточняет ключ внутри даты.
+    "schedule_from": ("integer, date, integer", """
+        SELECT work_date, shift_start, shift_end
+        FROM StaffSchedule
+        WHERE user_id = $1 AND work_date >= $2
+        ORDER BY work_date, shift_start
+        LIMIT $3
+    """),
+    "schedule_after": ("integer, date, time, integer", """
+        SELECT work_date, shift_start, shift_end
+        FROM StaffSchedule
+        WHERE user_id = $1 AND work_date >= $2 AND (work_date, shift_start) > ($2, $3)
+        ORDER BY work_date, shift_start
+        LIMIT $4
+    """),
+    "schedule_before": ("integer, date, time, integer", """
+        SELECT work_date, shift_start, shift_end
+        FROM StaffSchedule
+        WHERE user_id = $1 AND work_date <= $2 AND (work_date, shift_start) < ($2, $3)
+        ORDER BY work_date DESC, shift_start DESC
+        LIMIT $4
+    """),
+}
+
+# Порядок для столбца экрана; user_id в конце делает его однозначным. Все столбцы,
+# включая user_id, идут в одном направлении: так порядок совпадает с b-tree индексом
+# (schema.CONCURRENT_INDEXES), прямым или обратным проходом, и курсор не сортирует
+# весь список перед первой страницей.
+STAFF_SORT_COLUMNS = (("u.first_name",), ("u.last_name", "u.first_name"), ("u.email",), ("p.position_name",))
+STAFF_DEFAULT_SORT = 1
+STAFF_POSITION_SORT = 3
+# Последний столбец (user_id) не показывается, по нему модель узнаёт строки из уведомлений
+STAFF_QUERY = """
+    SELECT u.first_name, u.last_name, u.email, p.position_name, u.user_id
+    FROM Users u
+    JOIN Position p ON u.position_id = p.position_id
+    WHERE {where}
+    ORDER BY {order}
+"""
+# Совпадает с выражением триграммного индекса users_search_trgm_idx (schema.CONCURRENT_INDEXES)
+STAFF_SEARCH_EXPRESSION = ("lower(coalesce(u.first_name, '') || ' ' || coalesce(u.last_name, '') || ' ' || "
+                           "coalesce(u.email, '') || ' ' || coalesce(u.phone::text, ''))")
+# Короче триграммы индекс по подстроке не помогает: ищем по началу имени или фамилии
+TRIGRAM_MIN_LENGTH = 3
+
+# Нарушения ограничений при добавлении пользователя: имя ограничения -> (поле, сообщение)
+USER_CONSTRAINT_ERRORS = {
+    "users_phone_key": ("phone", "Телефон уже используется"),
+    "users_login_key": ("user_login", "Логин уже существует"),
+}
+
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def _prepare(cursor, name):
+    with _prepared_lock:
+        prepared = _prepared.setdefault(cursor.connection, set())
+    if name not in prepared:
+        argtypes, sql = STATEMENTS[name]
+        # Подготовленные запросы не откатываются вместе с транзакцией
+        cursor.execute(f"PREPARE {name} ({argtypes}) AS {sql}")
+        prepared.add(name)
+
+
+def _execute(cursor, name, params):
+    """Выполняет подготовленный запрос name, при необходимости подготавливая его."""
+    _prepare(cursor, name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+def prepare(connection, names):
+    """Подготавливает запросы names заранее, не выполняя их (прогрев при запуске)."""
+    with connection.cursor() as cursor:
+        for name in names:
+            _prepare(cursor, name)
+
+
+_dummy_hash = None
+
+
+def _verify_missing(password):
+    """Тратит на неизвестный логин столько же времени, сколько на проверку пароля."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password("")
+    verify_password(password, _dummy_hash)
+
+
+def login(connection, user_login, password, max_attempts, block_days, default_password,
+          pending_failures=None):
+    """Проверка входа: чтение учётной записи, сверка хэша в текущем (фоновом) потоке, запись итога.
+
+    Два запроса вместо одного: хэш нельзя сверить на сервере. Открытый пароль
+    старой записи при успешном входе заменяется хэшем. Рассчитано на autocommit.
+    pending_failures — неудачи, накопленные в throttle.LoginThrottle и ещё не
+    записанные: неверный пароль пишется в БД вместе с ними, только когда вместе
+    со счётчиком в БД они доходят до max_attempts. None — писать каждую неудачу.
+    """
+    with connection.cursor() as cursor:
+        _execute(cursor, "login_fetch", (user_login, block_days))
+        row = cursor.fetchone()
+        if row is None:
+            _verify_missing(password)
+            return LoginResult("invalid", *[None] * 7)
+        user_id, stored, failed_attempts, blocked, inactive = row
+        # Блокировку за неактивность записывает периодическая очистка (user_admin.sweep_inactive)
+        if blocked or inactive:
+            return LoginResult("blocked", *[None] * 7)
+        matched, rehash = verify_password(password, stored)
+        if not matched:
+            return LoginResult(_record_failure(cursor, user_id, failed_attempts, max_attempts, pending_failures),
+                               *[None] * 7)
+        _execute(cursor, "login_succeeded", (user_id, hash_password(password) if rehash else None, stored))
+        row = cursor.fetchone()
+    if row is None:
+        return LoginResult("blocked", *[None] * 7)
+    return LoginResult("ok", *row, hmac.compare_digest(password.encode("utf-8"), default_password.encode("utf-8")))
+
+
+def _record_failure(cursor, user_id, failed_attempts, max_attempts, pending_failures):
+    """Учитывает неверный пароль (см. login); возвращает "blocked", если он привёл к блокировке, иначе "invalid"."""
+    if pending_failures is not None and failed_attempts + pending_failures + 1 < max_attempts:
+        return "invalid"
+    failures = 1 if pending_failures is None else pending_failures + 1
+    _execute(cursor, "login_failed", (user_id, max_attempts, failures))
+    row = cursor.fetchone()
+    return "blocked" if row and row[0] else "invalid"
+
+
+def get_user_by_login(connection, user_login):
+    with connection.cursor() as cursor:
+        _execute(cursor, "get_user_by_login", (user_login,))
+        row = cursor.fetchone()
+    return UserRecord(*row) if row else None
+
+
+def get_user(connection, user_id):
+    with connection.cursor() as cursor:
+        _execute(cursor, "get_user", (user_id,))
+        row = cursor.fetchone()
+    return UserRecord(*row) if row else None
+
+
+def update_password(connection, user_id, current, new, max_attempts, pending_failures=None):
+    """Меняет пароль, если текущий указан верно. Возвращает "ok", "invalid" или "blocked".
+
+    Неверный текущий пароль учитывается так же, как неудачный вход (см. login
+    и pending_failures); заблокированному пользователю пароль не меняется.
+    """
+    with connection.cursor() as cursor:
+        _execute(cursor, "get_password", (user_id,))
+        row = cursor.fetchone()
+        if row is None:
+            _verify_missing(current)
+            return "invalid"
+        stored, failed_attempts, blocked = row
+        if blocked:
+            return "blocked"
+        if not verify_password(current, stored)[0]:
+            status = _record_failure(cursor, user_id, failed_attempts, max_attempts, pending_failures)
+        else:
+            _execute(cursor, "set_password", (user_id, hash_password(new)))
+            status = "ok" if cursor.fetchone() else "blocked"
+    connection.commit()
+    return status
+
+
+def insert_users(connection, users, password):
+    """Добавляет users — кортежи (имя, фамилия, телефон, email, логин, должность) — одной транзакцией.
+
+    Каждая строка вставляется в своей точке сохранения: ошибка откатывает только
+    её. Пароль хэшируется один раз на всю очередь. Возвращает по элементу на
+    строку: None — добавлена, иначе (поле или None, сообщение).
+    """
+    password_hash = hash_password(password)
+    results = []
+    with connection.cursor() as cursor:
+        for first_name, last_name, phone, email, user_login, position_id in users:
+            cursor.execute("SAVEPOINT insert_user")
+            try:
+                _execute(cursor, "insert_user",
+                         (first_name, last_name, phone, email, user_login, password_hash, position_id))
+            except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT insert_user")
+                results.append(USER_CONSTRAINT_ERRORS.get(
+                    e.diag.constraint_name, (None, e.diag.message_primary or str(e).strip())))
+                continue
+            cursor.execute("RELEASE SAVEPOINT insert_user")
+            results.append(None)
+    connection.commit()
+    return results
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def staff_search_conditions(search):
+    """Условия поиска по имени, фамилии, email и телефону: каждое слово должно найтись."""
+    conditions = []
+    params = []
+    for word in search.lower().split():
+        escaped = _like_escape(word)
+        if len(word) < TRIGRAM_MIN_LENGTH:
+            conditions.append("(lower(u.last_name) LIKE %s OR lower(u.first_name) LIKE %s)")
+            params.extend([escaped + "%"] * 2)
+        else:
+            conditions.append(f"{STAFF_SEARCH_EXPRESSION} LIKE %s")
+            params.append(f"%{escaped}%")
+    return conditions, params
+
+
+def staff_order(position_ids, sort_column=-1, descending=False):
+    """ORDER BY списка персонала для столбца sort_column (-1 — фамилия и имя)."""
+    if not 0 <= sort_column < len(STAFF_SORT_COLUMNS):
+        sort_column, descending = STAFF_DEFAULT_SORT, False
+    columns = STAFF_SORT_COLUMNS[sort_column]
+    if sort_column == STAFF_POSITION_SORT and len(position_ids) == 1:
+        # Название одной должности у всех строк одно: порядок задаёт только user_id (первичный ключ)
+        columns = ()
+    direction = "DESC" if descending else "ASC"
+    return ", ".join(f"{column} {direction}" for column in (*columns, "u.user_id"))
+
+
+def staff_query(position_ids, sort_column=-1, descending=False, search=""):
+    """Запрос списка персонала (как на экране) и его параметры."""
+    order = staff_order(position_ids, sort_column, descending)
+    conditions, params = staff_search_conditions(search)
+    conditions.insert(0, "u.position_id = ANY(%s)")
+    params.insert(0, list(position_ids))
+    return STAFF_QUERY.format(where=" AND ".join(conditions), order=order), params
+
+
+def open_staff_cursor(connection, name, position_ids, sort_column=-1, descending=False, search=""):
+    """Открывает именованный курсор по сотрудникам с должностями position_ids; строки забираются fetchmany()."""
+    query, params = staff_query(position_ids, sort_column, descending, search)
+    # Откат закрывает предыдущий курсор и даёт свежий снимок данных
+    connection.rollback()
+    cursor = connection.cursor(name=name)
+    cursor.execute(query, params)
+    return cursor
+
+
+def get_staff_rows(connection, user_ids, position_ids, search=""):
+    """Строки user_ids, проходящие те же фильтры, что и open_staff_cursor (для точечного обновления списка)."""
+    conditions, params = staff_search_conditions(search)
+    conditions[:0] = ["u.user_id = ANY(%s)", "u.position_id = ANY(%s)"]
+    params[:0] = [list(user_ids), list(position_ids)]
+    with connection.cursor() as cursor:
+        cursor.execute(STAFF_QUERY.format(where=" AND ".join(conditions), order=staff_order(position_ids)),
+                       params)
+        return cursor.fetchall()
+
+
+def has_schedule_before(connection, user_id, rows):
+    """Есть ли у user_id смены раньше первой из rows (для кнопки «Раньше»)."""
+    return bool(rows) and bool(get_schedule(connection, user_id, 1, before=(rows[0][0], rows[0][1])))
+
+
+def get_schedule(connection, user_id, limit, start=None, after=None, before=None):
+    """Страница расписания по возрастанию (work_date, shift_start).
+
+    start — с даты включительно; after/before — (дата, начало смены) строго после
+    или до ключа. Для before возвращаются ближайшие к ключу строки.
+    """
+    with connection.cursor() as cursor:
+        if before is not None:
+            _execute(cursor, "schedule_before", (user_id, before[0], before[1], limit))
+            return cursor.fetchall()[::-1]
+        if after is not None:
+            _execute(cursor, "schedule_after", (user_id, after[0], after[1], limit))
+        else:
+            _execute(cursor, "schedule_from", (user_id, start, limit))
+        return cursor.fetchall()
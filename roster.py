@@ -0,0 +1,186 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from refcache import role_position_ids
+
+ROSTER_LOCK_ID = 720053
+ROSTER_PAGE_SIZE = 1000
+WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+# Окончание не позже начала означает ночную смену, заканчивающуюся на следующий день
+ShiftTemplate = namedtuple("ShiftTemplate", "shift_start shift_end weekdays")
+Shift = namedtuple("Shift", "user_id work_date shift_start shift_end")
+RosterConflict = namedtuple("RosterConflict", "shift other existing")
+RosterResult = namedtuple("RosterResult", "employees generated inserted conflicts missing")
+
+TEMPLATE_PATTERN = re.compile(r"^(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})(?:\s+(.+))?$")
+
+
+def parse_template(line):
+    """Разбирает шаблон вида "08:00-20:00 пн-пт" или "20:00-08:00 сб,вс"; без дней — ежедневно.
+
+    Возвращает ShiftTemplate или бросает ValueError с текстом для пользователя.
+    """
+    match = TEMPLATE_PATTERN.match(line.strip())
+    if not match:
+        raise ValueError(f"Неверный шаблон смены: {line.strip()}")
+    try:
+        start, end = (datetime.strptime(value, "%H:%M").time() for value in match.group(1, 2))
+    except ValueError:
+        raise ValueError(f"Неверное время в шаблоне: {line.strip()}")
+    if start == end:
+        raise ValueError(f"Смена нулевой длины: {line.strip()}")
+    days = match.group(3)
+    if not days:
+        return ShiftTemplate(start, end, frozenset(range(7)))
+    weekdays = set()
+    for part in days.lower().replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        if first not in WEEKDAYS or (last and last not in WEEKDAYS):
+            raise ValueError(f"Неизвестный день недели в шаблоне: {line.strip()}")
+        first_index = WEEKDAYS.index(first)
+        last_index = WEEKDAYS.index(last) if last else first_index
+        # "пт-пн" переходит через воскресенье
+        weekdays.update((first_index + offset) % 7 for offset in range((last_index - first_index) % 7 + 1))
+    return ShiftTemplate(start, end, frozenset(weekdays))
+
+
+def generate_shifts(user_ids, templates, start, end, rotate=False):
+    """Смены по шаблонам на каждый день с start по end включительно.
+
+    Без rotate каждый сотрудник получает все шаблоны; с rotate сотрудники
+    распределяются по шаблонам по очереди и каждую неделю сдвигаются на следующий.
+    """
+    shifts = []
+    day = start
+    while day <= end:
+        week = (day - start).days // 7
+        weekday = day.weekday()
+        for index, user_id in enumerate(user_ids):
+            if rotate:
+                assigned = (templates[(index + week) % len(templates)],)
+            else:
+                assigned = templates
+            for template in assigned:
+                if weekday in template.weekdays:
+                    shifts.append(Shift(user_id, day, template.shift_start, template.shift_end))
+        day += timedelta(days=1)
+    return shifts
+
+
+def _interval(shift):
+    begin = datetime.combine(shift.work_date, shift.shift_start)
+    finish = datetime.combine(shift.work_date, shift.shift_end)
+    if finish <= begin:
+        finish += timedelta(days=1)
+    return begin, finish
+
+
+def find_conflicts(shifts, existing=()):
+    """Отбирает из shifts смены, не пересекающиеся друг с другом и с existing.
+
+    Сначала новые смены сверяются с существующими, затем оставшиеся — между
+    собой: смена, столкнувшаяся с новой, которую потом убрала существующая,
+    не теряется. Интервалы сортируются по (сотрудник, начало) и проходятся
+    один раз на каждом шаге. Существующие смены не трогаются.
+    Возвращает (принятые смены, список RosterConflict).
+    """
+    conflicts = []
+    # При равном начале существующая смена идёт первой
+    items = sorted([(shift.user_id, *_interval(shift), 0, shift) for shift in existing] +
+                   [(shift.user_id, *_interval(shift), 1, shift) for shift in shifts],
+                   key=lambda item: (item[0], item[1], item[3]))
+    latest = None
+    open_new = []
+    clashed = set()
+    for item in items:
+        user_id, begin, finish, is_new, shift = item
+        if latest is not None and latest[0] != user_id:
+            latest = None
+        # Новые смены, закончившиеся до этого начала (или другого сотрудника), ни с чем дальше не пересекутся
+        open_new = [other for other in open_new if other[0] == user_id and other[2] > begin]
+        if is_new:
+            if latest is not None and begin < latest[2]:
+                clashed.add(id(shift))
+                conflicts.append(RosterConflict(shift, latest[4], True))
+            else:
+                open_new.append(item)
+            continue
+        # Существующая смена начинается внутри ещё идущих новых
+        for other in open_new:
+            clashed.add(id(other[4]))
+            conflicts.append(RosterConflict(other[4], shift, True))
+        open_new = []
+        if latest is None or finish > latest[2]:
+            latest = item
+
+    kept = set()
+    active = None
+    for item in items:
+        user_id, begin, finish, is_new, shift = item
+        if not is_new or id(shift) in clashed:
+            continue
+        if active is not None and active[0] == user_id and begin < active[2]:
+            conflicts.append(RosterConflict(shift, active[4], False))
+            continue
+        active = item
+        kept.add(id(shift))
+    accepted = [shift for shift in shifts if id(shift) in kept]
+    return accepted, conflicts
+
+
+def generate_roster(connection, templates, start, end, logins=None, rotate=False, dry_run=False):
+    """Составляет график персонала на период и записывает его одной транзакцией.
+
+    Сотрудники — весь персонал или только logins. Пересечения с уже назначенными
+    сменами и между шаблонами отбрасываются и попадают в conflicts; параллельные
+    генерации выполняются по очереди (advisory lock). dry_run только считает.
+    """
+    if not templates:
+        raise ValueError("Не задано ни одного шаблона смены")
+    if end < start:
+        raise ValueError("Дата окончания раньше даты начала")
+    position_ids = role_position_ids("staff", connection)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ROSTER_LOCK_ID,))
+        conditions = ["position_id = ANY(%s)"]
+        params = [position_ids]
+        if logins is not None:
+            conditions.append("user_login = ANY(%s)")
+            params.append(list(logins))
+        cursor.execute(f"SELECT user_id, user_login FROM Users WHERE {' AND '.join(conditions)} ORDER BY user_id",
+                       params)
+        employees = dict(cursor.fetchall())
+        user_ids = list(employees)
+        missing = sorted(set(logins) - set(employees.values())) if logins is not None else []
+
+        # Ночные смены накануне могут заходить в первый день периода
+        cursor.execute("""
+            SELECT user_id, work_date, shift_start, shift_end
+            FROM StaffSchedule
+            WHERE user_id = ANY(%s) AND work_date BETWEEN %s AND %s
+        """, (user_ids, start - timedelta(days=1), end + timedelta(days=1)))
+        existing = [Shift(*row) for row in cursor.fetchall()]
+
+        generated = generate_shifts(user_ids, templates, start, end, rotate)
+        shifts, conflicts = find_conflicts(generated, existing)
+        if dry_run or not shifts:
+            connection.rollback()
+            return RosterResult(employees, len(generated), 0, conflicts, missing)
+        execute_values(cursor, """
+            INSERT INTO StaffSchedule (user_id, work_date, shift_start, shift_end) VALUES %s
+        """, shifts, page_size=ROSTER_PAGE_SIZE)
+    connection.commit()
+    return RosterResult(employees, len(generated), len(shifts), conflicts, missing)
+
+
+def format_conflict(conflict, employees=None):
+    """Строка отчёта о пересечении; employees — {user_id: логин} из RosterResult."""
+    shift, other = conflict.shift, conflict.other
+    kind = "с назначенной сменой" if conflict.existing else "с другим шаблоном"
+    who = (employees or {}).get(shift.user_id, shift.user_id)
+    return (f"{who}: {shift.work_date} {shift.shift_start:%H:%M}-{shift.shift_end:%H:%M} "
+            f"пересекается {kind} {other.work_date} {other.shift_start:%H:%M}-{other.shift_end:%H:%M}")
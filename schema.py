@@ -0,0 +1,363 @@
+import threading
+
+from db import autocommit
+
+SCHEMA_LOCK_ID = 720051
+
+# Миграции применяются по порядку и ровно один раз; версия хранится в app_schema_version.
+MIGRATIONS = [
+    (1, """
+        CREATE OR REPLACE FUNCTION app_login(
+            p_login text,
+            p_password text,
+            p_max_attempts integer,
+            p_block_days integer,
+            p_default_password text
+        )
+        RETURNS TABLE (
+            status text,
+            user_id integer,
+            first_name text,
+            last_name text,
+            email text,
+            position_id integer,
+            position_name text,
+            must_change_password boolean
+        )
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            u Users%ROWTYPE;
+        BEGIN
+            SELECT * INTO u FROM Users WHERE Users.user_login = p_login FOR UPDATE;
+            IF NOT FOUND THEN
+                status := 'invalid';
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            IF u.block = 1 THEN
+                status := 'blocked';
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            IF u.login_date IS NOT NULL
+               AND localtimestamp - u.login_date > make_interval(days => p_block_days) THEN
+                UPDATE Users SET block = 1 WHERE Users.user_id = u.user_id;
+                status := 'blocked';
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            IF u.user_password IS DISTINCT FROM p_password THEN
+                IF coalesce(u.failed_attempts, 0) + 1 >= p_max_attempts THEN
+                    UPDATE Users SET block = 1, failed_attempts = 0 WHERE Users.user_id = u.user_id;
+                    status := 'blocked';
+                ELSE
+                    UPDATE Users SET failed_attempts = coalesce(failed_attempts, 0) + 1
+                    WHERE Users.user_id = u.user_id;
+                    status := 'invalid';
+                END IF;
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            RETURN QUERY
+                UPDATE Users AS x
+                SET failed_attempts = 0, login_date = localtimestamp
+                WHERE x.user_id = u.user_id
+                RETURNING 'ok'::text,
+                          x.user_id::integer,
+                          x.first_name::text,
+                          x.last_name::text,
+                          x.email::text,
+                          x.position_id::integer,
+                          (SELECT p.position_name::text FROM Position p WHERE p.position_id = x.position_id),
+                          x.user_password = p_default_password;
+        END;
+        $$
+    """),
+    (2, """
+        CREATE INDEX IF NOT EXISTS staffschedule_user_id_work_date_idx
+            ON StaffSchedule (user_id, work_date)
+    """),
+    (3, """
+        CREATE OR REPLACE FUNCTION app_notify_reference_change() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('reference_changed', lower(TG_TABLE_NAME));
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS position_reference_changed ON Position;
+        CREATE TRIGGER position_reference_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Position
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_reference_change();
+    """),
+    (4, """
+        CREATE OR REPLACE FUNCTION app_login(
+            p_login text,
+            p_password text,
+            p_max_attempts integer,
+            p_block_days integer,
+            p_default_password text
+        )
+        RETURNS TABLE (
+            status text,
+            user_id integer,
+            first_name text,
+            last_name text,
+            email text,
+            position_id integer,
+            position_name text,
+            must_change_password boolean
+        )
+        LANGUAGE plpgsql AS $$
+        #variable_conflict use_column
+        DECLARE
+            u Users%ROWTYPE;
+        BEGIN
+            SELECT * INTO u FROM Users WHERE Users.user_login = p_login FOR UPDATE;
+            IF NOT FOUND THEN
+                status := 'invalid';
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            IF u.block = 1 THEN
+                status := 'blocked';
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            -- Блокировку за неактивность записывает периодическая очистка
+            -- (user_admin.sweep_inactive); вход только отказывает.
+            IF u.login_date IS NOT NULL
+               AND localtimestamp - u.login_date > make_interval(days => p_block_days) THEN
+                status := 'blocked';
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            IF u.user_password IS DISTINCT FROM p_password THEN
+                IF coalesce(u.failed_attempts, 0) + 1 >= p_max_attempts THEN
+                    UPDATE Users SET block = 1, failed_attempts = 0 WHERE Users.user_id = u.user_id;
+                    status := 'blocked';
+                ELSE
+                    UPDATE Users SET failed_attempts = coalesce(failed_attempts, 0) + 1
+                    WHERE Users.user_id = u.user_id;
+                    status := 'invalid';
+                END IF;
+                RETURN NEXT;
+                RETURN;
+            END IF;
+
+            RETURN QUERY
+                UPDATE Users AS x
+                SET failed_attempts = 0, login_date = localtimestamp
+                WHERE x.user_id = u.user_id
+                RETURNING 'ok'::text,
+                          x.user_id::integer,
+                          x.first_name::text,
+                          x.last_name::text,
+                          x.email::text,
+                          x.position_id::integer,
+                          (SELECT p.position_name::text FROM Position p WHERE p.position_id = x.position_id),
+                          x.user_password = p_default_password;
+        END;
+        $$
+    """),
+    (5, """
+        CREATE INDEX IF NOT EXISTS users_login_date_idx ON Users (login_date)
+    """),
+    # Индексы поиска по Users строятся отдельно, см. CONCURRENT_INDEXES
+    (6, """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    """),
+    # Уведомления об изменённых ключах: по одному на оператор, при большом
+    # числе строк — признак "all" вместо списка (payload ограничен 8000 байт).
+    (7, """
+        CREATE OR REPLACE FUNCTION app_notify_users_change() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            ids integer[];
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                SELECT array_agg(user_id) INTO ids FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT array_agg(user_id) INTO ids FROM old_rows;
+            ELSE
+                -- Вход меняет только служебные поля, о нём не сообщаем
+                SELECT array_agg(n.user_id) INTO ids
+                FROM new_rows n JOIN old_rows o ON o.user_id = n.user_id
+                WHERE (n.first_name, n.last_name, n.email, n.phone, n.position_id)
+                      IS DISTINCT FROM (o.first_name, o.last_name, o.email, o.phone, o.position_id);
+            END IF;
+            IF ids IS NOT NULL THEN
+                PERFORM pg_notify('users_changed', CASE
+                    WHEN cardinality(ids) > 500 THEN json_build_object('op', lower(TG_OP), 'all', true)
+                    ELSE json_build_object('op', lower(TG_OP), 'ids', ids)
+                END::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION app_notify_schedule_change() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            ids integer[];
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                SELECT array_agg(DISTINCT user_id) INTO ids FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT array_agg(DISTINCT user_id) INTO ids FROM old_rows;
+            ELSE
+                SELECT array_agg(DISTINCT user_id) INTO ids
+                FROM (SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows) changed;
+            END IF;
+            IF ids IS NOT NULL THEN
+                PERFORM pg_notify('schedule_changed', CASE
+                    WHEN cardinality(ids) > 500 THEN json_build_object('op', lower(TG_OP), 'all', true)
+                    ELSE json_build_object('op', lower(TG_OP), 'user_ids', ids)
+                END::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS users_changed_insert ON Users;
+        DROP TRIGGER IF EXISTS users_changed_update ON Users;
+        DROP TRIGGER IF EXISTS users_changed_delete ON Users;
+        CREATE TRIGGER users_changed_insert AFTER INSERT ON Users
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_users_change();
+        CREATE TRIGGER users_changed_update AFTER UPDATE ON Users
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_users_change();
+        CREATE TRIGGER users_changed_delete AFTER DELETE ON Users
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_users_change();
+
+        DROP TRIGGER IF EXISTS schedule_changed_insert ON StaffSchedule;
+        DROP TRIGGER IF EXISTS schedule_changed_update ON StaffSchedule;
+        DROP TRIGGER IF EXISTS schedule_changed_delete ON StaffSchedule;
+        CREATE TRIGGER schedule_changed_insert AFTER INSERT ON StaffSchedule
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_schedule_change();
+        CREATE TRIGGER schedule_changed_update AFTER UPDATE ON StaffSchedule
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_schedule_change();
+        CREATE TRIGGER schedule_changed_delete AFTER DELETE ON StaffSchedule
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_notify_schedule_change();
+    """),
+    # Выгрузка расписания за период идёт в порядке индекса, без сортировки всего диапазона
+    (8, """
+        CREATE INDEX IF NOT EXISTS staffschedule_work_date_idx ON StaffSchedule (work_date, shift_start);
+    """),
+    # Журнал аудита: только добавление; event_uuid делает повторную отправку безопасной
+    (9, """
+        CREATE TABLE IF NOT EXISTS audit_log (
+            audit_id bigserial PRIMARY KEY,
+            event_uuid uuid NOT NULL UNIQUE,
+            occurred_at timestamptz NOT NULL,
+            recorded_at timestamptz NOT NULL DEFAULT now(),
+            event_type text NOT NULL,
+            actor_id integer,
+            user_login text,
+            client_host text,
+            details jsonb NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS audit_log_occurred_at_idx ON audit_log (occurred_at);
+        CREATE INDEX IF NOT EXISTS audit_log_user_login_idx ON audit_log (user_login, occurred_at);
+
+        CREATE OR REPLACE FUNCTION app_audit_log_append_only() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            RAISE EXCEPTION 'audit_log допускает только добавление записей';
+        END;
+        $$;
+        DROP TRIGGER IF EXISTS audit_log_append_only ON audit_log;
+        CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log
+            FOR EACH STATEMENT EXECUTE PROCEDURE app_audit_log_append_only();
+    """),
+    # Пароли хранятся хэшами (passwords.py) и сверяются клиентом: серверная проверка
+    # сравнивала бы открытый текст с хэшем и блокировала бы верных пользователей
+    (10, """
+        DROP FUNCTION IF EXISTS app_login(text, text, integer, integer, text);
+    """),
+]
+
+# Индексы больших таблиц: CREATE INDEX CONCURRENTLY вне транзакции миграций, запись
+# в таблицу при построении не блокируется. Строятся после миграций, если их нет или
+# прерванное построение оставило индекс недействительным.
+CONCURRENT_INDEXES = [
+    # Выражение индекса должно совпадать с repository.STAFF_SEARCH_EXPRESSION
+    ("users_search_trgm_idx", """ON Users USING gin (
+        (lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' ||
+               coalesce(email, '') || ' ' || coalesce(phone::text, ''))) gin_trgm_ops
+    )"""),
+    ("users_last_name_prefix_idx", "ON Users (lower(last_name) text_pattern_ops)"),
+    ("users_first_name_prefix_idx", "ON Users (lower(first_name) text_pattern_ops)"),
+    ("users_position_id_idx", "ON Users (position_id)"),
+    # Порядки списка персонала (repository.STAFF_SORT_COLUMNS) с user_id в конце
+    ("users_name_order_idx", "ON Users (last_name, first_name, user_id)"),
+    ("users_first_name_order_idx", "ON Users (first_name, user_id)"),
+    ("users_email_order_idx", "ON Users (email, user_id)"),
+]
+
+_applied = False
+_lock = threading.Lock()
+
+
+def ensure_schema(connection):
+    """Применяет недостающие миграции и строит CONCURRENT_INDEXES. Повторные вызовы в процессе ничего не делают.
+
+    Вызывается командой "main.py admin migrate" (и бенчмарками), не из запросов
+    с таймаутом: миграция может идти долго. Ограничение statement_timeout
+    из настроек сеанса на миграции не действует.
+    """
+    global _applied
+    if _applied:
+        return
+    with _lock:
+        if _applied:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+            cursor.execute("CREATE TABLE IF NOT EXISTS app_schema_version (version integer NOT NULL)")
+            cursor.execute("SELECT coalesce(max(version), 0) FROM app_schema_version")
+            current = cursor.fetchone()[0]
+            for version, sql in MIGRATIONS:
+                if version > current:
+                    cursor.execute(sql)
+                    cursor.execute("INSERT INTO app_schema_version (version) VALUES (%s)", (version,))
+        connection.commit()
+        _build_indexes(connection)
+        _applied = True
+
+
+def _build_indexes(connection):
+    """Строит недостающие CONCURRENT_INDEXES; пока другой клиент держит блокировку схемы, пропускает."""
+    with autocommit(connection), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (SCHEMA_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            return
+        try:
+            cursor.execute("SET statement_timeout = 0")
+            for name, definition in CONCURRENT_INDEXES:
+                cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+                row = cursor.fetchone()
+                if row is not None and row[0]:
+                    continue
+                if row is not None:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cursor.execute(f"CREATE INDEX CONCURRENTLY {name} {definition}")
+        finally:
+            # RESET возвращает statement_timeout из параметров подключения
+            cursor.execute("RESET statement_timeout")
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_ID,))
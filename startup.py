@@ -0,0 +1,180 @@
+import builtins
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_FLAG = "--profile-startup"
+# Модули, нужные только после входа: загружаются в фоне, пока открыт экран входа
+DEFERRED_MODULES = ("models", "local_cache", "bulk_import", "export", "roster")
+# Запросы первого входа: подготавливаются на соединении, которое достанется входу
+PREWARM_STATEMENTS = ("login_fetch", "login_failed", "login_succeeded", "get_user_by_login", "get_user")
+FIRST_PAINT = "экран входа отрисован"
+PREWARM_DONE = "прогрев соединения завершён"
+HASH_READY = "стоимость хэша подобрана"
+IMPORT_PROFILE_MIN_SECONDS = 0.001
+
+_process_started = time.perf_counter()
+startup_logger = logging.getLogger("hotel.startup")
+
+
+class StartupProfile:
+    """Хронология запуска для --profile-startup: импорты, инициализация и фоновый прогрев.
+
+    Пока профиль не включён, stage() и mark() ничего не записывают. Отчёт
+    печатается в stderr, когда достигнуты все ожидаемые вехи (reached()).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._reported = False
+        self._import_depth = threading.local()
+
+    def enable(self, milestones=()):
+        """Включает запись; импорты верхнего уровня замеряются с этого момента."""
+        self.enabled = True
+        self._pending.update(milestones)
+        self._install_import_timer()
+
+    def _install_import_timer(self):
+        original = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            # Вложенные импорты входят во время импорта, который их вызвал
+            if level or getattr(self._import_depth, "value", 0):
+                return original(name, globals, locals, fromlist, level)
+            loaded = name in sys.modules
+            self._import_depth.value = 1
+            started = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._import_depth.value = 0
+                # Уже загруженный модуль интересен, только если разрешение имён заметно по времени
+                if not loaded or time.perf_counter() - started >= IMPORT_PROFILE_MIN_SECONDS:
+                    self._add(f"import {name}", started)
+
+        builtins.__import__ = timed_import
+
+    def _add(self, name, started):
+        if not self.enabled:
+            return
+        finished = time.perf_counter()
+        with self._lock:
+            self.events.append((started - _process_started, finished - started,
+                                threading.current_thread().name, name))
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, started)
+
+    def mark(self, name):
+        self._add(name, time.perf_counter())
+
+    def reached(self, milestone):
+        """Отмечает веху; после последней ожидаемой печатает отчёт."""
+        self.mark(milestone)
+        with self._lock:
+            self._pending.discard(milestone)
+            ready = self.enabled and not self._pending and not self._reported
+            self._reported = self._reported or ready
+        if ready:
+            self.report()
+
+    def watch_first_paint(self, widget, milestone=FIRST_PAINT):
+        """Отмечает milestone при первой отрисовке widget."""
+        if not self.enabled:
+            return
+        from PySide6.QtCore import QEvent, QObject
+
+        profile = self
+
+        class PaintWatcher(QObject):
+            def eventFilter(self, watched, event):
+                if event.type() == QEvent.Paint:
+                    watched.removeEventFilter(self)
+                    profile.reached(milestone)
+                return False
+
+        widget.installEventFilter(PaintWatcher(widget))
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        with self._lock:
+            events = sorted(self.events)
+        print("Хронология запуска (мс от старта процесса):", file=file)
+        print(f"{'начало':>9} {'длит.':>9}  {'поток':<18} этап", file=file)
+        for started, duration, thread, name in events:
+            print(f"{started * 1000:9.1f} {duration * 1000:9.1f}  {thread:<18} {name}", file=file)
+        print(f"Загружено модулей: {len(sys.modules)}", file=file)
+        file.flush()
+
+
+startup_profile = StartupProfile()
+if PROFILE_FLAG in sys.argv:
+    startup_profile.enable((FIRST_PAINT, PREWARM_DONE, HASH_READY))
+
+
+def prewarm(profile=startup_profile):
+    """Готовит первый вход, пока пользователь вводит логин и пароль.
+
+    Открывает соединение пула, загружает справочник должностей и
+    подготавливает запросы входа, затем загружает модули, нужные после входа.
+    Миграции здесь не применяются: у рабочих мест нет прав на DDL, схему
+    обновляет "main.py admin migrate". Шаги независимы: ошибка одного
+    записывается в журнал и не отменяет остальные; о недоступной БД сообщит вход.
+    """
+    try:
+        from db import db_connection, get_pool
+        from instrumentation import tagged
+        from refcache import reference_cache
+        import repository
+
+        with profile.stage("подключение к БД"):
+            get_pool().warm()
+        with tagged("prewarm"), db_connection() as connection:
+            _prewarm_step(profile, connection, "справочник должностей",
+                          lambda: reference_cache.load("position", connection))
+            _prewarm_step(profile, connection, "подготовка запросов входа",
+                          lambda: repository.prepare(connection, PREWARM_STATEMENTS))
+    except Exception as e:
+        startup_logger.warning("Прогрев соединения прерван: %s", e)
+        profile.mark(f"прогрев соединения прерван: {e}")
+    for name in DEFERRED_MODULES:
+        # Через __import__: так импорт попадает в хронологию профиля
+        __import__(name)
+    profile.reached(PREWARM_DONE)
+
+
+def _prewarm_step(profile, connection, name, step):
+    """Выполняет шаг прогрева в своей транзакции; при ошибке откатывает её и пишет в журнал."""
+    try:
+        with profile.stage(name):
+            step()
+            connection.commit()
+    except Exception as e:
+        connection.rollback()
+        startup_logger.warning("Прогрев: шаг \"%s\" не выполнен: %s", name, e)
+        profile.mark(f"{name}: ошибка {e}")
+
+
+def calibrate_hash(profile=startup_profile):
+    from passwords import current_params
+
+    with profile.stage("калибровка хэша"):
+        current_params()
+    profile.reached(HASH_READY)
+
+
+def start_prewarm():
+    """Запускает прогрев в фоновых потоках: соединение и подбор стоимости хэша идут параллельно."""
+    threading.Thread(target=prewarm, name="startup-prewarm", daemon=True).start()
+    threading.Thread(target=calibrate_hash, name="hash-calibration", daemon=True).start()
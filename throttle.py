@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Попытки подряд под одним логином и скорость восстановления (в секунду)
+THROTTLE_LOGIN_BURST = 5
+THROTTLE_LOGIN_RATE = 1 / 30
+# Попытки с терминала в целом: один процесс — одна стойка
+THROTTLE_TERMINAL_BURST = 10
+THROTTLE_TERMINAL_RATE = 1 / 3
+THROTTLE_BACKOFF_BASE = 1
+THROTTLE_BACKOFF_MAX = 300
+# Больше логинов не запоминаем: вытесняются давно не встречавшиеся
+THROTTLE_MAX_LOGINS = 10000
+
+
+class TokenBucket:
+    """До capacity попыток подряд; токены восстанавливаются со скоростью rate в секунду."""
+
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Через сколько секунд появится токен (0 — есть сейчас)."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _LoginState:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.failures = 0
+        self.retry_at = 0
+
+
+class LoginThrottle:
+    """Ограничение частоты попыток входа до обращения к БД.
+
+    Попытка проходит, если есть токен в ведре логина и в общем ведре терминала
+    и истекла пауза после неудач: после n-й неудачи подряд логин ждёт
+    backoff_base * 2^(n-1) секунд, но не больше backoff_max. Неудачи копятся
+    здесь и передаются в repository.login как pending_failures: в БД пишется
+    только переход к блокировке, а не каждый неверный пароль.
+    """
+
+    def __init__(self, login_burst=THROTTLE_LOGIN_BURST, login_rate=THROTTLE_LOGIN_RATE,
+                 terminal_burst=THROTTLE_TERMINAL_BURST, terminal_rate=THROTTLE_TERMINAL_RATE,
+                 backoff_base=THROTTLE_BACKOFF_BASE, backoff_max=THROTTLE_BACKOFF_MAX,
+                 max_logins=THROTTLE_MAX_LOGINS, clock=time.monotonic):
+        self.login_burst = login_burst
+        self.login_rate = login_rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_logins = max_logins
+        self.clock = clock
+        self.terminal = TokenBucket(terminal_burst, terminal_rate, clock())
+        self._logins = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, login, now):
+        state = self._logins.get(login)
+        if state is None:
+            state = self._logins[login] = _LoginState(TokenBucket(self.login_burst, self.login_rate, now))
+            if len(self._logins) > self.max_logins:
+                self._logins.popitem(last=False)
+        else:
+            self._logins.move_to_end(login)
+        return state
+
+    def acquire(self, login):
+        """Занимает попытку входа для login. Возвращает 0 или сколько секунд ждать до следующей."""
+        with self._lock:
+            now = self.clock()
+            state = self._state(login, now)
+            wait = max(state.retry_at - now, state.bucket.wait_time(now), self.terminal.wait_time(now))
+            if wait > 0:
+                return wait
+            state.bucket.take(now)
+            self.terminal.take(now)
+            return 0
+
+    def pending(self, login):
+        """Неудачные попытки login, ещё не записанные в БД."""
+        with self._lock:
+            state = self._logins.get(login)
+            return state.failures if state is not None else 0
+
+    def record(self, login, status):
+        """Учитывает итог repository.login: "invalid" копится здесь, остальное уже записано в БД."""
+        with self._lock:
+            state = self._logins.get(login)
+            if state is None:
+                return
+            if status != "invalid":
+                state.failures = 0
+                state.retry_at = 0
+                return
+            state.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (state.failures - 1))
+            state.retry_at = self.clock() + delay
+
+
+login_throttle = LoginThrottle()
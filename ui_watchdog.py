@@ -0,0 +1,200 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from PySide6.QtCore import QEvent, QTimer
+from PySide6.QtWidgets import QAbstractButton, QApplication
+
+UI_LATENCY_LOG = os.environ.get(
+    "HOTEL_UI_LATENCY_LOG", os.path.join(os.path.expanduser("~"), ".hotel", "ui_latency.log"))
+UI_STALL_THRESHOLD = float(os.environ.get("HOTEL_UI_STALL_MS", "250")) / 1000
+# Период таймера-пульса: на сколько он опаздывает, столько ждёт любое событие интерфейса
+UI_TICK_INTERVAL = 0.02
+UI_SUMMARY_INTERVAL = 60
+UI_LOG_MAX_BYTES = 1024 * 1024
+UI_LOG_BACKUPS = 5
+UI_PERCENTILES = (50, 90, 99)
+# Больше замеров на имя за период сводки не храним: счётчик и максимум считаются дальше
+UI_MAX_SAMPLES = 5000
+EVENT_LOOP = "цикл событий"
+# События, в обработке которых кнопка вызывает подключённые к clicked слоты
+BUTTON_EVENTS = frozenset((QEvent.MouseButtonRelease, QEvent.KeyPress, QEvent.KeyRelease))
+
+ui_logger = logging.getLogger("hotel.ui_latency")
+
+
+def percentile(sorted_values, p):
+    """p-й процентиль (по ближайшему рангу) отсортированного списка."""
+    index = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class _Samples:
+    def __init__(self):
+        self.values = []
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.max = max(self.max, seconds)
+        if len(self.values) < UI_MAX_SAMPLES:
+            self.values.append(seconds)
+
+
+class UiLatency:
+    """Время обработчиков интерфейса и опоздания цикла событий между сводками.
+
+    Пока не включено (enabled), timed() только вызывает обработчик. current —
+    обработчик, выполняющийся в GUI-потоке: его имя попадает в отчёт о зависании.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.current = None
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = _Samples()
+            samples.add(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        if not self.enabled:
+            yield
+            return
+        previous, self.current = self.current, name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current = previous
+            self.record(name, time.perf_counter() - started)
+
+    def summary(self, reset=True):
+        """Строки сводки: число вызовов, процентили и максимум в мс, самые медленные сверху."""
+        with self._lock:
+            samples = self._samples
+            if reset:
+                self._samples = {}
+        lines = []
+        for name, item in sorted(samples.items(), key=lambda pair: -pair[1].max):
+            values = sorted(item.values)
+            parts = " ".join(f"p{p}={percentile(values, p) * 1000:.1f}" for p in UI_PERCENTILES)
+            lines.append(f"{name}: n={item.count} {parts} max={item.max * 1000:.1f} мс")
+        return lines
+
+
+ui_latency = UiLatency()
+
+
+def button_name(button):
+    """Имя обработчика кнопки для журнала: окно и надпись (или objectName)."""
+    label = button.objectName() or button.text().replace("&", "") or type(button).__name__
+    return f"{type(button.window()).__name__}: {label}"
+
+
+class WatchedApplication(QApplication):
+    """QApplication, замеряющий обработку нажатий кнопок: слоты clicked выполняются внутри notify()."""
+
+    def notify(self, receiver, event):
+        if ui_latency.enabled and event.type() in BUTTON_EVENTS and isinstance(receiver, QAbstractButton):
+            with ui_latency.timed(button_name(receiver)):
+                return super().notify(receiver, event)
+        return super().notify(receiver, event)
+
+
+class EventLoopWatchdog:
+    """Следит за циклом событий GUI-потока.
+
+    Таймер с периодом tick отмечает каждый проход цикла; его опоздание —
+    задержка интерфейса. Фоновый поток замечает, что отметки нет дольше
+    threshold, и записывает стек GUI-потока в момент зависания; по окончании
+    записывается полная длительность. Раз в summary_interval секунд в журнал
+    пишутся процентили задержки цикла и времени обработчиков.
+    """
+
+    def __init__(self, latency=ui_latency, threshold=UI_STALL_THRESHOLD, tick=UI_TICK_INTERVAL,
+                 summary_interval=UI_SUMMARY_INTERVAL, logger=ui_logger):
+        self.latency = latency
+        self.threshold = threshold
+        self.tick = tick
+        self.summary_interval = summary_interval
+        self.logger = logger
+        self._main_thread = threading.main_thread().ident
+        self._last_tick = time.monotonic()
+        self._stall_reported = None
+        self._stopped = threading.Event()
+        self._timer = QTimer()
+        self._timer.setInterval(int(tick * 1000))
+        self._timer.timeout.connect(self._on_tick)
+
+    def start(self):
+        self.latency.enabled = True
+        self._last_tick = time.monotonic()
+        self._timer.start()
+        threading.Thread(target=self._watch, name="ui-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        self._timer.stop()
+        self.latency.enabled = False
+        self.write_summary()
+
+    def _on_tick(self):
+        now = time.monotonic()
+        last, self._last_tick = self._last_tick, now
+        self.latency.record(EVENT_LOOP, max(0.0, now - last - self.tick))
+        if self._stall_reported == last:
+            self.logger.warning("Цикл событий снова отвечает: зависание длилось %.0f мс", (now - last) * 1000)
+
+    def _watch(self):
+        next_summary = time.monotonic() + self.summary_interval
+        while not self._stopped.wait(self.tick):
+            now = time.monotonic()
+            last = self._last_tick
+            if now - last >= self.threshold and self._stall_reported != last:
+                self._stall_reported = last
+                self._report_stall(now - last)
+            if now >= next_summary:
+                next_summary = now + self.summary_interval
+                self.write_summary()
+
+    def _report_stall(self, elapsed):
+        frame = sys._current_frames().get(self._main_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(стек недоступен)\n"
+        self.logger.warning("Цикл событий не отвечает %.0f мс, обработчик: %s\n%s",
+                            elapsed * 1000, self.latency.current or "неизвестен", stack.rstrip())
+
+    def write_summary(self):
+        lines = self.latency.summary()
+        if lines:
+            self.logger.info("Сводка задержек интерфейса:\n%s", "\n".join(lines))
+
+
+def start_ui_watchdog(path=UI_LATENCY_LOG):
+    """Включает сторожа цикла событий с журналом в path (с ротацией). Возвращает функцию остановки."""
+    if not path:
+        return lambda: None
+    if not ui_logger.handlers:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=UI_LOG_MAX_BYTES, backupCount=UI_LOG_BACKUPS,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        ui_logger.addHandler(handler)
+        ui_logger.setLevel(logging.INFO)
+        ui_logger.propagate = False
+    watchdog = EventLoopWatchdog()
+    watchdog.start()
+    return watchdog.stop
@@ -0,0 +1,98 @@
+DEFAULT_PASSWORD = "1234"
+SWEEP_LOCK_ID = 720052
+SWEEP_BATCH_SIZE = 500
+
+
+def set_block(connection, block, logins=None, position_id=None, inactive_days=None):
+    """Блокирует или разблокирует пользователей одним UPDATE.
+
+    Критерии объединяются через AND: список логинов, должность, последний вход
+    раньше inactive_days дней назад. Возвращает (найденные логины, число изменённых);
+    строки, уже находящиеся в нужном состоянии, не перезаписываются.
+    """
+    conditions = []
+    params = []
+    if logins is not None:
+        conditions.append("user_login = ANY(%s)")
+        params.append(list(logins))
+    if position_id is not None:
+        conditions.append("position_id = %s")
+        params.append(position_id)
+    if inactive_days is not None:
+        conditions.append("login_date < localtimestamp - make_interval(days => %s)")
+        params.append(inactive_days)
+    if not conditions:
+        raise ValueError("Не задан ни один критерий отбора пользователей")
+
+    if block:
+        assignment = "block = 1"
+        changed = "u.block IS DISTINCT FROM 1"
+    else:
+        assignment = "block = 0, failed_attempts = 0"
+        changed = "(u.block IS DISTINCT FROM 0 OR coalesce(u.failed_attempts, 0) <> 0)"
+    query = f"""
+        WITH target AS (
+            SELECT user_id, user_login FROM Users WHERE {" AND ".join(conditions)}
+        ), changed AS (
+            UPDATE Users u SET {assignment}
+            FROM target t
+            WHERE u.user_id = t.user_id AND {changed}
+            RETURNING u.user_id
+        )
+        SELECT t.user_login, (SELECT count(*) FROM changed) FROM target t
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    connection.commit()
+    return [row[0] for row in rows], rows[0][1] if rows else 0
+
+
+def reset_passwords(connection, logins, password_hash):
+    """Заменяет пароль пользователей logins на password_hash одним UPDATE и сбрасывает счётчик ошибок.
+
+    password_hash — хэш DEFAULT_PASSWORD, посчитанный один раз на весь список:
+    при следующем входе пароль потребуется сменить. Блокировка не снимается.
+    Возвращает найденные логины.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE Users SET user_password = %s, failed_attempts = 0
+            WHERE user_login = ANY(%s)
+            RETURNING user_login
+        """, (password_hash, list(logins)))
+        found = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    return found
+
+
+def sweep_inactive(connection, days, batch_size=SWEEP_BATCH_SIZE):
+    """Блокирует пользователей, не входивших больше days дней, пачками по batch_size.
+
+    Каждая пачка — отдельная короткая транзакция, строки, занятые входом,
+    пропускаются до следующего прохода. Если очистку уже выполняет другой
+    клиент, возвращает None, иначе — число заблокированных.
+    """
+    total = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (SWEEP_LOCK_ID,))
+            if not cursor.fetchone()[0]:
+                connection.rollback()
+                return None if total == 0 else total
+            cursor.execute("""
+                UPDATE Users SET block = 1
+                WHERE user_id IN (
+                    SELECT user_id FROM Users
+                    WHERE block IS DISTINCT FROM 1
+                      AND login_date < localtimestamp - make_interval(days => %s)
+                    ORDER BY user_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, (days, batch_size))
+            updated = cursor.rowcount
+            connection.commit()
+            total += updated
+            if updated < batch_size:
+                return total
@@ -0,0 +1,333 @@
+import threading
+import time
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Qt, Signal, Slot
+from PySide6.QtWidgets import QProgressBar
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+from db import POOL_MAX_SIZE, acquire, db_connection, replica_failed
+from instrumentation import tagged
+from ui_watchdog import ui_latency
+
+DB_TASK_TIMEOUT = 15
+# Чаще интерфейсу не нужно: остальные сообщения о ходе работы пропускаются
+PROGRESS_INTERVAL = 0.1
+
+
+class DbTaskTimeout(Exception):
+    """Запрос к БД не уложился в отведённое время."""
+
+
+class DbTaskCancelled(Exception):
+    """Запрос отменён или прерван по времени, пока выполнялась его функция."""
+
+
+_current = threading.local()
+
+
+def report_progress(done, total=0):
+    """Сообщает ход текущего фонового запроса; вызывается из fn в рабочем потоке.
+
+    Если запрос уже отменён, бросает DbTaskCancelled: долгие задачи, работающие
+    между запросами к БД, так узнают об отмене.
+    """
+    runnable = getattr(_current, "runnable", None)
+    if runnable is None:
+        return
+    if not runnable.request.is_active():
+        raise DbTaskCancelled()
+    now = time.monotonic()
+    if now - runnable.progress_at < PROGRESS_INTERVAL and done != total:
+        return
+    runnable.progress_at = now
+    runnable.executor._task_progress.emit(runnable.request, done, total)
+
+
+class DbRequest(QObject):
+    """Запрос к БД, выполняемый в фоне; результат приходит сигналами в GUI-потоке."""
+
+    succeeded = Signal(object)
+    failed = Signal(object)
+    finished = Signal()
+    progress = Signal(int, int)
+
+    def __init__(self, fn, tag, owner=None, session=None, read_only=False):
+        super().__init__()
+        self.fn = fn
+        self.tag = tag
+        self.owner = owner
+        self.session = session
+        self.read_only = read_only
+        self.state = "pending"
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def is_active(self):
+        return self.state in ("pending", "running")
+
+    def cancel(self):
+        """Отменяет запрос: выполняющийся SQL прерывается, результат не доставляется."""
+        self._stop("cancelled", None)
+
+    def _stop(self, state, error):
+        with self._lock:
+            if not self.is_active():
+                return
+            self.state = state
+            if self._connection is not None:
+                try:
+                    self._connection.cancel()
+                except Exception:
+                    pass
+        if error is not None:
+            self.failed.emit(error)
+        self.finished.emit()
+
+    def _attach(self, connection):
+        with self._lock:
+            if not self.is_active():
+                return False
+            self.state = "running"
+            self._connection = connection
+            return True
+
+    def _detach(self):
+        with self._lock:
+            self._connection = None
+
+
+class DbSession:
+    """Соединение, закреплённое за одним потребителем на время его жизни.
+
+    Нужно для состояния, живущего между запросами (именованные курсоры):
+    задачи сессии выполняются по очереди на одном и том же соединении.
+    read_only — соединение берётся с реплики, если она есть.
+    """
+
+    def __init__(self, executor, read_only=False):
+        self.executor = executor
+        self.read_only = read_only
+        self.pool = None
+        self.connection = None
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn, on_result=None, on_error=None, owner=None, busy=None,
+               timeout=DB_TASK_TIMEOUT, tag=None):
+        return self.executor.submit(fn, on_result, on_error, owner=owner, busy=busy,
+                                    timeout=timeout, tag=tag, session=self)
+
+    def close(self, cleanup=None):
+        """Освобождает соединение в фоне; cleanup(connection) вызывается перед возвратом в пул."""
+        if self.closed:
+            return
+        self.closed = True
+        self.executor._threads.start(_SessionRelease(self, cleanup))
+
+    def _run(self, request):
+        with self._lock:
+            if self.closed:
+                raise PoolError("Сессия БД закрыта")
+            if self.connection is not None and self.connection.closed:
+                # Соединение оборвалось: реплика исключается, следующая задача получит новое
+                replica_failed(self.pool)
+                self.pool.putconn(self.connection)
+                self.connection = None
+            if self.connection is None:
+                self.pool, self.connection = acquire(self.read_only)
+            return _call(request, self.connection)
+
+
+class _Skipped(Exception):
+    pass
+
+
+def _call(request, connection):
+    if not request._attach(connection):
+        raise _Skipped()
+    try:
+        return request.fn(connection)
+    finally:
+        request._detach()
+
+
+class _DbRunnable(QRunnable):
+    def __init__(self, request, executor):
+        super().__init__()
+        self.request = request
+        self.executor = executor
+        self.progress_at = 0.0
+
+    def run(self):
+        request = self.request
+        if not request.is_active():
+            return
+        _current.runnable = self
+        try:
+            with tagged(request.tag):
+                if request.session is not None:
+                    result = request.session._run(request)
+                else:
+                    result = self._run_pooled(request)
+        except _Skipped:
+            return
+        except Exception as e:
+            self.executor._task_failed.emit(request, e)
+        else:
+            self.executor._task_succeeded.emit(request, result)
+        finally:
+            _current.runnable = None
+
+    def _run_pooled(self, request):
+        pool, connection = acquire(request.read_only)
+        try:
+            return _call(request, connection)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Обрыв соединения с репликой (не отмена запроса): один повтор на основном сервере
+            if not (connection.closed and request.is_active() and replica_failed(pool)):
+                raise
+        finally:
+            pool.putconn(connection)
+        with db_connection() as connection:
+            return _call(request, connection)
+
+
+class _SessionRelease(QRunnable):
+    def __init__(self, session, cleanup):
+        super().__init__()
+        self.session = session
+        self.cleanup = cleanup
+
+    def run(self):
+        session = self.session
+        with session._lock:
+            connection, session.connection = session.connection, None
+            if connection is None:
+                return
+            if self.cleanup is not None:
+                try:
+                    self.cleanup(connection)
+                except Exception:
+                    pass
+            session.pool.putconn(connection)
+
+
+class DbExecutor(QObject):
+    """Очередь фоновых запросов к БД поверх QThreadPool."""
+
+    _task_succeeded = Signal(object, object)
+    _task_failed = Signal(object, object)
+    _task_progress = Signal(object, int, int)
+
+    def __init__(self, max_threads=POOL_MAX_SIZE):
+        super().__init__()
+        self._threads = QThreadPool()
+        self._threads.setMaxThreadCount(max_threads)
+        self._active = set()
+        self._task_succeeded.connect(self._on_succeeded, Qt.QueuedConnection)
+        self._task_failed.connect(self._on_failed, Qt.QueuedConnection)
+        self._task_progress.connect(self._on_progress, Qt.QueuedConnection)
+
+    def submit(self, fn, on_result=None, on_error=None, owner=None, busy=None,
+               timeout=DB_TASK_TIMEOUT, tag=None, session=None, on_progress=None, read_only=False):
+        """Выполняет fn(connection) в фоновом потоке.
+
+        on_result/on_error вызываются в GUI-потоке; по истечении timeout секунд
+        запрос прерывается и в on_error передаётся DbTaskTimeout. on_progress(done, total)
+        получает то, что fn сообщает через report_progress(). read_only — fn только
+        читает и может выполняться на реплике (данные могут отставать на секунды).
+        """
+        request = DbRequest(fn, tag or getattr(fn, "__name__", "db_task"), owner, session, read_only)
+        if on_result is not None:
+            request.succeeded.connect(on_result)
+        if on_error is not None:
+            request.failed.connect(on_error)
+        if on_progress is not None:
+            request.progress.connect(on_progress)
+        if busy is not None:
+            busy.track(request)
+        request.finished.connect(lambda: self._active.discard(request))
+        if timeout:
+            timer = QTimer(request)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda: request._stop(
+                "timeout", DbTaskTimeout(f"Превышено время ожидания ответа БД ({timeout} с)")))
+            request.finished.connect(timer.stop)
+            timer.start(int(timeout * 1000))
+        self._active.add(request)
+        self._threads.start(_DbRunnable(request, self))
+        return request
+
+    def session(self, read_only=False):
+        return DbSession(self, read_only)
+
+    def cancel_owner(self, owner):
+        """Отменяет все незавершённые запросы, принадлежащие owner."""
+        for request in [r for r in self._active if r.owner is owner]:
+            request.cancel()
+
+    def wait_for_done(self, msecs=-1):
+        return self._threads.waitForDone(msecs)
+
+    @Slot(object, object)
+    def _on_succeeded(self, request, result):
+        if request.is_active():
+            request.state = "done"
+            # Обработчики результата выполняются в GUI-потоке: их время видно в сводке задержек
+            with ui_latency.timed(request.tag):
+                request.succeeded.emit(result)
+            request.finished.emit()
+
+    @Slot(object, int, int)
+    def _on_progress(self, request, done, total):
+        if request.is_active():
+            request.progress.emit(done, total)
+
+    @Slot(object, object)
+    def _on_failed(self, request, error):
+        if request.is_active():
+            request.state = "failed"
+            with ui_latency.timed(request.tag):
+                request.failed.emit(error)
+            request.finished.emit()
+
+
+class BusyIndicator(QProgressBar):
+    """Индикатор занятости: виден, пока у окна есть незавершённые запросы."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setRange(0, 0)
+        self.setTextVisible(False)
+        self.setFixedHeight(6)
+        self._pending = 0
+        self.hide()
+
+    def track(self, request):
+        self._pending += 1
+        self.show()
+        request.finished.connect(self._release)
+
+    def _release(self):
+        self._pending = max(0, self._pending - 1)
+        if not self._pending:
+            self.hide()
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = DbExecutor()
+    return _executor
+
+
+def run_db(owner, fn, on_result=None, on_error=None, busy=None, timeout=DB_TASK_TIMEOUT, tag=None,
+           read_only=False):
+    """Короткая запись для get_executor().submit(...) с привязкой к окну-владельцу."""
+    return get_executor().submit(fn, on_result, on_error, owner=owner, busy=busy,
+                                 timeout=timeout, tag=tag, read_only=read_only)